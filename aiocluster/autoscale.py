@@ -0,0 +1,211 @@
+"""
+Grow and shrink the worker pool of a coordinator based on load signals.
+
+An Autoscaler periodically asks its policies for the current load expressed
+as a ratio of the policy's target;  1.0 means the pool is sized just right,
+2.0 means twice as many workers are needed and 0.5 means half of them would
+do.  The most demanding policy wins.
+"""
+
+import asyncio
+import logging
+import math
+import time
+
+logger = logging.getLogger('autoscale')
+
+
+class Policy(object):
+    """ Base type for autoscale policies. """
+
+    async def measure(self, coordinator):
+        """ Return the load ratio or None if there is no data. """
+        raise NotImplementedError("Required subclass impl")
+
+
+class CPUPolicy(Policy):
+    """ Average CPU percent of ready workers vs a `target` percent. """
+
+    def __init__(self, target=60):
+        self.target = target
+        self._samples = {}
+
+    async def measure(self, coordinator):
+        now = time.monotonic()
+        samples = {}
+        usage = []
+        for wp in coordinator.workers.values():
+            if wp.state != 'ready' or wp.util is None:
+                continue
+            try:
+                times = wp.util.cpu_times()
+            except Exception:
+                continue
+            cpu = times.user + times.system
+            samples[wp.ident] = cpu, now
+            prev = self._samples.get(wp.ident)
+            if prev is not None and now > prev[1]:
+                usage.append((cpu - prev[0]) / (now - prev[1]) * 100)
+        self._samples = samples
+        if not usage:
+            return None
+        return (sum(usage) / len(usage)) / self.target
+
+
+class LoopLagPolicy(Policy):
+    """ Average event loop lag reported by workers vs a `target` lag in
+    seconds. """
+
+    def __init__(self, target=0.050, timeout=1):
+        self.target = target
+        self.timeout = timeout
+
+    async def measure(self, coordinator):
+        workers = [x for x in coordinator.workers.values()
+                   if x.state == 'ready']
+        results = await coordinator.broadcast('loop_lag', workers=workers,
+                                              timeout=self.timeout)
+        lags = [x['lag'] for x in results['results'].values()]
+        if not lags:
+            return None
+        return (sum(lags) / len(lags)) / self.target
+
+
+class QueueDepthPolicy(Policy):
+    """ User supplied queue depth vs a `target` depth per worker.  The
+    `depth` callable may be a regular function or a coroutine function. """
+
+    def __init__(self, depth, target=10):
+        self.depth = depth
+        self.target = target
+
+    async def measure(self, coordinator):
+        depth = self.depth()
+        if asyncio.iscoroutine(depth):
+            depth = await depth
+        if depth is None:
+            return None
+        return depth / (self.target * max(coordinator.worker_count, 1))
+
+
+class Autoscaler(object):
+    """ Resize a coordinator's worker pool between `min_workers` and
+    `max_workers`.  Load must leave the 1.0 +/- `hysteresis` band before
+    anything is done and each direction has a cooldown period that starts
+    after any scaling event.  At most `max_step` workers are added or
+    removed at once.  Scaling down uses the coordinator's drain protocol. """
+
+    def __init__(self, policies, min_workers=1, max_workers=None,
+                 interval=10, hysteresis=0.2, up_cooldown=30,
+                 down_cooldown=120, max_step=None, loop=None):
+        if isinstance(policies, Policy):
+            policies = [policies]
+        if not policies:
+            raise ValueError('At least one policy is required')
+        if max_workers is not None and max_workers < min_workers:
+            raise ValueError('max_workers must be >= min_workers')
+        self.policies = policies
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.interval = interval
+        self.hysteresis = hysteresis
+        self.up_cooldown = up_cooldown
+        self.down_cooldown = down_cooldown
+        self.max_step = max_step
+        self._loop = loop
+        self._coordinator = None
+        self._task = None
+        self._last_scale = None
+        self.stats = {
+            "load": None,
+            "desired": None,
+            "scale_ups": 0,
+            "scale_downs": 0,
+            "last_scale": None,
+            "errors": 0,
+        }
+
+    def clock(self):
+        return time.monotonic()
+
+    def start(self, coordinator):
+        self._coordinator = coordinator
+        coordinator.stats['autoscale'] = self.stats
+        if self._loop is None:
+            self._loop = coordinator._loop
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval, loop=self._loop)
+            try:
+                await self.evaluate()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.stats['errors'] += 1
+                logger.exception("Autoscale evaluation error")
+
+    async def measure(self):
+        """ Return the highest load ratio from our policies. """
+        loads = []
+        for x in self.policies:
+            load = await x.measure(self._coordinator)
+            if load is not None:
+                loads.append(load)
+        return max(loads) if loads else None
+
+    def desired_count(self, current, load, now):
+        """ Return the worker count to run based on `load`. """
+        elapsed = None if self._last_scale is None else now - self._last_scale
+        desired = current
+        if load > 1 + self.hysteresis:
+            if elapsed is None or elapsed >= self.up_cooldown:
+                desired = math.ceil(current * load)
+        elif load < 1 - self.hysteresis:
+            if elapsed is None or elapsed >= self.down_cooldown:
+                desired = math.ceil(current * load)
+        if self.max_step is not None:
+            desired = max(min(desired, current + self.max_step),
+                          current - self.max_step)
+        if self.max_workers is not None:
+            desired = min(desired, self.max_workers)
+        return max(desired, self.min_workers)
+
+    async def evaluate(self):
+        """ Measure load and resize the pool if needed. """
+        coord = self._coordinator
+        if coord._stopping:
+            return
+        if coord.restart_status and not coord.restart_status['finished']:
+            logger.debug("Skipping autoscale during rolling restart")
+            return
+        load = await self.measure()
+        self.stats['load'] = load
+        if load is None:
+            return
+        current = coord.worker_count
+        now = self.clock()
+        desired = self.desired_count(current, load, now)
+        self.stats['desired'] = desired
+        if desired == current:
+            return
+        logger.warning("Autoscaling workers %d -> %d (load: %.2f)" % (
+                       current, desired, load))
+        self._last_scale = now
+        self.stats['last_scale'] = time.time()
+        if desired > current:
+            self.stats['scale_ups'] += 1
+        else:
+            self.stats['scale_downs'] += 1
+        await coord.scale_workers(desired)
@@ -0,0 +1,84 @@
+"""
+Load balancing policies for calls to named services.
+
+A policy picks one endpoint from the list of workers providing a service.
+Endpoints have an `ident` and an `inflight` count of calls this worker is
+waiting on.
+"""
+
+import bisect
+import hashlib
+import itertools
+
+
+class Policy(object):
+    """ Base type for load balancing policies. """
+
+    def choose(self, endpoints, key=None):
+        raise NotImplementedError("Required subclass impl")
+
+
+class RoundRobin(Policy):
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, endpoints, key=None):
+        return endpoints[next(self._counter) % len(endpoints)]
+
+
+class LeastOutstanding(Policy):
+    """ Pick the endpoint with the fewest calls in flight from this worker;
+    Ties go round-robin so idle endpoints share the load. """
+
+    def __init__(self):
+        self._counter = itertools.count()
+
+    def choose(self, endpoints, key=None):
+        low = min(x.inflight for x in endpoints)
+        idle = [x for x in endpoints if x.inflight == low]
+        return idle[next(self._counter) % len(idle)]
+
+
+class ConsistentHash(Policy):
+    """ Map a call `key` to an endpoint on a hash ring so the same key keeps
+    going to the same worker and only about 1/N of the keys move when a
+    worker comes or goes. """
+
+    replicas = 100
+
+    def __init__(self, replicas=None):
+        if replicas is not None:
+            self.replicas = replicas
+        self._ring = None
+        self._ring_idents = None
+
+    def hash(self, value):
+        digest = hashlib.md5(str(value).encode()).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def build_ring(self, idents):
+        ring = sorted((self.hash('%s-%d' % (ident, i)), ident)
+                      for ident in idents for i in range(self.replicas))
+        self._ring = [x[0] for x in ring], [x[1] for x in ring]
+        self._ring_idents = idents
+
+    def choose(self, endpoints, key=None):
+        if key is None:
+            raise ValueError('ConsistentHash requires a key')
+        idents = frozenset(x.ident for x in endpoints)
+        if idents != self._ring_idents:
+            self.build_ring(idents)
+        hashes, owners = self._ring
+        offt = bisect.bisect(hashes, self.hash(key)) % len(hashes)
+        owner = owners[offt]
+        for x in endpoints:
+            if x.ident == owner:
+                return x
+
+
+policies = {
+    "round_robin": RoundRobin,
+    "least_outstanding": LeastOutstanding,
+    "consistent_hash": ConsistentHash,
+}
@@ -0,0 +1,640 @@
+"""
+Cluster message bus.
+
+The coordinator runs a Broker that holds named work queues.  Workers reach
+it through the `bus` plugin over a multiplexed rpc.Channel in the cluster's
+IPC directory.
+
+Queues have competing consumers;  each message is handed to one consumer
+and stays unacknowledged until that consumer acks it.  When a worker exits
+its unacknowledged messages are put back at the front of their queue for
+redelivery.  Queues are bounded and push waits for room when one is full,
+so producers slow down to match consumers.
+
+Topics are published with nanomsg.  Workers PUSH messages to the
+coordinator, which forwards each one once to a PUB socket;  nanomsg does
+the fan-out to every subscribed worker.  A topic is any string and
+subscriptions match by prefix.  Each subscription has its own bounded
+buffer;  when a consumer falls behind the oldest messages are dropped and
+counted.
+
+Services are named sets of calls a worker offers to the rest of the cluster.
+The coordinator only keeps the registry;  callers look providers up and then
+call them directly on their worker RPC channel, picking one with a load
+balancing policy from aiocluster.balance.
+"""
+
+import aionanomsg
+import asyncio
+import collections
+import inspect
+import itertools
+import logging
+import time
+from . import balance, codec, rpc
+
+logger = logging.getLogger('bus')
+
+
+class Message(object):
+    """ A message handed to a consumer.  `deliveries` counts how many times
+    it has been handed out, including this time. """
+
+    __slots__ = ('id', 'data', 'deliveries')
+
+    def __init__(self, id, data, deliveries=1):
+        self.id = id
+        self.data = data
+        self.deliveries = deliveries
+
+    def __repr__(self):
+        return '<Message id:%d deliveries:%d>' % (self.id, self.deliveries)
+
+
+def _wakeup_next(waiters):
+    while waiters:
+        waiter = waiters.popleft()
+        if not waiter.done():
+            waiter.set_result(None)
+            break
+
+
+class Queue(object):
+    """ Broker side state for one named queue. """
+
+    def __init__(self, name, maxsize, loop):
+        self.name = name
+        self.maxsize = maxsize
+        self._loop = loop
+        self._ids = itertools.count()
+        self._items = collections.deque()
+        self._unacked = {}
+        self._getters = collections.deque()
+        self._putters = collections.deque()
+        self.stats = {
+            "pushed": 0,
+            "delivered": 0,
+            "acked": 0,
+            "redelivered": 0,
+            "push_waits": 0,
+        }
+
+    def __len__(self):
+        return len(self._items)
+
+    def full(self):
+        return self.maxsize and len(self._items) >= self.maxsize
+
+    async def _wait(self, waiters, deadline=None):
+        """ Wait to be woken;  Returns False if the deadline passed. """
+        waiter = asyncio.Future(loop=self._loop)
+        waiters.append(waiter)
+        timeout = None if deadline is None else \
+            max(deadline - self._loop.time(), 0)
+        try:
+            await asyncio.wait_for(waiter, timeout, loop=self._loop)
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # Pass a wakeup we may have consumed on to the next in line.
+            if waiter.done() and not waiter.cancelled():
+                _wakeup_next(waiters)
+            raise
+        finally:
+            try:
+                waiters.remove(waiter)
+            except ValueError:
+                pass
+        return True
+
+    async def push(self, items, timeout=None):
+        """ Add items, waiting for room if the queue is full.  Returns the
+        number of items added before `timeout`. """
+        deadline = None if timeout is None else self._loop.time() + timeout
+        count = 0
+        for data in items:
+            while self.full():
+                self.stats['push_waits'] += 1
+                if not await self._wait(self._putters, deadline):
+                    return count
+            self._items.append(Message(next(self._ids), data, 0))
+            self.stats['pushed'] += 1
+            count += 1
+            _wakeup_next(self._getters)
+        return count
+
+    async def pull(self, consumer, max_items=1, timeout=None):
+        """ Take up to `max_items` messages for `consumer`, waiting up to
+        `timeout` seconds for the first one. """
+        deadline = None if timeout is None else self._loop.time() + timeout
+        while not self._items:
+            if not await self._wait(self._getters, deadline):
+                return []
+        batch = []
+        while self._items and len(batch) < max_items:
+            msg = self._items.popleft()
+            msg.deliveries += 1
+            self._unacked[msg.id] = consumer, msg
+            batch.append(msg)
+            _wakeup_next(self._putters)
+        self.stats['delivered'] += len(batch)
+        if self._items:
+            _wakeup_next(self._getters)
+        return batch
+
+    def ack(self, consumer, ids):
+        count = 0
+        for x in ids:
+            entry = self._unacked.get(x)
+            if entry is not None and entry[0] == consumer:
+                del self._unacked[x]
+                count += 1
+        self.stats['acked'] += count
+        return count
+
+    def release(self, consumer):
+        """ Requeue every message held by `consumer`. """
+        held = sorted((msg for owner, msg in self._unacked.values()
+                       if owner == consumer), key=lambda x: x.id,
+                      reverse=True)
+        for msg in held:
+            del self._unacked[msg.id]
+            self._items.appendleft(msg)
+            _wakeup_next(self._getters)
+        self.stats['redelivered'] += len(held)
+        return len(held)
+
+    def get_stats(self):
+        return dict(self.stats, depth=len(self._items),
+                    unacked=len(self._unacked), maxsize=self.maxsize,
+                    waiting_consumers=len(self._getters),
+                    waiting_producers=len(self._putters))
+
+
+class Broker(object):
+    """ Coordinator side of the bus.  Queues are created on first use with
+    `queue_maxsize` unless declared beforehand. """
+
+    queue_maxsize = 10000
+
+    def __init__(self, queue_maxsize=None, loop=None):
+        if queue_maxsize is not None:
+            self.queue_maxsize = queue_maxsize
+        self._loop = loop
+        self.queues = {}
+        self.services = collections.defaultdict(dict)
+        self.calls = {
+            "queue_declare": self.declare,
+            "queue_push": self.push,
+            "queue_pull": self.pull,
+            "queue_ack": self.ack,
+            "service_register": self.register_service,
+            "service_unregister": self.unregister_service,
+            "service_lookup": self.lookup_service,
+        }
+
+    def get_queue(self, name):
+        try:
+            return self.queues[name]
+        except KeyError:
+            q = self.queues[name] = Queue(name, self.queue_maxsize,
+                                          self._loop)
+            return q
+
+    async def declare(self, name, maxsize=None):
+        """ Create a queue or resize an existing one. """
+        q = self.get_queue(name)
+        if maxsize is not None:
+            q.maxsize = maxsize
+        return q.maxsize
+
+    async def push(self, name, items, timeout=None):
+        return await self.get_queue(name).push(items, timeout=timeout)
+
+    async def pull(self, consumer, name, max_items=1, timeout=None):
+        batch = await self.get_queue(name).pull(consumer, max_items, timeout)
+        return [[x.id, x.data, x.deliveries] for x in batch]
+
+    async def ack(self, consumer, name, ids):
+        return self.get_queue(name).ack(consumer, ids)
+
+    async def register_service(self, ident, name, addr):
+        self.services[name][ident] = addr
+
+    async def unregister_service(self, ident, name):
+        self.services[name].pop(ident, None)
+        if not self.services[name]:
+            del self.services[name]
+
+    async def lookup_service(self, name):
+        """ Return [ident, addr] pairs for the providers of a service. """
+        return sorted(self.services.get(name, {}).items())
+
+    def release(self, consumer):
+        """ Requeue messages held by a consumer that has gone away and drop
+        the services it provided. """
+        count = sum(q.release(consumer) for q in self.queues.values())
+        if count:
+            logger.warning("Requeued %d unacknowledged messages from: %s" % (
+                           count, consumer))
+        for name, providers in list(self.services.items()):
+            providers.pop(consumer, None)
+            if not providers:
+                del self.services[name]
+        return count
+
+    def get_stats(self):
+        return {
+            "queues": dict((name, q.get_stats())
+                           for name, q in self.queues.items()),
+            "services": dict((name, sorted(providers))
+                             for name, providers in self.services.items()),
+        }
+
+
+_pubsub_codec = codec.MsgpackCodec()
+
+
+def pack_topic(topic, data):
+    return topic.encode() + b'\0' + _pubsub_codec.encode(data)
+
+
+def unpack_topic(frame):
+    topic, sep, data = frame.partition(b'\0')
+    return topic.decode(), _pubsub_codec.decode(data)
+
+
+class Forwarder(object):
+    """ Coordinator side of pub/sub.  Relays every published message once
+    from a PULL socket to a PUB socket. """
+
+    def __init__(self, ipc_dir, loop=None):
+        self._loop = loop
+        self.pull_addr = 'ipc://%s/coord-pubsub-in' % ipc_dir
+        self.pub_addr = 'ipc://%s/coord-pubsub-out' % ipc_dir
+        self._pull = None
+        self._pub = None
+        self._task = None
+        self.stats = {
+            "forwarded": 0,
+            "bytes": 0,
+        }
+
+    def start(self):
+        self._pull = aionanomsg.Socket(aionanomsg.NN_PULL, loop=self._loop)
+        self._pull.bind(self.pull_addr)
+        self._pub = aionanomsg.Socket(aionanomsg.NN_PUB, loop=self._loop)
+        self._pub.bind(self.pub_addr)
+        self._task = self._loop.create_task(self._forward())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._pull.close()
+        self._pub.close()
+
+    async def _forward(self):
+        while True:
+            frame = await self._pull.recv()
+            await self._pub.send(frame)
+            self.stats['forwarded'] += 1
+            self.stats['bytes'] += len(frame)
+
+    async def publish(self, topic, data):
+        """ Publish from the coordinator itself. """
+        await self._pub.send(pack_topic(topic, data))
+        self.stats['forwarded'] += 1
+
+
+class Subscription(object):
+    """ Bounded buffer of messages for one topic prefix.  Iterate or use
+    get() to receive (topic, data) tuples. """
+
+    slow_ratio = 0.8
+
+    def __init__(self, prefix, maxsize=1000, loop=None):
+        self.prefix = prefix
+        self.maxsize = maxsize
+        self._loop = loop
+        self._buffer = collections.deque()
+        self._waiters = collections.deque()
+        self.closed = False
+        self.stats = {
+            "received": 0,
+            "dropped": 0,
+            "max_depth": 0,
+            "slow_events": 0,
+        }
+        self._slow = False
+
+    def matches(self, topic):
+        return topic.startswith(self.prefix)
+
+    def put(self, topic, data):
+        """ Buffer a message, dropping the oldest one when full. """
+        if len(self._buffer) >= self.maxsize:
+            self._buffer.popleft()
+            self.stats['dropped'] += 1
+        self._buffer.append((topic, data))
+        self.stats['received'] += 1
+        depth = len(self._buffer)
+        if depth > self.stats['max_depth']:
+            self.stats['max_depth'] = depth
+        slow = depth >= self.maxsize * self.slow_ratio
+        if slow and not self._slow:
+            self.stats['slow_events'] += 1
+            logger.warning("Slow subscriber for: %s" % self.prefix)
+        self._slow = slow
+        self._wakeup_next()
+
+    def _wakeup_next(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    async def get(self):
+        while not self._buffer:
+            if self.closed:
+                raise EOFError('Subscription closed')
+            waiter = asyncio.Future(loop=self._loop)
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+                if self._buffer and not waiter.cancelled():
+                    self._wakeup_next()  # Pass our wakeup on.
+                raise
+        return self._buffer.popleft()
+
+    def close(self):
+        self.closed = True
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return await self.get()
+        except EOFError:
+            raise StopAsyncIteration()
+
+    def get_stats(self):
+        return dict(self.stats, prefix=self.prefix, depth=len(self._buffer),
+                    maxsize=self.maxsize, slow=self._slow)
+
+
+class QueueClient(object):
+    """ Worker side handle for a named queue. """
+
+    def __init__(self, bus, name):
+        self._bus = bus
+        self.name = name
+
+    async def declare(self, maxsize=None):
+        return await self._bus.call('queue_declare', self.name, maxsize)
+
+    async def push(self, *items, timeout=None):
+        """ Push items in one batch.  Waits while the queue is full;  Returns
+        the number of items accepted before `timeout`. """
+        return await self._bus.call('queue_push', self.name, items, timeout)
+
+    async def pull(self, max_items=1, timeout=None):
+        """ Return a list of up to `max_items` messages.  An empty list means
+        nothing arrived before `timeout`. """
+        batch = await self._bus.call('queue_pull', self._bus.ident, self.name,
+                                     max_items, timeout)
+        return [Message(*x) for x in batch]
+
+    async def ack(self, *messages):
+        ids = [x.id for x in messages]
+        return await self._bus.call('queue_ack', self._bus.ident, self.name,
+                                    ids)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return (await self.pull())[0]
+
+
+class ServiceUnavailable(Exception):
+    """ The service provider is draining or stopping. """
+
+
+class Endpoint(object):
+    """ A worker providing a service, as seen by a caller. """
+
+    def __init__(self, ident, addr, bus):
+        self.ident = ident
+        self.addr = addr
+        self._bus = bus
+
+    @property
+    def inflight(self):
+        channel = self._bus._peers.get(self.addr)
+        return channel.inflight if channel is not None else 0
+
+
+class ServiceClient(object):
+    """ Worker side handle for calling a named service.  Providers are
+    looked up through the coordinator and cached for `lookup_ttl`
+    seconds. """
+
+    lookup_ttl = 5
+
+    def __init__(self, bus, name, policy='round_robin'):
+        self._bus = bus
+        self.name = name
+        if isinstance(policy, str):
+            policy = balance.policies[policy]()
+        self.policy = policy
+        self._endpoints = None
+        self._expires = 0
+
+    async def endpoints(self, refresh=False):
+        if refresh or self._endpoints is None or \
+           time.monotonic() >= self._expires:
+            providers = await self._bus.call('service_lookup', self.name)
+            self._endpoints = [Endpoint(ident, addr, self._bus)
+                               for ident, addr in providers]
+            self._expires = time.monotonic() + self.lookup_ttl
+        return self._endpoints
+
+    async def call(self, method, *args, key=None, timeout=None, **kwargs):
+        """ Call `method` on one provider.  The `key` is only used by the
+        consistent hash policy. """
+        endpoints = await self.endpoints()
+        if not endpoints:
+            raise LookupError('No providers for service: %s' % self.name)
+        endpoint = self.policy.choose(endpoints, key=key)
+        try:
+            channel = await self._bus.peer(endpoint.addr)
+            return await channel.call('service.%s.%s' % (self.name, method),
+                                      *args, timeout=timeout, **kwargs)
+        except (ConnectionError, OSError):
+            self._endpoints = None  # Provider is likely gone.
+            raise
+        except rpc.RemoteError as e:
+            if e.type_name == ServiceUnavailable.__name__:
+                self._endpoints = None  # Provider is going away.
+            raise
+
+
+class BusPlugin(object):
+    """ Worker plugin for the cluster message bus. """
+
+    def __init__(self, worker, loop):
+        self.ident = worker.ident
+        self._worker = worker
+        self._loop = loop
+        self._addr = worker.config['bus_addr']
+        self._pubsub_addrs = worker.config.get('pubsub_addrs')
+        self._options = worker.config.get('rpc', {})
+        self._channel = None
+        self._push = None
+        self._sub = None
+        self._subscriptions = []
+        self._prefixes = collections.Counter()
+        self._sub_task = None
+        self._peers = {}
+        self._connecting = {}
+        self._services = {}
+
+    async def __call__(self):
+        self._channel = await rpc.Channel.connect(self._addr, loop=self._loop,
+                                                  **self._options)
+        if self._pubsub_addrs:
+            self._push = aionanomsg.Socket(aionanomsg.NN_PUSH, loop=self._loop)
+            self._push.connect(self._pubsub_addrs['pull'])
+            self._sub = aionanomsg.Socket(aionanomsg.NN_SUB, loop=self._loop)
+            self._sub.connect(self._pubsub_addrs['pub'])
+            self._sub_task = self._loop.create_task(self._sub_loop())
+        rpc_plugin = self._worker._plugins.get('rpc')
+        if rpc_plugin is not None:
+            rpc_plugin.add_handler('bus_stats', self.get_stats)
+
+    async def _sub_loop(self):
+        while True:
+            frame = await self._sub.recv()
+            try:
+                topic, data = unpack_topic(frame)
+            except Exception:
+                logger.exception("Invalid pubsub frame")
+                continue
+            for x in self._subscriptions:
+                if x.matches(topic):
+                    x.put(topic, data)
+
+    def _check_pubsub(self):
+        if self._sub is None:
+            raise RuntimeError('Pubsub not available')
+
+    async def publish(self, topic, data):
+        """ Send `data` to every subscriber of `topic` in the cluster. """
+        self._check_pubsub()
+        await self._push.send(pack_topic(topic, data))
+
+    def subscribe(self, prefix, maxsize=1000):
+        """ Return a Subscription to topics starting with `prefix`. """
+        self._check_pubsub()
+        sub = Subscription(prefix, maxsize=maxsize, loop=self._loop)
+        if not self._prefixes[prefix]:
+            self._sub.setsockopt(aionanomsg.NN_SUB,
+                                 aionanomsg.NN_SUB_SUBSCRIBE, prefix.encode())
+        self._prefixes[prefix] += 1
+        self._subscriptions.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subscriptions.remove(sub)
+        sub.close()
+        self._prefixes[sub.prefix] -= 1
+        if not self._prefixes[sub.prefix]:
+            del self._prefixes[sub.prefix]
+            self._sub.setsockopt(aionanomsg.NN_SUB,
+                                 aionanomsg.NN_SUB_UNSUBSCRIBE,
+                                 sub.prefix.encode())
+
+    async def get_stats(self):
+        return {
+            "subscriptions": [x.get_stats() for x in self._subscriptions],
+        }
+
+    async def call(self, name, *args, **kwargs):
+        return await self._channel.call(name, *args, **kwargs)
+
+    def queue(self, name):
+        return QueueClient(self, name)
+
+    async def register(self, name, service):
+        """ Offer a service to the cluster.  The `service` is either a dict
+        of coroutine functions or an object whose public coroutine methods
+        become the service's calls. """
+        if isinstance(service, dict):
+            calls = service
+        else:
+            calls = dict((k, v) for k, v in inspect.getmembers(service)
+                         if not k.startswith('_') and
+                         asyncio.iscoroutinefunction(v))
+        rpc_plugin = self._worker._plugins['rpc']
+        for method, callback in calls.items():
+            rpc_plugin.add_handler('service.%s.%s' % (name, method),
+                                   self._service_call(callback))
+        await self.call('service_register', self.ident, name,
+                        rpc_plugin.server_addr)
+
+    def _service_call(self, callback):
+        """ Refuse new calls once the worker is draining so callers move on
+        to other providers. """
+        async def call(*args, **kwargs):
+            if self._worker.draining:
+                raise ServiceUnavailable('Provider is draining: %s' %
+                                         self.ident)
+            return await callback(*args, **kwargs)
+        return call
+
+    async def unregister(self, name):
+        await self.call('service_unregister', self.ident, name)
+
+    def service(self, name, policy='round_robin'):
+        """ Return a client for a service.  The policy is a name from
+        aiocluster.balance.policies or a Policy instance.  Clients are
+        cached so policy state and provider lookups are shared by callers.
+        """
+        key = name, policy
+        client = self._services.get(key)
+        if client is None:
+            client = self._services[key] = ServiceClient(self, name,
+                                                         policy=policy)
+        return client
+
+    async def peer(self, addr):
+        """ Return a channel to another worker, connecting if needed. """
+        channel = self._peers.get(addr)
+        if channel is not None and not channel.closed:
+            return channel
+        connecting = self._connecting.get(addr)
+        if connecting is None:
+            connecting = self._connecting[addr] = self._loop.create_task(
+                rpc.Channel.connect(addr, loop=self._loop, **self._options))
+        try:
+            channel = await asyncio.shield(connecting, loop=self._loop)
+        finally:
+            if self._connecting.get(addr) is connecting and \
+               connecting.done():
+                del self._connecting[addr]
+        self._peers[addr] = channel
+        return channel
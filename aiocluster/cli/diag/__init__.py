@@ -3,7 +3,7 @@ Command line interface for interacting with an active aiocluster service.
 """
 
 import shellish
-from . import profiler, memory
+from . import profiler, memory, restart, looplag
 
 
 class DiagCommand(shellish.Command):
@@ -14,5 +14,13 @@ class DiagCommand(shellish.Command):
     def setup_args(self, parser):
         self.add_argument('--url', default='http://127.0.0.1:7878',
                           autoenv=True, help='URL to connect to.')
+        self.add_argument('--timeout', type=float, help='Seconds to wait '
+                          'for workers to respond;  Slower workers are '
+                          'left out of the results.')
+        self.add_argument('--cluster', action='store_true', help='Include '
+                          'every federated node;  Results are merged by '
+                          'the coordinator at `--url`.')
         self.add_subcommand(profiler.Profiler)
         self.add_subcommand(memory.Memory)
+        self.add_subcommand(restart.Restart)
+        self.add_subcommand(looplag.LoopLag)
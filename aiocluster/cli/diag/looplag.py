@@ -0,0 +1,85 @@
+"""
+Event loop lag and slow callbacks.
+"""
+
+import os
+import requests
+import shellish
+import time
+from . import util
+
+
+def ms(value):
+    return '-' if value is None else '%.1f ms' % (value * 1000)
+
+
+class LoopLag(shellish.Command):
+    """ Show how late each worker's event loop runs and the slowest recent
+    callbacks with the stack that blocked the loop. """
+
+    name = 'looplag'
+    urn = '/api/v1/looplag'
+    use_pager = True
+
+    def setup_args(self, parser):
+        self.add_argument('--window', choices=('recent', 'total'),
+                          default='recent', help='The last few minutes or '
+                          'since each worker started.')
+        self.add_argument('--slow', type=int, default=5, help='Number of '
+                          'slow callbacks to show.')
+        self.add_argument('--stack-depth', type=int, default=8,
+                          help='Innermost frames of each stack to show.')
+
+    def run(self, args):
+        params = util.broadcast_params(args, window=args.window,
+                                       slow=args.slow)
+        if args.cluster:
+            params['merge'] = 'true'
+        report = requests.get(args.url + self.urn, params=params)
+        if not report.ok:
+            print(report.json())
+            return
+        if args.cluster:
+            merged = util.cluster_results(report.json())
+            rows = [('cluster', merged)]
+            slow = merged['slow']
+        else:
+            results = report.json()
+            util.broadcast_errors(results)
+            rows = sorted(results['results'].items())
+            slow = [dict(x, source=ident) for ident, r in rows
+                    for x in r['slow']]
+            slow.sort(key=lambda x: x['lag'], reverse=True)
+            del slow[args.slow:]
+        table = shellish.Table(headers=[
+            'Worker',
+            'p50',
+            'p90',
+            'p99',
+            'p99.9',
+            'Max',
+            'Samples',
+            'Slow',
+        ])
+        table.print([
+            ident,
+            ms(x['percentiles']['p50']),
+            ms(x['percentiles']['p90']),
+            ms(x['percentiles']['p99']),
+            ms(x['percentiles']['p99.9']),
+            ms(x['histogram']['max']),
+            x['histogram']['count'],
+            x['slow_count'],
+        ] for ident, x in rows)
+        for x in slow:
+            print()
+            shellish.vtmlprint('<b>Worker %s blocked %s</b> at %s' % (
+                               x['source'], ms(x['lag']),
+                               time.strftime('%H:%M:%S',
+                                             time.localtime(x['time']))))
+            if not x['stack']:
+                print('    (stack not captured)')
+                continue
+            for file, function, lineno in x['stack'][-args.stack_depth:]:
+                print('    %s:%d %s' % (os.path.basename(file), lineno,
+                                        function))
@@ -5,6 +5,7 @@ Memory stats
 import collections
 import requests
 import shellish
+from . import util
 
 
 class Memory(shellish.Command):
@@ -30,14 +31,20 @@ class Show(MemoryMixin, shellish.Command):
                           default='mostcommon')
 
     def run(self, args):
-        report = requests.get(args.url + self.urn, params=dict(type=args.type))
+        report = requests.get(args.url + self.urn,
+                              params=util.broadcast_params(args,
+                                                           type=args.type))
         if not report.ok:
             print(report.json())
             return
+        if args.cluster:
+            return self.show_cluster(util.cluster_results(report.json()),
+                                     args.type)
+        results = util.broadcast_results(report.json())
         if args.type == 'growth':
-            return self.show_growth(report.json())
+            return self.show_growth(results)
         else:
-            return self.show_mostcommon(report.json())
+            return self.show_mostcommon(results)
 
     def show_mostcommon(self, report):
         merged = collections.defaultdict(lambda: 0)
@@ -65,3 +72,17 @@ class Show(MemoryMixin, shellish.Command):
             'Change',
         ])
         table.print(stats)
+
+    def show_cluster(self, rows, type):
+        """ Rows are already merged and sorted by the server;  The last
+        column is a breakdown by node. """
+        headers = ['Type', 'Count']
+        if type == 'growth':
+            headers.append('Change')
+        headers.extend(['Nodes', 'Top Node'])
+        table = shellish.Table(headers=headers)
+        table.print(row[:-1] + [
+            len(row[-1]),
+            '%s (%d)' % max(((k, v[-1]) for k, v in row[-1].items()),
+                            key=lambda x: x[1])
+        ] for row in rows)
@@ -6,6 +6,7 @@ import requests
 import shellish
 import shutil
 import time
+from . import util
 
 
 class Profiler(shellish.Command):
@@ -17,19 +18,56 @@ class Profiler(shellish.Command):
         self.add_subcommand(Stop)
         self.add_subcommand(Report)
         self.add_subcommand(Top)
+        self.add_subcommand(Tasks)
+        self.add_subcommand(History)
+        self.add_subcommand(FlameGraph)
+
+
+def report_params(args, limit):
+    """ Have the server merge the workers and only send the top entries. """
+    params = util.broadcast_params(args, merge='true', sortby=args.sortby)
+    if limit is not None:
+        params['limit'] = limit
+    return params
+
+
+def call_key(entry):
+    return entry['call']['file'], entry['call']['function'], \
+        entry['call']['lineno']
 
 
 class ProfilerMixin(object):
 
     urn = '/api/v1/profiler/'
 
+    def add_mode_args(self):
+        self.add_argument('--mode', choices=('deterministic', 'sampling'),
+                          default='deterministic', help='The sampling mode '
+                          'has little overhead but does not count calls.')
+        self.add_argument('--hz', type=int, help='Samples per second in '
+                          'sampling mode.')
+        self.add_argument('--timer', choices=('cpu', 'wall'), help='Sample '
+                          'only while busy or all the time.')
+
+    def activate(self, args):
+        params = util.broadcast_params(args, mode=args.mode)
+        if args.hz is not None:
+            params['hz'] = args.hz
+        if args.timer is not None:
+            params['timer'] = args.timer
+        requests.put(args.url + self.urn + 'active', json=True,
+                     params=params)
+
 
 class Start(ProfilerMixin, shellish.Command):
 
     name = 'start'
 
+    def setup_args(self, parser):
+        self.add_mode_args()
+
     def run(self, args):
-        requests.put(args.url + self.urn + 'active', json=True)
+        self.activate(args)
 
 
 class Stop(ProfilerMixin, shellish.Command):
@@ -37,7 +75,8 @@ class Stop(ProfilerMixin, shellish.Command):
     name = 'stop'
 
     def run(self, args):
-        requests.put(args.url + self.urn + 'active', json=False)
+        requests.put(args.url + self.urn + 'active', json=False,
+                     params=util.broadcast_params(args))
 
 
 class Report(ProfilerMixin, shellish.Command):
@@ -51,36 +90,19 @@ class Report(ProfilerMixin, shellish.Command):
         self.add_argument('--limit', type=int, default=None)
 
     def run(self, args):
-        report = requests.get(args.url + self.urn + 'report')
+        report = requests.get(args.url + self.urn + 'report',
+                              params=report_params(args, args.limit))
         if not report.ok:
             print(report.json())
             return
-        by_call = {}
-        for stats in report.json():
-            for x in stats:
-                key = (
-                    x['call']['file'],
-                    x['call']['function'],
-                    x['call']['lineno']
-                )
-                try:
-                    ref = by_call[key]
-                except KeyError:
-                    by_call[key] = x['stats']
-                else:
-                    ref['totaltime'] += x['stats']['totaltime']
-                    ref['inlinetime'] += x['stats']['inlinetime']
-                    ref['callcount'] += x['stats']['callcount']
-        stats = sorted(by_call.items(), key=lambda x: x[1][args.sortby],
-                       reverse=True)
+        stats = [(call_key(x), x['stats'])
+                 for x in util.merged_results(args, report.json())]
         table = shellish.Table(headers=[
             'Function',
             'Total Time',
             'Inline Time',
             'Calls'
         ])
-        if args.limit is not None:
-            del stats[args.limit:]
         table.print([
             '%s:%s:%s' % ('/'.join(x[0][0].rsplit('/', 2)[-2:]), x[0][1],
                           x[0][2]),
@@ -99,6 +121,7 @@ class Top(ProfilerMixin, shellish.Command):
         self.add_argument('--sortby', choices=('totaltime', 'inlinetime',
                           'callcount'), default='inlinetime')
         self.add_argument('--refresh', type=float, default=1)
+        self.add_mode_args()
 
     def timer(self):
         return time.perf_counter()
@@ -144,32 +167,20 @@ class Top(ProfilerMixin, shellish.Command):
             print('\0338')  # restore
 
     def _run(self, args):
-        requests.put(args.url + self.urn + 'active', json=True)
+        self.activate(args)
         prev_totals = {}
         prev_ts = None
         while True:
             height = shutil.get_terminal_size()[1]
-            report = requests.get(args.url + self.urn + 'report')
+            report = requests.get(args.url + self.urn + 'report',
+                                  params=report_params(args, height - 3))
             ts = self.timer()
             if not report.ok:
                 print(report.json())
                 return
-            totals = {}
-            for stats in report.json():
-                for x in stats:
-                    key = (
-                        x['call']['file'],
-                        x['call']['function'],
-                        x['call']['lineno']
-                    )
-                    try:
-                        ref = totals[key]
-                    except KeyError:
-                        totals[key] = x['stats']
-                    else:
-                        ref['totaltime'] += x['stats']['totaltime']
-                        ref['inlinetime'] += x['stats']['inlinetime']
-                        ref['callcount'] += x['stats']['callcount']
+            totals = dict((call_key(x), x['stats']) for x in
+                          util.merged_results(args, report.json(),
+                                              quiet=True))
             if prev_ts is None:
                 prev_ts = ts
                 prev_totals = totals
@@ -218,3 +229,195 @@ class Top(ProfilerMixin, shellish.Command):
                 self.human_num(x[1]['callcount'])
             ] for x in stats)
             time.sleep(args.refresh)
+
+
+class Tasks(Top):
+    """ Live view of the time spent in asyncio tasks. """
+
+    name = 'tasks'
+
+    def setup_args(self, parser):
+        self.add_argument('--sortby', choices=('cpu', 'wall', 'steps',
+                          'blocked', 'active'), default='wall')
+        self.add_argument('--group-by', choices=('coroutine', 'name'),
+                          default='coroutine')
+        self.add_argument('--refresh', type=float, default=1)
+
+    def _run(self, args):
+        requests.put(args.url + self.urn + 'active', json=True,
+                     params=util.broadcast_params(args, mode='tasks'))
+        prev_totals = {}
+        prev_ts = None
+        while True:
+            height = shutil.get_terminal_size()[1]
+            params = util.broadcast_params(args, merge='true',
+                                           sortby=args.sortby,
+                                           group_by=args.group_by,
+                                           limit=height - 3)
+            report = requests.get(args.url + self.urn + 'tasks',
+                                  params=params)
+            ts = self.timer()
+            if not report.ok:
+                print(report.json())
+                return
+            totals = dict((x['name'], x) for x in
+                          util.merged_results(args, report.json(),
+                                              quiet=True))
+            if prev_ts is None:
+                prev_ts = ts
+                prev_totals = totals
+                time.sleep(0.100)  # quickly to get data up.
+                continue
+            period = ts - prev_ts
+            for name, stats in totals.items():
+                prev = prev_totals.get(name)
+                if prev is None:
+                    prev = dict.fromkeys(stats, 0)
+                steps = stats['steps'] - prev['steps']
+                wall = max(stats['wall'] - prev['wall'], 0)
+                stats['cpu_percent'] = max(stats['cpu'] - prev['cpu'], 0) / \
+                    period
+                stats['loop_percent'] = wall / period
+                stats['step_rate'] = steps / period
+                stats['step_time'] = wall / steps if steps else 0
+            prev_ts = ts
+            prev_totals = totals
+            stats = sorted(totals.values(), key=lambda x: x[args.sortby],
+                           reverse=True)
+            del stats[height-3:]
+            table = shellish.Table(headers=[
+                'Task',
+                'CPU %',
+                'Loop %',
+                'Steps/s',
+                'Time/step',
+                'Max Step',
+                'Blocked',
+                'Active',
+                'Done',
+            ])
+            print('\033[H')  # Move cursor home
+            table.print([
+                x['name'],
+                self.human_num(x['cpu_percent'] * 100, prec=1),
+                self.human_num(x['loop_percent'] * 100, prec=1),
+                self.human_num(x['step_rate']),
+                '%.0f μs' % (x['step_time'] * 1000000),
+                '%.1f ms' % (x['max_step'] * 1000),
+                self.human_num(x['blocked']),
+                self.human_num(x['active']),
+                self.human_num(x['completed']),
+            ] for x in stats)
+            time.sleep(args.refresh)
+
+
+class History(ProfilerMixin, shellish.Command):
+    """ Report from the always on profiler for a range of recent minutes,
+    optionally compared against a baseline range.  Ranges are `N` for the
+    last N minutes or `FROM-TO` minutes ago, Eg. `--window 10
+    --baseline 70-60` compares the last 10 minutes with an hour earlier.
+    """
+
+    name = 'history'
+    use_pager = True
+
+    def setup_args(self, parser):
+        self.add_argument('--window', default='5', help='Minutes to '
+                          'report on.')
+        self.add_argument('--baseline', help='Minutes to compare against.')
+        self.add_argument('--sortby', choices=('totaltime', 'inlinetime',
+                          'change'))
+        self.add_argument('--limit', type=int, default=50)
+
+    def run(self, args):
+        params = report_params(args, args.limit)
+        params['window'] = args.window
+        if args.baseline:
+            params['baseline'] = args.baseline
+        if args.sortby is None:
+            del params['sortby']
+        resp = requests.get(args.url + self.urn + 'history', params=params)
+        if not resp.ok:
+            print(resp.json())
+            return
+        report = util.merged_results(args, resp.json())
+        window = report['window']
+        baseline = report['baseline']
+
+        def percent(value, info):
+            if not info or not info['duration']:
+                return '-'
+            return '%.2f%%' % (value / info['duration'] * 100)
+
+        headers = ['Function', 'CPU', 'Total CPU']
+        if baseline:
+            headers.extend(['Baseline CPU', 'Change'])
+        table = shellish.Table(headers=headers)
+        rows = []
+        for x in report['functions']:
+            row = [
+                '%s:%s:%s' % ('/'.join(x['call']['file'].rsplit('/', 2)[-2:]),
+                              x['call']['function'], x['call']['lineno']),
+                percent(x['stats']['inlinetime'], window),
+                percent(x['stats']['totaltime'], window),
+            ]
+            if baseline:
+                row.extend([
+                    percent(x['baseline']['inlinetime'], baseline),
+                    '%+.2f%%' % (x['change']['inlinetime'] * 100),
+                ])
+            rows.append(row)
+        table.print(rows)
+        for name, info in (('Window', window), ('Baseline', baseline)):
+            if info:
+                shellish.vtmlprint('<b>%s:</b> %s to %s, %d samples' % (
+                    name, time.strftime('%H:%M:%S',
+                                        time.localtime(info['start'])),
+                    time.strftime('%H:%M:%S', time.localtime(info['end'])),
+                    info['samples']))
+
+
+class FlameGraph(ProfilerMixin, shellish.Command):
+    """ Save a flame graph of the sampling profiler's stacks.  Open `folded`
+    output with flamegraph.pl and `speedscope` output at speedscope.app. """
+
+    name = 'flamegraph'
+
+    def setup_args(self, parser):
+        self.add_argument('-o', '--output', required=True, help='File to '
+                          'write;  Defaults to speedscope format for `.json` '
+                          'files and folded stacks otherwise.')
+        self.add_argument('--format', choices=('folded', 'speedscope'))
+        self.add_argument('--duration', type=float, help='Turn on the '
+                          'sampling profiler for this many seconds first '
+                          'instead of using what it has collected so far.')
+        self.add_argument('--hz', type=int, help='Samples per second with '
+                          '`--duration`.')
+
+    def run(self, args):
+        format = args.format
+        if format is None:
+            json = args.output.endswith('.json')
+            format = 'speedscope' if json else 'folded'
+        if args.duration:
+            params = util.broadcast_params(args, mode='sampling')
+            if args.hz is not None:
+                params['hz'] = args.hz
+            requests.put(args.url + self.urn + 'active', json=True,
+                         params=params)
+            time.sleep(args.duration)
+        try:
+            resp = requests.get(args.url + self.urn + 'flamegraph',
+                                params=util.broadcast_params(args,
+                                                             format=format))
+        finally:
+            if args.duration:
+                requests.put(args.url + self.urn + 'active', json=False,
+                             params=util.broadcast_params(args))
+        if not resp.ok:
+            print(resp.json())
+            return
+        with open(args.output, 'wb') as f:
+            f.write(resp.content)
+        shellish.vtmlprint('Wrote %s flame graph: <b>%s</b>' % (format,
+                           args.output))
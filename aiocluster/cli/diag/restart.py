@@ -0,0 +1,53 @@
+"""
+Rolling restart of the worker pool.
+"""
+
+import requests
+import shellish
+import time
+
+
+class Restart(shellish.Command):
+    """ Replace every worker with a fresh process running newly imported
+    code without taking the service down. """
+
+    name = 'restart'
+    urn = '/api/v1/restart'
+
+    def setup_args(self, parser):
+        self.add_argument('--surge', type=int, default=1, help='Number of '
+                          'extra workers that may run during the restart.')
+        self.add_argument('--max-unavailable', type=int, default=0,
+                          help='Number of workers that may be stopped before '
+                          'their replacements are ready.')
+        self.add_argument('--no-wait', action='store_true', help='Return as '
+                          'soon as the restart has started.')
+        self.add_argument('--poll', type=float, default=0.5,
+                          help='Status poll interval in seconds.')
+
+    def run(self, args):
+        resp = requests.put(args.url + self.urn, json={
+            "surge": args.surge,
+            "max_unavailable": args.max_unavailable
+        })
+        if not resp.ok:
+            print(resp.json())
+            raise SystemExit(1)
+        if args.no_wait:
+            return
+        while True:
+            time.sleep(args.poll)
+            status = requests.get(args.url + self.urn).json()
+            if status is None:
+                continue
+            if status['finished']:
+                break
+            shellish.vtmlprint('Replaced <b>%d</b> of <b>%d</b> workers' % (
+                               status['replaced'], status['total']))
+        elapsed = status['finished'] - status['started']
+        if status['error']:
+            shellish.vtmlprint('<b><red>Restart Failed:</red> %s' %
+                               status['error'])
+            raise SystemExit(1)
+        shellish.vtmlprint('<b><green>Restarted %d workers in %.1f seconds'
+                           '</green></b>' % (status['replaced'], elapsed))
@@ -0,0 +1,54 @@
+"""
+Helpers shared by diag commands.
+"""
+
+import shellish
+
+
+def broadcast_params(args, **params):
+    """ Query params for an API call that is broadcast to workers. """
+    if args.timeout is not None:
+        params['timeout'] = args.timeout
+    if args.cluster:
+        params['cluster'] = 'true'
+    return params
+
+
+def broadcast_errors(report, prefix=''):
+    """ Print the workers that failed or timed out in a broadcast. """
+    for ident, error in sorted(report['errors'].items()):
+        shellish.vtmlprint('<b><red>Worker %s%s error:</red></b> %s' % (
+                           prefix, ident, error))
+    for ident in report['timeouts']:
+        shellish.vtmlprint('<b><yellow>Worker %s%s timed out</yellow></b>' %
+                           (prefix, ident))
+
+
+def broadcast_results(report, quiet=False):
+    """ Return the per worker results of a broadcast response and report on
+    workers that failed or timed out. """
+    if not quiet:
+        broadcast_errors(report)
+    return list(report['results'].values())
+
+
+def cluster_results(report, quiet=False):
+    """ Return the merged result of a cluster wide query and report on
+    nodes and workers that failed or timed out. """
+    if not quiet:
+        for ident, error in sorted(report['errors'].items()):
+            shellish.vtmlprint('<b><red>Node %s error:</red></b> %s' % (
+                               ident, error))
+        for node, summary in sorted(report['nodes'].items()):
+            broadcast_errors(summary, prefix='%s/' % node)
+    return report['results']
+
+
+def merged_results(args, report, quiet=False):
+    """ Return the result of a query the server merged, either across the
+    local workers or with `--cluster` across every node. """
+    if args.cluster:
+        return cluster_results(report, quiet=quiet)
+    if not quiet:
+        broadcast_errors(report)
+    return report['results']
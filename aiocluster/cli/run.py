@@ -6,7 +6,8 @@ import argparse
 import pkg_resources
 import shellish
 import shlex
-from .. import coordinator, setup
+from .. import autoscale, coordinator, federation, membership, placement, \
+    setup
 
 
 class RunCommand(shellish.Command):
@@ -43,6 +44,62 @@ class RunCommand(shellish.Command):
         self._advarg('--disable-worker-restart', action='store_true',
                      help='Disable automatic restart of worker processes if '
                      'they exit or fail.')
+        self._advarg('--spawn-mode', choices=('exec', 'zygote'),
+                     default='exec', help='How worker processes are created.  '
+                     'The `zygote` mode forks workers from a template process '
+                     'that has already imported the worker module.')
+        self._advarg('--start-concurrency', metavar='NUM_PROCS', type=int,
+                     help='Maximum number of workers to start at once.')
+        self._advarg('--drain-timeout', metavar='SECONDS', type=float,
+                     help='Time to wait for in-flight work to finish when '
+                     'stopping workers.')
+        self._advarg('--autoscale', choices=('cpu', 'looplag'),
+                     help='Resize the worker pool based on worker CPU usage '
+                     'or event loop lag.')
+        self._advarg('--autoscale-target', type=float, help='Target CPU '
+                     'percent or loop lag seconds for the autoscaler.')
+        self._advarg('--autoscale-min', metavar='NUM_PROCS', type=int,
+                     default=1, help='Minimum number of autoscaled workers.')
+        self._advarg('--autoscale-max', metavar='NUM_PROCS', type=int,
+                     help='Maximum number of autoscaled workers.')
+        self._advarg('--share', metavar='NAME=PATH', action='append',
+                     autoenv=False, help='Share a read-only data file with '
+                     'all workers.  Workers access it with '
+                     '`WorkerCommand.shared(NAME)`.  May be repeated.')
+        self._advarg('--placement', choices=('pin', 'spread'),
+                     help='Set worker CPU affinity.  The `pin` mode gives '
+                     'each worker its own core(s) and `spread` distributes '
+                     'workers across NUMA nodes.')
+        self._advarg('--cores-per-worker', metavar='NUM_CPUS', type=int,
+                     default=1, help='Cores given to each worker with '
+                     '`--placement pin`.')
+        self._advarg('--reserve-cpus', metavar='NUM_CPUS', type=int,
+                     default=0, help='Cores reserved for the coordinator '
+                     'when using `--placement`.')
+        self._advarg('--federate', metavar='BIND_IP:PORT', help='Join a '
+                     'multi-node cluster by listening for peer coordinators '
+                     'on this address.')
+        self._advarg('--advertise', metavar='IP:PORT', help='Address peers '
+                     'should use to reach this node if it differs from '
+                     '`--federate`.  Required when `--federate` is a '
+                     'wildcard address.')
+        self._advarg('--peer', metavar='IP:PORT', action='append',
+                     autoenv=False, help='Static peer coordinator address.  '
+                     'May be repeated.')
+        self._advarg('--peers-file', metavar='PATH', help='File of peer '
+                     '`IP:PORT` lines, re-read periodically.')
+        self._advarg('--peers-dns', metavar='NAME:PORT', help='DNS name '
+                     'that resolves to peer coordinators.')
+        self._advarg('--gossip', metavar='BIND_IP:PORT', help='Track the '
+                     'liveness of other coordinators with UDP gossip on '
+                     'this address.')
+        self._advarg('--gossip-advertise', metavar='IP:PORT', help='Address '
+                     'other nodes should gossip with if it differs from '
+                     '`--gossip`.  Required when `--gossip` is a wildcard '
+                     'address.')
+        self._advarg('--gossip-seed', metavar='IP:PORT', action='append',
+                     autoenv=False, help='Gossip address of a coordinator '
+                     'to join through.  May be repeated.')
         self._advarg('--log-format', metavar='TEMPLATE', help='Override the '
                      'logging format.')
         self._advarg('--syslog-addr', default='/dev/log', help='Either a '
@@ -53,6 +110,11 @@ class RunCommand(shellish.Command):
                      help='Local address to bind diagnostic server on.')
         self._advarg('--diag-port', metavar='BIND_PORT', default=7878,
                      type=int, help='Port to bind diag server on.')
+        self._advarg('--disable-continuous-profiling', action='store_true',
+                     help='Disable the always on sampling profiler that '
+                     'keeps a history of per minute profiles in workers.')
+        self._advarg('--continuous-profiling-hz', metavar='HZ', type=int,
+                     help='Samples per second for continuous profiling.')
 
         wspec_doc = 'The worker specification is a dot notation string ' \
             '<cyan>(ie. foo.bar)</cyan> that refers to the module(s) and ' \
@@ -82,6 +144,33 @@ class RunCommand(shellish.Command):
     def _advarg(self, *args, **kwargs):
         return self._arg(*args, parser=self._adv_arg_parser, **kwargs)
 
+    def make_federation(self, args, loop):
+        if args.peers_file:
+            discovery = federation.FileDiscovery(args.peers_file)
+        elif args.peers_dns:
+            name, port = federation.parse_addr(args.peers_dns)
+            discovery = federation.DNSDiscovery(name, port, loop=loop)
+        else:
+            discovery = federation.StaticDiscovery(args.peer or ())
+        listen = federation.parse_addr(args.federate)
+        if args.advertise:
+            addr = federation.parse_addr(args.advertise)
+        else:
+            addr = None
+        return federation.Federation(listen=listen, addr=addr,
+                                     discovery=discovery, loop=loop)
+
+    def make_membership(self, args, loop):
+        bind = federation.parse_addr(args.gossip)
+        if args.gossip_advertise:
+            advertise = federation.parse_addr(args.gossip_advertise)
+        else:
+            advertise = None
+        transport = membership.UDPTransport(bind=bind, advertise=advertise,
+                                            loop=loop)
+        seeds = federation.StaticDiscovery(args.gossip_seed or ())
+        return membership.Membership(transport, seeds=seeds, loop=loop)
+
     def run(self, args):
         """ Validate the args work with our worker by instantiating it here.
         if it checks out and doesn't exit via a `--help` or other type of
@@ -116,15 +205,79 @@ class RunCommand(shellish.Command):
             }
         else:
             diag_settings = {}
+        if args.disable_continuous_profiling:
+            continuous_profiling = False
+        else:
+            continuous_profiling = {}
+            if args.continuous_profiling_hz is not None:
+                continuous_profiling['hz'] = args.continuous_profiling_hz
         loop = setup.get_event_loop(**worker_settings['event_loop'])
         worker_restart = not args.disable_worker_restart
-        coord = coordinator.Coordinator(args.worker_spec,
-                                        worker_count=args.workers,
-                                        worker_settings=worker_settings,
-                                        worker_args=worker_args,
-                                        worker_restart=worker_restart,
-                                        diag_settings=diag_settings,
-                                        loop=loop)
+        shared_data = {}
+        for x in args.share or ():
+            name, sep, path = x.partition('=')
+            if not sep or not name or not path:
+                shellish.vtmlprint("<b><red>Invalid --share:</red> %s" % x)
+                raise SystemExit(1)
+            shared_data[name] = path
+        if args.autoscale:
+            Policy = {
+                "cpu": autoscale.CPUPolicy,
+                "looplag": autoscale.LoopLagPolicy,
+            }[args.autoscale]
+            if args.autoscale_target is not None:
+                policy = Policy(target=args.autoscale_target)
+            else:
+                policy = Policy()
+            autoscaler = autoscale.Autoscaler(policy,
+                                              min_workers=args.autoscale_min,
+                                              max_workers=args.autoscale_max,
+                                              loop=loop)
+        else:
+            autoscaler = None
+        if args.placement == 'pin':
+            cpu_placement = placement.PinPlacement(
+                cores_per_worker=args.cores_per_worker,
+                reserve=args.reserve_cpus)
+        elif args.placement == 'spread':
+            cpu_placement = placement.SpreadPlacement(
+                reserve=args.reserve_cpus)
+        else:
+            cpu_placement = None
+        if args.federate:
+            try:
+                fed = self.make_federation(args, loop)
+            except ValueError as e:
+                shellish.vtmlprint("<b><red>Invalid federation arg:</red> %s"
+                                   % e)
+                raise SystemExit(1)
+        else:
+            fed = None
+        if args.gossip:
+            try:
+                gossip = self.make_membership(args, loop)
+            except ValueError as e:
+                shellish.vtmlprint("<b><red>Invalid gossip arg:</red> %s" % e)
+                raise SystemExit(1)
+        else:
+            gossip = None
+        coord = coordinator.Coordinator(
+            args.worker_spec,
+            worker_count=args.workers,
+            worker_settings=worker_settings,
+            worker_config={"continuous_profiling": continuous_profiling},
+            worker_args=worker_args,
+            worker_restart=worker_restart,
+            diag_settings=diag_settings,
+            spawn_mode=args.spawn_mode,
+            start_concurrency=args.start_concurrency,
+            drain_timeout=args.drain_timeout,
+            autoscaler=autoscaler,
+            shared_data=shared_data,
+            placement=cpu_placement,
+            federation=fed,
+            membership=gossip,
+            loop=loop)
         loop.run_until_complete(coord.start())
         try:
             loop.run_until_complete(coord.wait_stopped())
@@ -0,0 +1,103 @@
+"""
+Serialization codecs and compressors for RPC payloads.
+
+Both ends of an rpc.Channel advertise what they support and the first
+choice the other side also has is used.  Compressors for lz4 and zstandard
+are used when those packages are installed;  zlib is always available.
+"""
+
+import collections
+import json
+import msgpack
+import zlib
+
+
+class Codec(object):
+    """ Base type for payload serializers. """
+
+    name = None
+
+    def encode(self, obj):
+        raise NotImplementedError("Required subclass impl")
+
+    def decode(self, data):
+        raise NotImplementedError("Required subclass impl")
+
+
+class MsgpackCodec(Codec):
+    """ Compact binary format;  The default. """
+
+    name = 'msgpack'
+
+    def encode(self, obj):
+        return msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, data):
+        # Worker idents are ints and are used as map keys.
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+class JSONCodec(Codec):
+    """ Slower and larger than msgpack and no support for bytes.  Mostly
+    useful for debugging with packet captures. """
+
+    name = 'json'
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(',', ':')).encode()
+
+    def decode(self, data):
+        return json.loads(data.decode())
+
+
+class Compressor(object):
+    """ A named pair of compress/decompress functions. """
+
+    def __init__(self, name, compress, decompress):
+        self.name = name
+        self.compress = compress
+        self.decompress = decompress
+
+
+codecs = collections.OrderedDict()
+compressors = collections.OrderedDict()
+
+
+def register_codec(codec):
+    codecs[codec.name] = codec
+
+
+def register_compressor(compressor):
+    compressors[compressor.name] = compressor
+
+
+def negotiate(offered, available):
+    """ Return the first offered name that is also available. """
+    for x in offered:
+        if x in available:
+            return x
+
+
+register_codec(MsgpackCodec())
+register_codec(JSONCodec())
+
+try:
+    import zstandard
+except ImportError:
+    pass
+else:
+    register_compressor(Compressor(
+        'zstd',
+        zstandard.ZstdCompressor(level=1).compress,
+        zstandard.ZstdDecompressor().decompress))
+
+try:
+    import lz4.frame
+except ImportError:
+    pass
+else:
+    register_compressor(Compressor('lz4', lz4.frame.compress,
+                                   lz4.frame.decompress))
+
+register_compressor(Compressor('zlib', lambda x: zlib.compress(x, 1),
+                               zlib.decompress))
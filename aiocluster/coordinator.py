@@ -5,14 +5,18 @@ made by foreign coordinator nodes.
 
 import aionanomsg
 import asyncio
+import collections
 import logging
-import math
 import os
+import psutil
 import signal
 import tempfile
+import time
 import uuid
 from  multiprocessing import cpu_count
-from . import worker, diag
+from . import worker, diag, restart, rpc, shared, placement as _placement
+from . import bus as _bus
+from .worker import env, zygote
 
 logger = logging.getLogger('coordinator')
 _default_coordinator = None
@@ -29,11 +33,23 @@ class Coordinator(object):
 
     term_timeout = 1
     kill_timeout = 1
+    start_timeout = 30
+    drain_timeout = 10
+    drain_ack_timeout = 1
+    drain_poll_interval = 0.1
+    broadcast_timeout = 5
+    lag_poll_interval = 5
+    spawn_modes = {'exec', 'zygote'}
 
     def __init__(self, worker_spec, worker_count=None, worker_settings=None,
                  worker_config=None, worker_args=None, worker_restart=True,
                  diag_settings=None, handle_sigterm=True, handle_sigint=True,
-                 loop=None, set_default=True):
+                 spawn_mode='exec', start_concurrency=None, drain_timeout=None,
+                 autoscaler=None, restart_policy=None, shared_data=None,
+                 placement=None, rpc_options=None, bus=None, federation=None,
+                 membership=None, loop=None, set_default=True):
+        if spawn_mode not in self.spawn_modes:
+            raise ValueError('Invalid spawn mode: %s' % spawn_mode)
         if set_default:
             global _default_coordinator
             if _default_coordinator is not None:
@@ -45,8 +61,40 @@ class Coordinator(object):
         self.worker_spec = worker_spec
         self.worker_count = worker_count or cpu_count()
         self.worker_restart = worker_restart
+        self.spawn_mode = spawn_mode
+        self.start_concurrency = start_concurrency or cpu_count()
+        if drain_timeout is not None:
+            self.drain_timeout = drain_timeout
+        self.autoscaler = autoscaler
+        self.restart_policy = restart_policy or restart.RestartPolicy()
+        self.placement = placement
+        self.bus = bus or _bus.Broker(loop=loop)
+        self._bus_server = None
+        self._forwarder = None
+        self.federation = federation
+        self.membership = membership
+        self.slot_history = {}
+        self._reserved_slots = set()
+        self._restart_times = collections.deque()
+        self.zygote = None
+        self._retired_zygotes = []
+        self.restart_status = None
+        self.stats = {
+            "drain": {
+                "workers": 0,
+                "clean": 0,
+                "cutoff": 0,
+                "cutoff_inflight": 0,
+                "unresponsive": 0,
+                "total_time": 0,
+                "max_time": 0,
+                "last_time": None,
+            }
+        }
         self._worker_config = {
-            "plugins": ['rpc']
+            "plugins": ['rpc', 'bus'],
+            "shared": {},
+            "rpc": rpc_options or {},
         }
         self._worker_config.update(worker_config or {})
         self._worker_settings = worker_settings
@@ -62,35 +110,143 @@ class Coordinator(object):
         self.rpc_server = None
         self.diag = None
         self._ipc_dir = None
+        self._boot_payload = None
+        self._shared_data = shared_data or {}
+        self.shared = {}
+        self.loop_lag = {}
+        self._lag_task = None
 
     async def start(self):
         assert not self._stopping
         logger.debug('Coordinator Starting')
         self.add_signal_handlers()
+        if self.placement is not None:
+            self.setup_placement()
         await self.start_rpc()
+        await self.start_bus()
+        if self.federation is not None:
+            await self.federation.start(self)
+        if self.membership is not None:
+            await self.membership.start(self)
         if self.diag_settings:
             await self.start_diag(**self.diag_settings)
-        await self.start_workers()
+        if self.spawn_mode == 'zygote':
+            try:
+                await self.start_zygote()
+            except:
+                logger.critical("Failed to start zygote!")
+                self.stop()
+                await self.wait_stopped()
+                raise
+        try:
+            await self.start_workers()
+        except:
+            logger.critical("Failed to start workers!")
+            self.stop()
+            await self.wait_stopped()
+            raise
+        if self.autoscaler is not None:
+            self.autoscaler.start(self)
+        if self.diag_settings:
+            self._lag_task = self._loop.create_task(self._poll_loop_lag())
         logger.info("Coordinator Started")
 
+    def setup_placement(self):
+        """ Inspect CPU topology and move the coordinator onto any cores
+        reserved for it. """
+        self.placement.setup()
+        if self.placement.reserved:
+            _placement.set_affinity(psutil.Process(), self.placement.reserved)
+
+    def place_worker(self, wp):
+        """ Pin a worker to the CPUs assigned to its slot. """
+        if self.placement is None:
+            return
+        cpus = self.placement.worker_cpus(wp.slot)
+        if _placement.set_affinity(wp.util, cpus):
+            logger.debug("Worker %s pinned to CPUs: %s" % (wp.ident, cpus))
+
     async def start_rpc(self):
         """ Setup a service for rpc with workers. """
         self._ipc_dir = tempfile.TemporaryDirectory(prefix='aiocluster-')
         addr = 'ipc://%s/coord-rpc' % self._ipc_dir.name
         self._worker_config['coord_rpc_addr'] = addr
         self._worker_config['ipc_dir'] = self._ipc_dir.name
+        for name, source in self._shared_data.items():
+            await self.share(name, source)
         self.rpc_server = s = aionanomsg.RPCServer(aionanomsg.NN_REP)
         s.bind(addr)
         s.add_call(self.register_worker_rpc)
+        s.add_call(self.worker_ready)
         self._loop.create_task(s.start())
 
+    async def start_bus(self):
+        """ Serve the message bus broker to workers. """
+        path = os.path.join(self._ipc_dir.name, 'coord-bus')
+        self._worker_config['bus_addr'] = path
+        self._bus_server = await rpc.serve(path, self.bus.calls,
+                                           loop=self._loop,
+                                           **self._worker_config['rpc'])
+        self._forwarder = _bus.Forwarder(self._ipc_dir.name, loop=self._loop)
+        self._forwarder.start()
+        self._worker_config['pubsub_addrs'] = {
+            "pull": self._forwarder.pull_addr,
+            "pub": self._forwarder.pub_addr,
+        }
+
+    async def publish(self, topic, data):
+        """ Publish a message to every worker subscribed to `topic`. """
+        await self._forwarder.publish(topic, data)
+
+    async def stop_bus(self):
+        await self._forwarder.stop()
+        self._forwarder = None
+        self._bus_server.close()
+        for x in self._bus_server.channels:
+            x.close()
+        await self._bus_server.wait_closed()
+        self._bus_server = None
+
     async def stop_rpc(self):
         self.rpc_server.stop()
         await self.rpc_server.wait_stopped()
         self.rpc_server = None
+        self._boot_payload = None
+        for x in self.shared.values():
+            x.remove()
+        self.shared.clear()
+        self._worker_config['shared'].clear()
         self._ipc_dir.cleanup()
         self._ipc_dir = None
 
+    async def share(self, name, source, copy=False):
+        """ Share a read-only dataset with workers.  The `source` may be
+        bytes-like, a binary file object or a file path which is mapped in
+        place unless `copy` is set.  Workers started after this call can use
+        WorkerCommand.shared(name);  Use a rolling restart to hand it to
+        existing workers. """
+        if name in self.shared:
+            raise ValueError('Shared segment already exists: %s' % name)
+        segment = await self._loop.run_in_executor(None,
+            shared.SharedSegment.create, self._ipc_dir.name, name, source,
+            copy)
+        logger.info("Sharing data segment: %s" % segment)
+        self.shared[name] = segment
+        self._worker_config['shared'][name] = segment.handle()
+        self._boot_payload = None
+
+    def boot_payload(self):
+        """ Return the context for new workers;  It is serialized once and
+        shared by every spawn until it is refreshed. """
+        if self._boot_payload is None:
+            self._boot_payload = env.BootPayload(self._ipc_dir.name, {
+                "settings": self._worker_settings,
+                "config": self._worker_config,
+                "args": self._worker_args,
+            })
+            logger.debug("Created boot payload: %s" % self._boot_payload)
+        return self._boot_payload
+
     async def start_diag(self, **settings):
         self.diag = diag.DiagService(coordinator=self, loop=self._loop,
                                      **settings)
@@ -99,16 +255,182 @@ class Coordinator(object):
     async def stop_diag(self):
         await self.diag.stop()
 
-    async def start_workers(self):
-        logger.info("Starting %d workers" % self.worker_count)
+    async def start_zygote(self):
+        """ Start a template interpreter that new workers are forked from. """
+        z = zygote.Zygote(self.worker_spec,
+                          worker_settings=self._worker_settings,
+                          loop=self._loop)
+        await z.start()
+        self.zygote = z
+
+    async def stop_zygote(self):
+        await self.zygote.stop()
+        self.zygote = None
+        await self.reap_zygotes()
+
+    async def restart_zygote(self):
+        """ Start a new zygote so new workers import fresh code.  The old
+        zygote is kept until the workers it forked are gone. """
+        old = self.zygote
+        await self.start_zygote()
+        if old is not None:
+            self._retired_zygotes.append(old)
+
+    async def reap_zygotes(self):
+        """ Stop retired zygotes that no longer have workers. """
+        for x in list(self._retired_zygotes):
+            if not x.children or self._stopping:
+                self._retired_zygotes.remove(x)
+                await x.stop()
+
+    async def rolling_restart(self, surge=1, max_unavailable=0):
+        """ Replace every worker with a new process that re-imports the
+        worker spec.  At most `surge` workers above `worker_count` are run
+        and at most `max_unavailable` workers are stopped before their
+        replacements are ready.  Old workers are only stopped once their
+        replacements are ready, so with the default settings a `reuse_port`
+        style service keeps full capacity throughout. """
+        await self._rolling_restart(self._begin_restart(surge,
+                                                        max_unavailable))
+
+    def start_rolling_restart(self, surge=1, max_unavailable=0):
+        """ Start a rolling_restart() in the background and return its task.
+        The `restart_status` is set before this returns. """
+        status = self._begin_restart(surge, max_unavailable)
+        return self._loop.create_task(self._rolling_restart(status))
+
+    def _begin_restart(self, surge, max_unavailable):
+        if surge < 0 or max_unavailable < 0 or not (surge or max_unavailable):
+            raise ValueError('surge or max_unavailable must be positive')
+        if self.restart_status and not self.restart_status['finished']:
+            raise RuntimeError('Rolling restart already in progress')
+        self.restart_status = {
+            "started": time.time(),
+            "finished": None,
+            "surge": surge,
+            "max_unavailable": max_unavailable,
+            "total": len([x for x in self.workers.values()
+                          if not x.retired]),
+            "replaced": 0,
+            "error": None,
+        }
+        return self.restart_status
+
+    async def _rolling_restart(self, status):
+        surge = status['surge']
+        max_unavailable = status['max_unavailable']
+        old = [x for x in self.workers.values() if not x.retired]
+        step = surge + max_unavailable
+        old_payload = self._boot_payload
+        self._boot_payload = None  # Pick up config changes.
+        logger.warning("Rolling restart of %d workers (surge=%d, "
+                       "max_unavailable=%d)" % (len(old), surge,
+                       max_unavailable))
         try:
-            for i in range(self.worker_count):
-                await self.start_worker()
+            if self.zygote is not None:
+                await self.restart_zygote()
+            while old:
+                # Workers that died on their own were already restarted.
+                old = [x for x in old if x.state != 'exited']
+                batch, old = old[:step], old[step:]
+                if not batch:
+                    continue
+                early, late = batch[:max_unavailable], batch[max_unavailable:]
+                for x in batch:
+                    x.retired = True  # Frees the slot for its replacement.
+                try:
+                    if early:
+                        await self.stop_workers(early)
+                    await self.start_workers(len(batch))
+                except Exception:
+                    for x in late:
+                        if x.state != 'exited':
+                            x.retired = False  # Keep serving.
+                    raise
+                if late:
+                    await self.stop_workers(late)
+                status['replaced'] += len(batch)
+            await self.reap_zygotes()
+        except Exception as e:
+            logger.exception("Rolling restart failed")
+            status['error'] = '%s: %s' % (type(e).__name__, e)
+            active = sum(1 for x in self.workers.values()
+                         if not x.retired and x.state != 'exited')
+            if active < self.worker_count:
+                logger.critical("Rolling restart left the pool %d workers "
+                                "short" % (self.worker_count - active))
+                status['error'] += ' (%d workers short)' % (
+                    self.worker_count - active)
+            raise
+        finally:
+            if old_payload is not None and old_payload is not \
+               self._boot_payload:
+                old_payload.remove()
+            status['finished'] = time.time()
+        logger.warning("Rolling restart finished in %.1fs" % (
+                       status['finished'] - status['started']))
+
+    async def start_workers(self, count=None):
+        """ Start and wait for a batch of workers to be ready.  Either
+        every worker in the batch starts or the ones that did are stopped
+        before the error is raised. """
+        if count is None:
+            count = self.worker_count
+        logger.info("Starting %d workers" % count)
+        start = time.monotonic()
+        started = []
+        sem = asyncio.Semaphore(self.start_concurrency, loop=self._loop)
+
+        async def launch():
+            async with sem:
+                wp = await self.start_worker()
+                started.append(wp)
+                await self.wait_worker_ready(wp)
+
+        batch = [self._loop.create_task(launch()) for i in range(count)]
+        try:
+            await asyncio.gather(*batch, loop=self._loop)
         except:
-            logger.critical("Failed to start workers!")
-            self.stop()
-            await self.wait_stopped()
+            for x in batch:
+                x.cancel()
+            logger.error("Rolling back %d started workers" % len(started))
+            await self.stop_workers(started, drain=False)
             raise
+        elapsed = time.monotonic() - start
+        phases = ('exec', 'import', 'plugins', 'register')
+        avgs = ', '.join('%s=%.3fs' % (x, sum(wp.start_timings.get(x, 0)
+                                       for wp in started) / count)
+                         for x in phases)
+        logger.info("Started %d workers in %.3fs (avg: %s)" % (count,
+                    elapsed, avgs))
+
+    async def scale_workers(self, count):
+        """ Grow or shrink the worker pool to `count` workers.  Surplus
+        workers are drained before they are stopped, youngest first. """
+        if count < 1:
+            raise ValueError('Worker count must be positive')
+        current = self.worker_count
+        self.worker_count = count
+        if count > current:
+            try:
+                await self.start_workers(count - current)
+            except:
+                self.worker_count = current
+                raise
+        elif count < current:
+            active = sorted((x for x in self.workers.values()
+                             if not x.retired), key=lambda x: x.ident)
+            await self.stop_workers(active[count:])
+
+    async def wait_worker_ready(self, wp):
+        """ Wait for a worker to become ready.  Raise an error if it exits or
+        takes longer than `start_timeout`. """
+        if 'rpc' not in self._worker_config['plugins']:
+            return
+        try:
+            await wp.wait_ready(timeout=self.start_timeout)
+        except asyncio.TimeoutError:
+            raise RuntimeError("Worker startup timeout: %s" % wp)
 
     def add_signal_handlers(self):
         if self.handle_sigterm:
@@ -124,17 +446,41 @@ class Coordinator(object):
         if self.handle_sigint:
             self._loop.remove_signal_handler(signal.SIGINT)
 
-    async def start_worker(self):
+    def free_slot(self):
+        """ Return the lowest slot number not held by an active worker. """
+        used = set(x.slot for x in self.workers.values() if not x.retired)
+        used |= self._reserved_slots
+        slot = 0
+        while slot in used:
+            slot += 1
+        return slot
+
+    async def start_worker(self, slot=None):
         """ Create a worker process and start monitoring it. """
-        wp = await worker.spawn(self.worker_spec,
-                                worker_settings=self._worker_settings,
-                                worker_config=self._worker_config,
-                                worker_args=self._worker_args,
-                                loop=self._loop)
+        if slot is None:
+            slot = self.free_slot()
+        self._reserved_slots.add(slot)
+        try:
+            start = time.monotonic()
+            wp = await worker.spawn(self.worker_spec,
+                                    payload=self.boot_payload(),
+                                    zygote=self.zygote, slot=slot,
+                                    loop=self._loop)
+        finally:
+            self._reserved_slots.discard(slot)
+        wp.start_time = start
+        wp.start_timings['exec'] = time.monotonic() - start
+        self.place_worker(wp)
+        try:
+            history = self.slot_history[slot]
+        except KeyError:
+            history = self.slot_history[slot] = restart.SlotHistory(slot)
+        self.restart_policy.on_start(history, start)
         mt = self._loop.create_task(self.worker_monitor_wrap(wp))
         wp.monitor_task = mt
         self.workers[wp.ident] = wp
         self.monitors.append(mt)
+        return wp
 
     async def wait_stopped(self):
         """ Block until the coordinator and its workers are stopped. """
@@ -151,37 +497,29 @@ class Coordinator(object):
         logger.warning("Coordinator stopping")
         self._stopping = True
         self.remove_signal_handlers()
-        for x in self.workers.values():
+        if self.autoscaler is not None:
+            await self.autoscaler.stop()
+        if self._lag_task is not None:
+            self._lag_task.cancel()
             try:
-                x.process.terminate()
-            except ProcessLookupError:
+                await self._lag_task
+            except asyncio.CancelledError:
                 pass
-        if self.monitors:
-            logger.info("Waiting for %d workers to exit" % len(self.monitors))
-            pending = (await asyncio.wait(self.monitors,
-                                          timeout=self.term_timeout))[1]
-            if pending:
-                logger.warning("Timeout waiting for %d workers to exit" %
-                               len(pending))
-                for x in self.workers.values():
-                    logger.warning("Killing: %s" % x)
-                    try:
-                        x.process.kill()
-                    except ProcessLookupError:
-                        pass
-                logger.warning("Waiting for %d workers to reap" %
-                               len(self.monitors))
-                pending = (await asyncio.wait(self.monitors,
-                                              timeout=self.kill_timeout))[1]
-                if pending:
-                    undead = ', '.join(str(x.process.pid)
-                                       for x in self.workers.values())
-                    logger.critical("Detected %d zombie workers: %s" % (
-                                    len(pending), undead))
-                    for x in pending:
-                        x.cancel()
-        elif self.workers:
+            self._lag_task = None
+        if self.workers and not self.monitors:
             raise RuntimeError('unexpected workers/monitors mismatch')
+        await self.stop_workers(list(self.workers.values()))
+        if self.zygote:
+            await self.stop_zygote()
+        else:
+            await self.reap_zygotes()
+        if self.membership is not None and self.membership.running:
+            await self.membership.stop()
+        if self.federation is not None and \
+           self.federation.coordinator is not None:
+            await self.federation.stop()
+        if self._bus_server is not None:
+            await self.stop_bus()
         await self.stop_rpc()
         if self.diag:
             await self.stop_diag()
@@ -189,6 +527,104 @@ class Coordinator(object):
         logger.info("Coordinator Stopped")
         self._stopped.set()
 
+    async def drain_worker(self, wp):
+        """ Ask a worker to stop accepting work and wait up to `drain_timeout`
+        for its in-flight work to finish.  A worker that does not answer the
+        drain request within `drain_ack_timeout`, Eg. one with a blocked
+        loop, is not waited on.  Returns the number of in-flight units that
+        were cut off;  None means the count is unknown. """
+        if wp.rpc is None or wp.state == 'exited':
+            return 0
+        wp.set_state('draining')
+        start = time.monotonic()
+        inflight = None
+
+        async def drain():
+            nonlocal inflight
+            inflight = await wp.rpc.call('worker_drain',
+                                         timeout=self.drain_ack_timeout)
+            while inflight:
+                await asyncio.sleep(self.drain_poll_interval, loop=self._loop)
+                inflight = await wp.rpc.call('worker_inflight')
+
+        drained = self._loop.create_task(drain())
+        exited = self._loop.create_task(wp.wait_state('exited'))
+        try:
+            await asyncio.wait((drained, exited), timeout=self.drain_timeout,
+                               return_when=asyncio.FIRST_COMPLETED,
+                               loop=self._loop)
+        finally:
+            drained.cancel()
+            exited.cancel()
+        if exited.done() and not exited.cancelled():
+            cutoff = 0  # Exited on its own.
+        else:
+            if drained.done() and not drained.cancelled() and \
+               drained.exception() is not None:
+                logger.warning("Drain failed: %s: %s" % (wp,
+                               drained.exception()))
+            cutoff = inflight
+        elapsed = time.monotonic() - start
+        stats = self.stats['drain']
+        stats['workers'] += 1
+        stats['total_time'] += elapsed
+        stats['max_time'] = max(stats['max_time'], elapsed)
+        stats['last_time'] = elapsed
+        if cutoff == 0:
+            stats['clean'] += 1
+        elif cutoff is None:
+            logger.warning("Drain unanswered: %s" % wp)
+            stats['unresponsive'] += 1
+        else:
+            logger.warning("Drain timeout with %d in-flight: %s" % (cutoff,
+                           wp))
+            stats['cutoff'] += 1
+            stats['cutoff_inflight'] += cutoff
+        return cutoff
+
+    async def stop_workers(self, workers, drain=True):
+        """ Drain and then terminate workers without restarting them.
+        Workers that do not exit within `term_timeout` are killed. """
+        for x in workers:
+            x.retired = True
+        if drain and workers:
+            await asyncio.gather(*[self.drain_worker(x) for x in workers],
+                                 loop=self._loop)
+        monitors = {}
+        for x in workers:
+            if x.state != 'exited':
+                x.set_state('draining')
+            if x.monitor_task is not None:
+                monitors[x.monitor_task] = x
+            try:
+                x.process.terminate()
+            except ProcessLookupError:
+                pass
+        if not monitors:
+            return
+        logger.info("Waiting for %d workers to exit" % len(monitors))
+        pending = (await asyncio.wait(monitors, timeout=self.term_timeout,
+                                      loop=self._loop))[1]
+        if not pending:
+            return
+        logger.warning("Timeout waiting for %d workers to exit" %
+                       len(pending))
+        for x in pending:
+            logger.warning("Killing: %s" % monitors[x])
+            try:
+                monitors[x].process.kill()
+            except ProcessLookupError:
+                pass
+        logger.warning("Waiting for %d workers to reap" % len(pending))
+        pending = (await asyncio.wait(pending, timeout=self.kill_timeout,
+                                      loop=self._loop))[1]
+        if pending:
+            undead = ', '.join(str(monitors[x].process.pid) for x in pending)
+            logger.critical("Detected %d zombie workers: %s" % (
+                            len(pending), undead))
+            for x in pending:
+                x.cancel()
+
     def create_exit_sighandler(self, sig):
         """ Return a signal handler that will force a stop and then resend the
         signal once we are stopped. """
@@ -217,8 +653,17 @@ class Coordinator(object):
         """ Background task that babysits a worker process and signals us on
         exit/failure. """
         retcode = await wp.process.wait()
+        wp.set_state('exited')
+        if wp.rpc is not None:
+            wp.rpc.close()
         if retcode:
             logger.warning("Non-zero retcode (%d) from: %s" % (retcode, wp))
+        self.bus.release(wp.ident)
+        if not wp.retired and not self._stopping:
+            history = self.slot_history[wp.slot]
+            if self.restart_policy.on_exit(history, retcode, time.monotonic()):
+                logger.critical("Crash loop detected for worker slot %d; "
+                                "Circuit breaker tripped" % wp.slot)
         del self.workers[wp.ident]
         self.monitors.remove(wp.monitor_task)
         wp.monitor_task = None
@@ -226,15 +671,18 @@ class Coordinator(object):
 
     async def worker_restart_delay(self, wp):
         """ Delay a worker restart here to avoid spinning out of control if
-        there is trouble starting workers.  This version throttles more as
-        worker count goes up.  Subclasses may tweak the behavior as they see
-        fit. """
-        delay = math.log(1 + wp.ident) ** 2
-        logger.info("Delaying worker restart %d seconds" % round(delay))
-        await asyncio.sleep(delay, loop=self._loop)
+        there is trouble starting workers.  The delay is decided by the
+        restart policy using the history of the worker's slot.  Subclasses
+        may tweak the behavior as they see fit. """
+        history = self.slot_history[wp.slot]
+        delay = self.restart_policy.delay(history, time.monotonic())
+        if delay:
+            logger.info("Delaying worker slot %d restart %.1f seconds" % (
+                        wp.slot, delay))
+            await asyncio.sleep(delay, loop=self._loop)
 
     async def maybe_restart_worker(self, wp):
-        if self._stopping:
+        if self._stopping or wp.retired:
             return
         if not self.worker_restart:
             if not self.workers:
@@ -242,12 +690,112 @@ class Coordinator(object):
                 self.stop()
         else:
             await self.worker_restart_delay(wp)
-            await self.start_worker()
+            if self._stopping:
+                return
+            active = sum(1 for x in self.workers.values() if not x.retired)
+            if active >= self.worker_count:
+                logger.info("Skipping restart of slot %d; Pool is full" %
+                            wp.slot)
+                return
+            self._restart_times.append(time.monotonic())
+            await self.start_worker(slot=wp.slot)
+
+    def get_stats(self):
+        """ Return the stats dict after refreshing computed values. """
+        now = time.monotonic()
+        window = 60
+        while self._restart_times and self._restart_times[0] <= now - window:
+            self._restart_times.popleft()
+        slots = [x.as_dict(now) for x in self.slot_history.values()]
+        self.stats['restarts'] = {
+            "total": sum(x['restarts'] for x in slots),
+            "per_minute": len(self._restart_times) * 60 / window,
+            "tripped_slots": [x['slot'] for x in slots if x['tripped']],
+            "slots": slots,
+        }
+        self.stats['bus'] = self.bus.get_stats()
+        if self._forwarder is not None:
+            self.stats['bus']['pubsub'] = self._forwarder.stats
+        if self.membership is not None:
+            self.stats['membership'] = self.membership.get_stats()
+        return self.stats
 
     async def register_worker_rpc(self, worker_ident, rpc_addr):
         logger.debug("Registered worker RPC server: %s %s" % (worker_ident,
                      rpc_addr))
-        rpc = aionanomsg.RPCClient(aionanomsg.NN_REQ)
-        rpc.connect(rpc_addr)
+        wp = self.workers[worker_ident]
+        # Time from the process being spawned until it registered;  The
+        # import time is taken out when the worker reports it at ready.
+        wp.start_timings['register'] = time.monotonic() - wp.start_time - \
+            wp.start_timings['exec']
         # XXX Use cleaner technique for adding rpc handler to worker proxy.
-        self.workers[worker_ident].rpc = rpc
+        wp.rpc = await rpc.Channel.connect(rpc_addr, loop=self._loop,
+                                           **self._worker_config['rpc'])
+        wp.set_state('registered')
+
+    async def _poll_loop_lag(self):
+        """ Keep the latest loop_monitor report of each worker in `loop_lag`
+        so diag pages don't wait on slow workers. """
+        while True:
+            try:
+                report = await self.broadcast('loop_monitor', slow_limit=0,
+                    timeout=self.lag_poll_interval)
+                self.loop_lag = report['results']
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Loop lag poll error")
+            await asyncio.sleep(self.lag_poll_interval, loop=self._loop)
+
+    async def broadcast(self, call, *args, timeout=None, workers=None,
+                        **kwargs):
+        """ Make an RPC call on many workers at once and wait up to
+        `timeout` seconds for them to answer.  By default every worker with a
+        live RPC connection is called.  Stragglers do not hold up the
+        results;  The return value is a dict of results keyed by worker ident
+        along with the idents that timed out and errors by worker ident. """
+        if timeout is None:
+            timeout = self.broadcast_timeout
+        results = {}
+        errors = {}
+        timeouts = []
+        if workers is None:
+            workers = [x for x in self.workers.values()
+                       if x.rpc is not None and x.state != 'exited']
+        else:
+            for x in workers:
+                if x.rpc is None:
+                    errors[x.ident] = 'RPC not connected'
+            workers = [x for x in workers if x.rpc is not None]
+        start = time.monotonic()
+        batch = [x.rpc.call(call, *args, timeout=timeout, **kwargs)
+                 for x in workers]
+        outcomes = await asyncio.gather(*batch, loop=self._loop,
+                                        return_exceptions=True)
+        for wp, outcome in zip(workers, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                timeouts.append(wp.ident)
+            elif isinstance(outcome, Exception):
+                errors[wp.ident] = str(outcome)
+            else:
+                results[wp.ident] = outcome
+        if timeouts:
+            logger.warning("Broadcast of %s timed out for workers: %s" % (
+                           call, ', '.join(map(str, timeouts))))
+        return {
+            "results": results,
+            "errors": errors,
+            "timeouts": timeouts,
+            "elapsed": time.monotonic() - start,
+        }
+
+    async def worker_ready(self, worker_ident, timings=None):
+        """ Called by workers when they are able to do work. """
+        wp = self.workers[worker_ident]
+        wp.start_timings.update(timings or {})
+        if 'register' in wp.start_timings:
+            wp.start_timings['register'] = max(wp.start_timings['register'] -
+                                               wp.start_timings.get('import',
+                                                                    0), 0)
+        wp.start_timings['total'] = time.monotonic() - wp.start_time
+        wp.set_state('ready')
@@ -168,6 +168,49 @@ class Resource(AbstractRoute):
             raise web.HTTPBadRequest(text='Invalid query: %s' % str(e))
         return await coro
 
+    def get_timeout(self, values):
+        """ Parse an optional `timeout` query argument. """
+        if not values or not values[0]:
+            return None
+        try:
+            timeout = float(values[0])
+        except ValueError:
+            raise web.HTTPBadRequest(text='Invalid timeout: %s' % values[0])
+        if timeout <= 0:
+            raise web.HTTPBadRequest(text='Timeout must be positive')
+        return timeout
+
+    def get_flag(self, values):
+        """ Parse an optional boolean query argument. """
+        if not values:
+            return False
+        value = values[0].lower()
+        if value in ('', '1', 'true', 'yes', 'on'):
+            return True
+        elif value in ('0', 'false', 'no', 'off'):
+            return False
+        raise web.HTTPBadRequest(text='Invalid flag: %s' % values[0])
+
+    def get_int(self, values, name, minimum=1):
+        """ Parse an optional integer query argument. """
+        if not values or not values[0]:
+            return None
+        try:
+            value = int(values[0])
+        except ValueError:
+            raise web.HTTPBadRequest(text='Invalid %s: %s' % (name,
+                                     values[0]))
+        if value < minimum:
+            raise web.HTTPBadRequest(text='%s must be at least %d' % (name,
+                                     minimum))
+        return value
+
+    def get_federation(self, coord):
+        """ The federation used to answer `cluster` queries. """
+        if coord.federation is None:
+            raise web.HTTPBadRequest(text='Federation not enabled')
+        return coord.federation
+
     async def get_request_content(self, request):
         """ Read JSON content from a request content body and return a proper
         HTTP error if the value is invalid. """
@@ -2,12 +2,19 @@
 Route URLs to correct resource handler.
 """
 
-from . import profiler, memory, ps, about
+from . import profiler, memory, ps, about, restart, stats, bus, nodes, \
+    membership, looplag
 from .. import util
 
 router = util.Router({
     'profiler': profiler.ProfilerRouter,
     'memory': memory.MemoryResource(),
     'ps': ps.PSResource(),
-    'about': about.AboutResource()
+    'about': about.AboutResource(),
+    'restart': restart.RestartResource(),
+    'stats': stats.StatsResource(),
+    'bus': bus.BusResource(),
+    'nodes': nodes.NodesResource(),
+    'membership': membership.MembershipResource(),
+    'looplag': looplag.LoopLagResource(),
 }, desc="Version 1 API endpoints.")
@@ -39,6 +39,9 @@ class AboutResource(util.Resource):
                 "ident": coord.ident,
                 "worker_spec": coord.worker_spec,
                 "worker_count": coord.worker_count,
+                "spawn_mode": coord.spawn_mode,
+                "start_concurrency": coord.start_concurrency,
+                "start_timeout": coord.start_timeout,
                 "worker_args": coord._worker_args,
                 "worker_config": coord._worker_config,
                 "worker_settings": coord._worker_settings,
@@ -47,6 +50,31 @@ class AboutResource(util.Resource):
                 "handle_sigterm": coord.handle_sigterm,
                 "term_timeout": coord.term_timeout,
                 "kill_timeout": coord.kill_timeout,
+                "drain_timeout": coord.drain_timeout,
+                "restart_policy": vars(coord.restart_policy),
+                "autoscaler": coord.autoscaler and {
+                    "policies": [type(x).__name__
+                                 for x in coord.autoscaler.policies],
+                    "min_workers": coord.autoscaler.min_workers,
+                    "max_workers": coord.autoscaler.max_workers,
+                    "interval": coord.autoscaler.interval,
+                },
+                "federation": coord.federation and {
+                    "addr": '%s:%d' % tuple(coord.federation.addr),
+                    "discovery": type(coord.federation.discovery).__name__,
+                },
+                "membership": coord.membership and {
+                    "addr": '%s:%d' % tuple(coord.membership.addr),
+                    "transport": type(coord.membership.transport).__name__,
+                    "protocol_period": coord.membership.protocol_period,
+                    "suspicion_timeout":
+                        coord.membership.suspicion_timeout(),
+                },
+                "placement": coord.placement and {
+                    "policy": type(coord.placement).__name__,
+                    "reserved": coord.placement.reserved,
+                    "nodes": coord.placement.nodes,
+                },
             },
             "system": {
                 "system": platform.system(),
@@ -0,0 +1,19 @@
+"""
+/api/v1/bus handler for message bus queues and subscribers.
+"""
+
+from .. import util
+from .... import coordinator
+
+
+class BusResource(util.Resource):
+    """ Queue depths and subscriber buffer/drop counters. """
+
+    use_docstring = True
+
+    async def get(self, request, timeout=None):
+        coord = coordinator.get_coordinator()
+        stats = coord.get_stats()['bus']
+        stats['workers'] = await coord.broadcast('bus_stats',
+            timeout=self.get_timeout(timeout))
+        return stats
@@ -0,0 +1,38 @@
+"""
+/api/v1/looplag handler for the event loop lag monitor.
+"""
+
+from aiohttp import web
+from .. import util
+from ... import merge as diag_merge
+from .... import coordinator
+
+
+class LoopLagResource(util.Resource):
+    """ Event loop lag percentiles and histograms for each worker, covering
+    the last few minutes or with `window=total` the life of the worker.
+    Slow callbacks are listed with the stack that was blocking the loop;
+    `slow` limits how many.  With `merge` the workers are combined into one
+    histogram and with `cluster` every node is. """
+
+    use_docstring = True
+    windows = ('recent', 'total')
+
+    async def get(self, request, timeout=None, cluster=None, merge=None,
+                  window=['recent'], slow=None):
+        coord = coordinator.get_coordinator()
+        timeout = self.get_timeout(timeout)
+        if window[0] not in self.windows:
+            raise web.HTTPBadRequest(text='Invalid window: %s' % window[0])
+        slow_limit = self.get_int(slow, 'slow', minimum=0)
+        merger = diag_merge.LoopLagMerger(slow_limit=slow_limit)
+        if self.get_flag(cluster):
+            return await diag_merge.cluster_broadcast(
+                self.get_federation(coord), 'loop_monitor', merger,
+                timeout=timeout, window=window[0], slow_limit=slow_limit)
+        report = await coord.broadcast('loop_monitor', timeout=timeout,
+                                       window=window[0],
+                                       slow_limit=slow_limit)
+        if self.get_flag(merge):
+            report = diag_merge.merge_broadcast(report, merger)
+        return report
@@ -0,0 +1,24 @@
+"""
+/api/v1/membership handler for the gossip view of the cluster.
+"""
+
+from aiohttp import web
+from .. import util
+from .... import coordinator
+
+
+class MembershipResource(util.Resource):
+    """ Coordinators known through gossip and their liveness state. """
+
+    use_docstring = True
+
+    async def get(self, request):
+        coord = coordinator.get_coordinator()
+        if coord.membership is None:
+            raise web.HTTPNotFound(text='Membership not enabled')
+        return {
+            "ident": coord.ident,
+            "suspicion_timeout": coord.membership.suspicion_timeout(),
+            "view": coord.membership.view(),
+            "stats": coord.membership.get_stats(),
+        }
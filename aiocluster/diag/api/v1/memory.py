@@ -2,14 +2,15 @@
 /api/v1/memory handler
 """
 
-import asyncio
 from aiohttp import web
 from .. import util
+from ... import merge
 from .... import coordinator
 
 
 class MemoryResource(util.Resource):
-    """ Memory utilization counters by object type. """
+    """ Memory utilization counters by object type.  With `cluster` the
+    counts from every node are summed with a breakdown by node. """
 
     use_docstring = True
 
@@ -21,14 +22,20 @@ class MemoryResource(util.Resource):
             self._coord = coordinator.get_coordinator()
             return self._coord
 
-    async def get(self, request, type=['mostcommon']):
+    async def get(self, request, type=['mostcommon'], timeout=None,
+                  cluster=None):
         type = type[0]
         if type == 'mostcommon':
-            batch = [x.rpc.call('memory_report')
-                     for x in self.coord.workers.values()]
+            call = 'memory_report'
+            merger = merge.CountMerger
         elif type == 'growth':
-            batch = [x.rpc.call('memory_growth')
-                     for x in self.coord.workers.values()]
+            call = 'memory_growth'
+            merger = merge.GrowthMerger
         else:
             raise web.HTTPBadRequest(text='Invalid type: %s' % type)
-        return await asyncio.gather(*batch)
+        timeout = self.get_timeout(timeout)
+        if self.get_flag(cluster):
+            return await merge.cluster_broadcast(
+                self.get_federation(self.coord), call,
+                merger(breakdown=True), timeout=timeout)
+        return await self.coord.broadcast(call, timeout=timeout)
@@ -0,0 +1,23 @@
+"""
+/api/v1/nodes handler for federated coordinator peers.
+"""
+
+from aiohttp import web
+from .. import util
+from .... import coordinator
+
+
+class NodesResource(util.Resource):
+    """ Peer coordinators this node is federated with. """
+
+    use_docstring = True
+
+    async def get(self, request):
+        coord = coordinator.get_coordinator()
+        if coord.federation is None:
+            raise web.HTTPNotFound(text='Federation not enabled')
+        return {
+            "ident": coord.ident,
+            "addr": '%s:%d' % tuple(coord.federation.addr),
+            "peers": await coord.federation.nodes.get_peers(),
+        }
@@ -2,9 +2,10 @@
 /api/v1/profiler handler
 """
 
-import asyncio
 import logging
 from .. import util
+from ... import flamegraph, merge as diag_merge
+from ...worker import tasks
 from .... import coordinator
 from aiohttp import web
 
@@ -12,7 +13,9 @@ logger = logging.getLogger('api.v1.profiler')
 
 
 class ActiveResource(util.Resource):
-    """ View and control the profiler state. """
+    """ View and control the profiler state.  When activating, the `mode`
+    can be `deterministic` (cProfile) or `sampling` with `hz` and `timer`
+    (cpu or wall) settings. """
 
     use_docstring = True
     allowed_methods = {
@@ -20,33 +23,216 @@ class ActiveResource(util.Resource):
         'PUT'
     }
 
-    async def put(self, request):
+    async def put(self, request, timeout=None, cluster=None, mode=None,
+                  hz=None, timer=None):
         active = await self.get_request_content(request)
         if not isinstance(active, bool):
             raise  web.HTTPBadRequest(text='Bool type expected')
-        workers = coordinator.get_coordinator().workers.values()
-        batch = [x.rpc.call('profiler_set_active', active) for x in workers]
-        return await asyncio.gather(*batch)
+        options = {}
+        if mode:
+            options['mode'] = mode[0]
+        if hz:
+            options['hz'] = self.get_int(hz, 'hz')
+        if timer:
+            options['timer'] = timer[0]
+        return await self.broadcast('profiler_set_active', active,
+                                    timeout=timeout, cluster=cluster,
+                                    **options)
 
-    async def get(self, request):
-        workers = coordinator.get_coordinator().workers.values()
-        batch = [x.rpc.call('profiler_get_active') for x in workers]
-        return await asyncio.gather(*batch)
+    async def get(self, request, timeout=None, cluster=None):
+        return await self.broadcast('profiler_get_active', timeout=timeout,
+                                    cluster=cluster)
+
+    async def broadcast(self, call, *args, timeout=None, cluster=None,
+                        **kwargs):
+        coord = coordinator.get_coordinator()
+        timeout = self.get_timeout(timeout)
+        if self.get_flag(cluster):
+            return await diag_merge.cluster_broadcast(
+                self.get_federation(coord), call, diag_merge.KeyedMerger(),
+                *args, timeout=timeout, **kwargs)
+        return await coord.broadcast(call, *args, timeout=timeout, **kwargs)
+
+
+class StatusResource(ActiveResource):
+    """ Profiler mode and sampler stats for each worker. """
+
+    allowed_methods = {
+        'GET'
+    }
+
+    async def get(self, request, timeout=None, cluster=None):
+        return await self.broadcast('profiler_get_status', timeout=timeout,
+                                    cluster=cluster)
 
 
 class ReportResource(util.Resource):
-    """ Gather profiler stats from all workers. """
+    """ Gather profiler stats from all workers.  Workers merge their stats by
+    function and return only the top `limit` entries by `sortby`.  With
+    `merge` the coordinator merges the workers into one report and with
+    `cluster` every node is merged.  Callers are left out unless
+    `include_callers` is set. """
 
     use_docstring = True
 
-    async def get(self, request):
-        workers = coordinator.get_coordinator().workers.values()
-        batch = [x.rpc.call('profiler_report') for x in workers]
-        return await asyncio.gather(*batch)
+    async def get(self, request, timeout=None, cluster=None, merge=None,
+                  sortby=None, limit=None, include_callers=None):
+        coord = coordinator.get_coordinator()
+        timeout = self.get_timeout(timeout)
+        sortby = sortby and sortby[0]
+        try:
+            merger = diag_merge.ProfileMerger(
+                sortby=sortby, limit=self.get_int(limit, 'limit'))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        options = dict(merger.options(),
+                       include_callers=self.get_flag(include_callers))
+        if self.get_flag(cluster):
+            return await diag_merge.cluster_broadcast(
+                self.get_federation(coord), 'profiler_report', merger,
+                timeout=timeout, **options)
+        report = await coord.broadcast('profiler_report', timeout=timeout,
+                                       **options)
+        if self.get_flag(merge):
+            report = diag_merge.merge_broadcast(report, merger)
+        return report
+
+
+class TasksResource(util.Resource):
+    """ Time spent in asyncio tasks from the `tasks` profiler mode, grouped
+    by coroutine or with `group_by=name` by task name.  Each worker returns
+    its top `limit` groups by `sortby`;  `merge` and `cluster` work the same
+    as for the report. """
+
+    use_docstring = True
+
+    async def get(self, request, timeout=None, cluster=None, merge=None,
+                  group_by=['coroutine'], sortby=None, limit=None):
+        coord = coordinator.get_coordinator()
+        timeout = self.get_timeout(timeout)
+        try:
+            merger = diag_merge.TaskMerger(
+                sortby=sortby and sortby[0],
+                limit=self.get_int(limit, 'limit'))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        if group_by[0] not in tasks.TaskProfile.group_fields:
+            raise web.HTTPBadRequest(text='Invalid group_by: %s' %
+                                     group_by[0])
+        options = dict(merger.options(), group_by=group_by[0])
+        if self.get_flag(cluster):
+            return await diag_merge.cluster_broadcast(
+                self.get_federation(coord), 'profiler_tasks', merger,
+                timeout=timeout, **options)
+        report = await coord.broadcast('profiler_tasks', timeout=timeout,
+                                       **options)
+        if self.get_flag(merge):
+            report = diag_merge.merge_broadcast(report, merger)
+        return report
+
+
+class HistoryResource(util.Resource):
+    """ Function report from the continuous profiler for a range of minutes
+    ago;  `window=5` is the last 5 minutes and `window=30-20` is from 30 to
+    20 minutes ago.  With a `baseline` range each function also has its
+    baseline time and the `change` in CPU seconds per second, sorted so
+    regressions come first.  `merge`, `cluster`, `sortby` and `limit` work
+    the same as for the report. """
+
+    use_docstring = True
+
+    def get_range(self, values, name):
+        """ Parse `N` or `FROM-TO` minutes ago into seconds ago. """
+        value = values[0]
+        start, sep, end = value.partition('-')
+        try:
+            start = float(start)
+            end = float(end) if sep else 0
+        except ValueError:
+            raise web.HTTPBadRequest(text='Invalid %s: %s' % (name, value))
+        if start <= end or end < 0:
+            raise web.HTTPBadRequest(text='Invalid %s: %s' % (name, value))
+        return [start * 60, end * 60]
+
+    async def get(self, request, timeout=None, cluster=None, merge=None,
+                  window=['5'], baseline=None, sortby=None, limit=None):
+        coord = coordinator.get_coordinator()
+        timeout = self.get_timeout(timeout)
+        options = {"window": self.get_range(window, 'window')}
+        if baseline:
+            options['baseline'] = self.get_range(baseline, 'baseline')
+        sortby = sortby and sortby[0]
+        if sortby is None:
+            sortby = 'change' if baseline else 'inlinetime'
+        try:
+            merger = diag_merge.HistoryMerger(
+                sortby=sortby, limit=self.get_int(limit, 'limit'))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        options.update(merger.options())
+        if self.get_flag(cluster):
+            return await diag_merge.cluster_broadcast(
+                self.get_federation(coord), 'profiler_history', merger,
+                timeout=timeout, **options)
+        report = await coord.broadcast('profiler_history', timeout=timeout,
+                                       **options)
+        if self.get_flag(merge):
+            report = diag_merge.merge_broadcast(report, merger)
+        return report
+
+
+class StacksResource(util.Resource):
+    """ Stack samples from the sampling profiler merged across workers, or
+    with `cluster` across every node.  Frames are listed once and each stack
+    is a list of frame indexes from the root down with its sample count. """
+
+    use_docstring = True
+
+    async def get(self, request, timeout=None, cluster=None):
+        return await self.get_stacks(timeout, cluster)
+
+    async def get_stacks(self, timeout, cluster):
+        coord = coordinator.get_coordinator()
+        timeout = self.get_timeout(timeout)
+        if self.get_flag(cluster):
+            return await diag_merge.cluster_broadcast(
+                self.get_federation(coord), 'profiler_stacks',
+                diag_merge.StackMerger(), timeout=timeout)
+        report = await coord.broadcast('profiler_stacks', timeout=timeout)
+        return diag_merge.merge_broadcast(report, diag_merge.StackMerger())
+
+
+class FlameGraphResource(StacksResource):
+    """ Flame graph of the sampling profiler's stacks from all workers.  The
+    `format` is `folded` text, `speedscope` JSON or a `tree` for the web UI.
+    """
+
+    async def get(self, request, timeout=None, cluster=None,
+                  format=['folded']):
+        format = format[0]
+        if format not in flamegraph.formats:
+            raise web.HTTPBadRequest(text='Invalid format: %s' % format)
+        report = await self.get_stacks(timeout, cluster)
+        folded = report['results']
+        if format == 'folded':
+            return web.Response(text='\n'.join(
+                flamegraph.folded_lines(folded)) + '\n')
+        elif format == 'speedscope':
+            return flamegraph.speedscope(folded)
+        else:
+            report['results'] = flamegraph.tree(folded)
+            report['samples'] = folded['samples']
+            report['sampled_time'] = folded['elapsed']
+            return report
 
 
 ProfilerRouter = util.Router({
     'active': ActiveResource(),
+    'status': StatusResource(),
     'report': ReportResource(),
+    'tasks': TasksResource(),
+    'history': HistoryResource(),
+    'stacks': StacksResource(),
+    'flamegraph': FlameGraphResource(),
 }, desc="Profiler endpoints.")
 
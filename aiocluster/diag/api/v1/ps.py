@@ -5,11 +5,38 @@
 import psutil
 import time
 from .. import util
-from .... import coordinator
+from .... import coordinator, placement
+
+
+def memory_breakdown(ps):
+    """ Split resident memory into shared and private parts.  Uses the
+    unique set size where the platform and our permissions allow it. """
+    try:
+        full = ps.memory_full_info()
+    except (psutil.AccessDenied, AttributeError):
+        full = None
+    if full is not None and hasattr(full, 'uss'):
+        return {
+            "rss": full.rss,
+            "private": full.uss,
+            "shared": full.rss - full.uss,
+            "pss": getattr(full, 'pss', None),
+        }
+    mem = ps.memory_info()
+    shared = getattr(mem, 'shared', None)
+    return {
+        "rss": mem.rss,
+        "private": None if shared is None else mem.rss - shared,
+        "shared": shared,
+        "pss": None,
+    }
 
 
 class PSResource(util.Resource):
-    """ Process information. """
+    """ Process information.  Workers include their event loop lag
+    percentiles from the coordinator's last poll;  A worker that did not
+    answer it has none.  With `cluster` a summary of the workers on every
+    node is returned instead. """
 
     use_docstring = True
     cproc = psutil.Process()
@@ -19,8 +46,10 @@ class PSResource(util.Resource):
         'KILL'
     }
 
-    async def get(self, request):
+    async def get(self, request, cluster=None):
         coord = coordinator.get_coordinator()
+        if self.get_flag(cluster):
+            return await self.get_cluster(self.get_federation(coord))
         workers = []
         now = time.time()
         for worker in coord.workers.values():
@@ -28,14 +57,23 @@ class PSResource(util.Resource):
             with ps.oneshot():
                 workers.append({
                     "ident": worker.ident,
+                    "state": worker.state,
+                    "slot": worker.slot,
                     "age": now - ps.create_time(),
                     "pid": ps.pid,
                     "threads": ps.num_threads(),
                     "cpu_percent": ps.cpu_percent(),
                     "cpu_times": ps.cpu_times()._asdict(),
                     "memory": ps.memory_info()._asdict(),
+                    "memory_breakdown": memory_breakdown(ps),
                     "status": ps.status(),
-                    "open_files": ps.num_fds()
+                    "open_files": ps.num_fds(),
+                    "start_timings": worker.start_timings,
+                    "cpu_affinity": placement.get_affinity(ps),
+                    "placement": coord.placement and
+                        coord.placement.describe(worker.slot),
+                    "loop_lag": self.lag_summary(
+                        coord.loop_lag.get(worker.ident)),
                 })
         with self.cproc.oneshot():
             return {
@@ -46,12 +84,48 @@ class PSResource(util.Resource):
                     "cpu_percent": self.cproc.cpu_percent(),
                     "cpu_times": self.cproc.cpu_times()._asdict(),
                     "memory": self.cproc.memory_info()._asdict(),
+                    "memory_breakdown": memory_breakdown(self.cproc),
                     "status": self.cproc.status(),
                     "open_files": self.cproc.num_fds(),
+                    "cpu_affinity": placement.get_affinity(self.cproc),
                 },
-                "workers": workers
+                "workers": workers,
+                "shared_segments": [{
+                    "name": x.name,
+                    "path": x.path,
+                    "size": x.size,
+                } for x in coord.shared.values()]
             }
 
+    def lag_summary(self, report):
+        if report is None:
+            return None
+        return dict(report['percentiles'], max=report['histogram']['max'],
+                    slow_count=report['slow_count'])
+
+    async def get_cluster(self, federation):
+        nodes = {}
+        totals = {
+            "nodes": 0,
+            "workers": 0,
+            "cpu_percent": 0,
+            "rss": 0,
+        }
+
+        def add(node, workers):
+            nodes[node] = workers
+            totals['nodes'] += 1
+            totals['workers'] += len(workers)
+            for x in workers:
+                totals['cpu_percent'] += x.get('cpu_percent', 0)
+                totals['rss'] += x.get('rss', 0)
+        errors = await federation.each('workers_get_metrics', add)
+        return {
+            "nodes": nodes,
+            "totals": totals,
+            "errors": errors,
+        }
+
     async def kill(self, request):
         """ Kill a worker process. """
         ident = await self.get_request_content(request)
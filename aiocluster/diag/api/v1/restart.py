@@ -0,0 +1,56 @@
+"""
+/api/v1/restart handler for rolling restarts of the worker pool.
+"""
+
+import logging
+from aiohttp import web
+from .. import util
+from .... import coordinator
+
+logger = logging.getLogger('api.v1.restart')
+
+
+class RestartResource(util.Resource):
+    """ View and start rolling restarts of the worker pool. """
+
+    use_docstring = True
+    allowed_methods = {
+        'GET',
+        'PUT'
+    }
+
+    async def get(self, request):
+        return coordinator.get_coordinator().restart_status
+
+    async def put(self, request):
+        """ Start a rolling restart in the background.  The optional content
+        is a JSON object with `surge` and `max_unavailable` values. """
+        if (await request.read()).strip():
+            options = await self.get_request_content(request)
+        else:
+            options = {}
+        if not isinstance(options, dict):
+            raise web.HTTPBadRequest(text='Object type expected')
+        unexpected = set(options) - {'surge', 'max_unavailable'}
+        if unexpected:
+            raise web.HTTPBadRequest(text='Invalid options: %s' %
+                                     ', '.join(sorted(unexpected)))
+        for x in options.values():
+            if not isinstance(x, int) or isinstance(x, bool) or x < 0:
+                raise web.HTTPBadRequest(text='Non-negative int expected')
+        coord = coordinator.get_coordinator()
+        try:
+            task = coord.start_rolling_restart(
+                surge=options.get('surge', 1),
+                max_unavailable=options.get('max_unavailable', 0))
+        except RuntimeError as e:
+            raise web.HTTPConflict(text=str(e))
+        except ValueError as e:
+            raise web.HTTPBadRequest(text=str(e))
+        task.add_done_callback(self.on_done)
+        return True
+
+    def on_done(self, task):
+        """ Failures are logged and recorded by the coordinator. """
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,15 @@
+"""
+/api/v1/stats handler for coordinator counters.
+"""
+
+from .. import util
+from .... import coordinator
+
+
+class StatsResource(util.Resource):
+    """ Coordinator counters and timing metrics. """
+
+    use_docstring = True
+
+    async def get(self, request):
+        return coordinator.get_coordinator().get_stats()
@@ -0,0 +1,91 @@
+"""
+Flame graph formats for folded stack samples.
+
+Input is the compact form from the sampling profiler:  A list of frames
+and a list of `[frame indexes from the root down, sample count]` stacks.
+Output is one of...
+
+    folded      Brendan Gregg's `root;child;leaf count` lines, for
+                flamegraph.pl and most other flame graph tools.
+    speedscope  JSON for https://www.speedscope.app
+    tree        Nested nodes for drawing in the diag UI.
+"""
+
+import os
+
+formats = ('folded', 'speedscope', 'tree')
+
+
+def frame_name(frame):
+    file, function, lineno = frame
+    return '%s (%s:%d)' % (function, os.path.basename(file), lineno)
+
+
+def folded_lines(folded):
+    names = [frame_name(x).replace(';', ':') for x in folded['frames']]
+    for refs, count in folded['stacks']:
+        yield '%s %d' % (';'.join(names[x] for x in refs), count)
+
+
+def sample_period(folded):
+    if folded['samples']:
+        return folded['elapsed'] / folded['samples']
+    return 1 / folded['hz'] if folded['hz'] else 0
+
+
+def speedscope(folded, name='aiocluster'):
+    """ A speedscope "sampled" profile weighted in seconds. """
+    period = sample_period(folded)
+    weights = [count * period for refs, count in folded['stacks']]
+    return {
+        "$schema": 'https://www.speedscope.app/file-format-schema.json',
+        "name": name,
+        "exporter": 'aiocluster',
+        "activeProfileIndex": 0,
+        "shared": {
+            "frames": [{
+                "name": x[1],
+                "file": x[0],
+                "line": x[2],
+            } for x in folded['frames']],
+        },
+        "profiles": [{
+            "type": 'sampled',
+            "name": name,
+            "unit": 'seconds',
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": [refs for refs, count in folded['stacks']],
+            "weights": weights,
+        }],
+    }
+
+
+def tree(folded, min_fraction=0.001):
+    """ Merge stacks into a tree of `{"name", "value", "children"}` nodes.
+    Nodes smaller than `min_fraction` of the total are dropped to keep the
+    result small. """
+    names = [frame_name(x) for x in folded['frames']]
+    root = {"name": 'all', "value": 0, "children": {}}
+    for refs, count in folded['stacks']:
+        root['value'] += count
+        node = root
+        for x in refs:
+            child = node['children'].get(x)
+            if child is None:
+                child = node['children'][x] = {
+                    "name": names[x],
+                    "value": 0,
+                    "children": {},
+                }
+            child['value'] += count
+            node = child
+    cutoff = root['value'] * min_fraction
+
+    def prune(node):
+        children = [prune(x) for x in node['children'].values()
+                    if x['value'] >= cutoff]
+        children.sort(key=lambda x: x['name'])
+        node['children'] = children
+        return node
+    return prune(root)
@@ -0,0 +1,77 @@
+"""
+Fixed size histograms for latency style measurements.
+
+Values are counted in buckets with fixed upper bounds so memory use does not
+grow with the number of values and histograms from many workers can be
+merged by adding their counts.  Percentiles are estimated by interpolating
+inside the bucket they land in.
+"""
+
+import bisect
+
+# Seconds;  The last bucket holds everything past the last bound.
+default_bounds = (0.0005, 0.001, 0.002, 0.005, 0.010, 0.020, 0.050, 0.100,
+                  0.200, 0.500, 1, 2, 5, 10)
+default_percentiles = (50, 90, 99, 99.9)
+
+
+class Histogram(object):
+
+    def __init__(self, bounds=default_bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.max = 0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def update(self, other):
+        """ Add the counts of another histogram or its `as_dict()` form. """
+        if isinstance(other, Histogram):
+            other = other.as_dict()
+        if tuple(other['bounds']) != self.bounds:
+            raise ValueError('Histogram bounds differ')
+        for i, x in enumerate(other['counts']):
+            self.counts[i] += x
+        self.count += other['count']
+        self.sum += other['sum']
+        self.max = max(self.max, other['max'])
+
+    def percentile(self, pct):
+        if not self.count:
+            return None
+        rank = self.count * pct / 100
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low = self.bounds[i - 1] if i else 0
+                high = self.bounds[i] if i < len(self.bounds) else self.max
+                value = low + (high - low) * (rank - seen) / count
+                return min(value, self.max)
+            seen += count
+        return self.max
+
+    def percentiles(self, pcts=default_percentiles):
+        """ Percentiles keyed like `p99`. """
+        return dict(('p%g' % x, self.percentile(x)) for x in pcts)
+
+    def as_dict(self):
+        return {
+            "bounds": list(self.bounds),
+            "counts": list(self.counts),
+            "count": self.count,
+            "sum": self.sum,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        hist = cls(bounds=data['bounds'])
+        hist.update(data)
+        return hist
@@ -0,0 +1,426 @@
+"""
+Merge diagnostic reports from many workers and nodes.
+
+Mergers fold in one report at a time with `add()` so results can be merged
+as they arrive instead of being collected first.  Each node merges its own
+workers before answering a cluster wide query so the node asking only ever
+merges one compact report per node.
+"""
+
+import heapq
+from . import histogram
+
+
+def call_key(call):
+    return call['file'], call['function'], call['lineno']
+
+
+def top(entries, key=None, limit=None):
+    """ Sort entries by `key`, largest first, and keep `limit`. """
+    if key is None:
+        return entries[:limit] if limit is not None else entries
+    if limit is not None:
+        return heapq.nlargest(limit, entries, key=key)
+    return sorted(entries, key=key, reverse=True)
+
+
+class Merger(object):
+    """ Base type for report mergers. """
+
+    name = None
+
+    def options(self):
+        """ Arguments for building the same kind of merger on another node.
+        """
+        return {}
+
+    def add(self, source, report):
+        raise NotImplementedError("Required subclass impl")
+
+    def result(self):
+        raise NotImplementedError("Required subclass impl")
+
+
+class KeyedMerger(Merger):
+    """ Keep each report as is, keyed by its source. """
+
+    name = 'keyed'
+
+    def __init__(self):
+        self._reports = {}
+
+    def add(self, source, report):
+        self._reports[source] = report
+
+    def result(self):
+        return self._reports
+
+
+class ProfileMerger(Merger):
+    """ Sum profiler stats by (file, function, lineno), callers included.
+    The result can be cut down to the top `limit` entries by `sortby`. """
+
+    name = 'profile'
+    stat_fields = ('callcount', 'reccallcount', 'totaltime', 'inlinetime')
+
+    def __init__(self, sortby=None, limit=None):
+        if sortby is not None and sortby not in self.stat_fields:
+            raise ValueError('Invalid sortby: %s' % sortby)
+        self.sortby = sortby
+        self.limit = limit
+        self._calls = {}
+
+    def options(self):
+        return {
+            "sortby": self.sortby,
+            "limit": self.limit,
+        }
+
+    def _add_stats(self, index, entry):
+        key = call_key(entry['call'])
+        ref = index.get(key)
+        if ref is None:
+            ref = index[key] = {
+                "call": entry['call'],
+                "stats": dict(entry['stats']),
+            }
+        else:
+            stats = ref['stats']
+            for x in self.stat_fields:
+                stats[x] += entry['stats'][x]
+        return ref
+
+    def add(self, source, report):
+        for entry in report:
+            ref = self._add_stats(self._calls, entry)
+            callers = ref.setdefault('_callers', {})
+            for x in entry.get('callers') or ():
+                self._add_stats(callers, x)
+
+    def result(self):
+        key = None
+        if self.sortby is not None:
+            key = lambda x: x['stats'][self.sortby]
+        entries = top(list(self._calls.values()), key, self.limit)
+        return [{
+            "call": x['call'],
+            "stats": x['stats'],
+            "callers": list(x['_callers'].values()),
+        } for x in entries]
+
+
+class TaskMerger(Merger):
+    """ Sum asyncio task stats by name.  The result can be cut down to the
+    top `limit` rows by `sortby`. """
+
+    name = 'tasks'
+    stat_fields = ('tasks', 'completed', 'active', 'steps', 'wall', 'cpu',
+                   'blocked', 'max_step')
+
+    def __init__(self, sortby=None, limit=None):
+        if sortby is not None and sortby not in self.stat_fields:
+            raise ValueError('Invalid sortby: %s' % sortby)
+        self.sortby = sortby
+        self.limit = limit
+        self._rows = {}
+
+    def options(self):
+        return {
+            "sortby": self.sortby,
+            "limit": self.limit,
+        }
+
+    def add(self, source, report):
+        for row in report:
+            ref = self._rows.get(row['name'])
+            if ref is None:
+                self._rows[row['name']] = dict(row)
+                continue
+            for x in self.stat_fields:
+                if x == 'max_step':
+                    ref[x] = max(ref[x], row[x])
+                else:
+                    ref[x] += row[x]
+
+    def result(self):
+        key = None
+        if self.sortby is not None:
+            key = lambda x: x[self.sortby]
+        return top(list(self._rows.values()), key, self.limit)
+
+
+class HistoryMerger(Merger):
+    """ Sum continuous profiling stats by function for a time range and an
+    optional baseline range.  The `change` is the difference in CPU seconds
+    per second between the two so ranges of different lengths compare
+    fairly;  Sorting by `change` puts regressions first. """
+
+    name = 'history'
+    time_fields = ('totaltime', 'inlinetime')
+    sort_fields = time_fields + ('change',)
+
+    def __init__(self, sortby=None, limit=None):
+        if sortby is not None and sortby not in self.sort_fields:
+            raise ValueError('Invalid sortby: %s' % sortby)
+        self.sortby = sortby
+        self.limit = limit
+        self._ranges = {}
+        self._calls = {}
+
+    def options(self):
+        return {
+            "sortby": self.sortby,
+            "limit": self.limit,
+        }
+
+    def _add_range(self, name, info):
+        """ Workers cover the same span of time so durations are not summed.
+        """
+        if info is None:
+            return
+        ref = self._ranges.get(name)
+        if ref is None:
+            self._ranges[name] = dict(info)
+            return
+        ref['start'] = min(ref['start'], info['start'])
+        ref['end'] = max(ref['end'], info['end'])
+        ref['duration'] = max(ref['duration'], info['duration'])
+        ref['windows'] = max(ref['windows'], info['windows'])
+        ref['samples'] += info['samples']
+        ref['elapsed'] += info['elapsed']
+
+    def add(self, source, report):
+        self._add_range('window', report['window'])
+        self._add_range('baseline', report['baseline'])
+        for entry in report['functions']:
+            key = call_key(entry['call'])
+            ref = self._calls.get(key)
+            if ref is None:
+                ref = self._calls[key] = {
+                    "call": entry['call'],
+                    "stats": dict.fromkeys(self.time_fields, 0),
+                    "baseline": dict.fromkeys(self.time_fields, 0),
+                }
+            for part in ('stats', 'baseline'):
+                values = entry.get(part)
+                if values:
+                    for x in self.time_fields:
+                        ref[part][x] += values[x]
+
+    def result(self):
+        window = self._ranges.get('window')
+        baseline = self._ranges.get('baseline')
+
+        def rate(value, info):
+            return value / info['duration'] if info['duration'] else 0
+
+        entries = []
+        for ref in self._calls.values():
+            entry = {
+                "call": ref['call'],
+                "stats": ref['stats'],
+                "baseline": None,
+                "change": None,
+            }
+            if baseline is not None:
+                entry['baseline'] = ref['baseline']
+                entry['change'] = dict((x, rate(ref['stats'][x], window) -
+                                        rate(ref['baseline'][x], baseline))
+                                       for x in self.time_fields)
+            entries.append(entry)
+        key = None
+        if self.sortby == 'change':
+            key = lambda x: x['change']['inlinetime'] if x['change'] else 0
+        elif self.sortby is not None:
+            key = lambda x: x['stats'][self.sortby]
+        return {
+            "window": window,
+            "baseline": baseline,
+            "functions": top(entries, key, self.limit),
+        }
+
+
+class StackMerger(Merger):
+    """ Sum folded stack samples from the sampling profiler.  Sources are
+    expected to sample at the same rate. """
+
+    name = 'stacks'
+
+    def __init__(self):
+        self.hz = None
+        self.samples = 0
+        self.elapsed = 0
+        self.overhead = 0
+        self._frames = []
+        self._index = {}
+        self._counts = {}
+
+    def add(self, source, report):
+        remap = []
+        for frame in report['frames']:
+            frame = tuple(frame)
+            i = self._index.get(frame)
+            if i is None:
+                i = self._index[frame] = len(self._frames)
+                self._frames.append(frame)
+            remap.append(i)
+        counts = self._counts
+        for refs, count in report['stacks']:
+            stack = tuple(remap[x] for x in refs)
+            counts[stack] = counts.get(stack, 0) + count
+        if self.hz is None:
+            self.hz = report['hz']
+        self.samples += report['samples']
+        self.elapsed += report['elapsed']
+        self.overhead += report['overhead']
+
+    def result(self):
+        return {
+            "hz": self.hz,
+            "samples": self.samples,
+            "elapsed": self.elapsed,
+            "overhead": self.overhead,
+            "frames": [list(x) for x in self._frames],
+            "stacks": [[list(k), v] for k, v in self._counts.items()],
+        }
+
+
+class LoopLagMerger(Merger):
+    """ Sum event loop lag histograms and keep the slowest `slow_limit` slow
+    callbacks, tagged with where they came from. """
+
+    name = 'looplag'
+
+    def __init__(self, slow_limit=None):
+        self.slow_limit = slow_limit
+        self.slow_count = 0
+        self._hist = None
+        self._slow = []
+
+    def options(self):
+        return {"slow_limit": self.slow_limit}
+
+    def add(self, source, report):
+        if self._hist is None:
+            self._hist = histogram.Histogram.from_dict(report['histogram'])
+        else:
+            self._hist.update(report['histogram'])
+        self.slow_count += report['slow_count']
+        for x in report['slow']:
+            prefix = '%s/%s' % (source, x['source']) if 'source' in x \
+                else source
+            self._slow.append(dict(x, source=prefix))
+        self._slow = top(self._slow, lambda x: x['lag'], self.slow_limit)
+
+    def result(self):
+        hist = self._hist or histogram.Histogram()
+        return {
+            "histogram": hist.as_dict(),
+            "percentiles": hist.percentiles(),
+            "slow_count": self.slow_count,
+            "slow": top(self._slow, lambda x: x['lag']),
+        }
+
+
+class CountMerger(Merger):
+    """ Sum `[name, count, ...]` rows such as the most common object types.
+    With `breakdown` each row ends with a dict of the values contributed by
+    each source. """
+
+    name = 'counts'
+    sort_column = 0
+
+    def __init__(self, breakdown=False):
+        self.breakdown = breakdown
+        self._totals = {}
+        self._sources = {}
+
+    def add(self, source, report):
+        for row in report:
+            name, values = row[0], row[1:]
+            ref = self._totals.get(name)
+            if ref is None:
+                self._totals[name] = list(values)
+            else:
+                for i, x in enumerate(values):
+                    ref[i] += x
+            if self.breakdown:
+                by_source = self._sources.setdefault(name, {})
+                prev = by_source.get(source)
+                if prev is None:
+                    by_source[source] = list(values)
+                else:
+                    for i, x in enumerate(values):
+                        prev[i] += x
+
+    def result(self):
+        rows = sorted(self._totals.items(),
+                      key=lambda x: x[1][self.sort_column], reverse=True)
+        if self.breakdown:
+            return [[name] + values + [self._sources[name]]
+                    for name, values in rows]
+        else:
+            return [[name] + values for name, values in rows]
+
+
+class GrowthMerger(CountMerger):
+    """ Sum `[name, count, change]` rows, sorted by change. """
+
+    name = 'growth'
+    sort_column = 1
+
+
+mergers = dict((x.name, x) for x in (KeyedMerger, ProfileMerger, TaskMerger,
+                                     HistoryMerger, StackMerger, LoopLagMerger,
+                                     CountMerger, GrowthMerger))
+
+
+def merge_broadcast(report, merger):
+    """ Replace the per worker results of a Coordinator.broadcast report
+    with their merged result. """
+    for ident, result in report['results'].items():
+        merger.add(ident, result)
+    report = dict(report, workers=len(report['results']))
+    report['results'] = merger.result()
+    return report
+
+
+class ClusterReport(object):
+    """ Fold node reports from `merge_broadcast` into `merger` as they
+    arrive and keep a summary of each node. """
+
+    def __init__(self, merger):
+        self.merger = merger
+        self.nodes = {}
+
+    def add(self, node, report):
+        self.merger.add(node, report['results'])
+        self.nodes[node] = {
+            "workers": report['workers'],
+            "errors": report['errors'],
+            "timeouts": report['timeouts'],
+            "elapsed": report['elapsed'],
+        }
+
+    def result(self, errors):
+        return {
+            "results": self.merger.result(),
+            "nodes": self.nodes,
+            "errors": errors,
+        }
+
+
+async def cluster_broadcast(federation, call, merger, *args, timeout=None,
+                            **kwargs):
+    """ Broadcast to the workers of every node in the federation.  Nodes
+    merge their own workers and the node reports are folded into `merger`
+    as they come in. """
+    if timeout is None:
+        timeout = federation.coordinator.broadcast_timeout
+    report = ClusterReport(merger)
+    errors = await federation.each('diag_broadcast', report.add, call,
+                                   merger.name, *args, worker_timeout=timeout,
+                                   merge_options=merger.options(),
+                                   call_timeout=timeout +
+                                   federation.call_timeout, **kwargs)
+    return report.result(errors)
@@ -44,7 +44,18 @@ aioc.tpl.help.time = function(val, _kwargs) {
     return buf.join('');
 };
 
+aioc.tpl.help.ms = function(val, _kwargs) {
+    if (val === null || val === undefined) {
+        return '-';
+    }
+    const s = aioc.tpl.help.round(val * 1000, _kwargs);
+    return new Handlebars.SafeString(s + '&nbsp;<small>ms</small>');
+};
+
 aioc.tpl.help.humanbytes = function(val, _kwargs) {
+    if (val === null || val === undefined) {
+        return '-';
+    }
     let units = [
         [1024 * 1024 * 1024 * 1024, 'TB'],
         [1024 * 1024 * 1024, 'GB'],
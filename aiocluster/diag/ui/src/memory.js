@@ -5,7 +5,7 @@ $(document).ready(function() {
         while (true) {
             let totals = new Map();
             const data = await aioc.api.get('memory');
-            for (const worker of data) {
+            for (const worker of Object.values(data.results)) {
                 for (const [type, count] of worker) {
                     totals.set(type, (totals.get(type) || 0) + count);
                 }
@@ -1,35 +1,115 @@
 "use strict";
 
+
+/* Draw a flame graph tree from the flamegraph API as SVG with the root at
+ * the bottom.  Frames too narrow to see are skipped. */
+function renderFlameGraph(holder, root) {
+    const ns = 'http://www.w3.org/2000/svg';
+    const width = holder.width() || 1000;
+    const rowHeight = 18;
+    const charWidth = 7;
+    const rects = [];
+    let maxDepth = 0;
+    (function layout(node, x, depth) {
+        const w = node.value / root.value * width;
+        if (w < 1) {
+            return;
+        }
+        rects.push({node, x, w, depth});
+        maxDepth = Math.max(maxDepth, depth);
+        let offset = x;
+        for (const child of node.children) {
+            layout(child, offset, depth + 1);
+            offset += child.value / root.value * width;
+        }
+    })(root, 0, 0);
+    const height = (maxDepth + 1) * rowHeight;
+    const svg = document.createElementNS(ns, 'svg');
+    svg.setAttribute('width', width);
+    svg.setAttribute('height', height);
+    svg.setAttribute('class', 'flamegraph');
+    for (const r of rects) {
+        const g = document.createElementNS(ns, 'g');
+        const rect = document.createElementNS(ns, 'rect');
+        const y = height - (r.depth + 1) * rowHeight;
+        let hash = 0;
+        for (let i = 0; i < r.node.name.length; i++) {
+            hash = (hash * 31 + r.node.name.charCodeAt(i)) | 0;
+        }
+        rect.setAttribute('x', r.x);
+        rect.setAttribute('y', y);
+        rect.setAttribute('width', r.w);
+        rect.setAttribute('height', rowHeight - 1);
+        rect.setAttribute('fill', `hsl(${Math.abs(hash) % 50}, 80%, 60%)`);
+        const title = document.createElementNS(ns, 'title');
+        const percent = (r.node.value / root.value * 100).toFixed(2);
+        title.textContent = `${r.node.name} (${r.node.value} samples, ` +
+                            `${percent}%)`;
+        g.appendChild(title);
+        g.appendChild(rect);
+        const chars = Math.floor((r.w - 6) / charWidth);
+        if (chars > 2) {
+            const text = document.createElementNS(ns, 'text');
+            text.setAttribute('x', r.x + 3);
+            text.setAttribute('y', y + rowHeight - 5);
+            text.textContent = r.node.name.length > chars ?
+                r.node.name.slice(0, chars - 2) + '..' : r.node.name;
+            g.appendChild(text);
+        }
+        svg.appendChild(g);
+    }
+    holder.empty().append(svg);
+}
+
+
 $(document).ready(function() {
+    let mode = 'deterministic';
+
+    async function activate(new_mode) {
+        mode = new_mode;
+        $('.profiler-mode').removeClass('active');
+        $(`.profiler-mode[data-mode="${mode}"]`).addClass('active');
+        $('#flamegraph-section').toggle(mode === 'sampling');
+        await aioc.api.put('profiler/active?mode=' + mode, true);
+    }
+
+    $(document).on('click', '.profiler-mode', function() {
+        activate(this.getAttribute('data-mode'));
+    });
+
+    (async function() {
+        while (true) {
+            if (mode === 'sampling') {
+                const report = await aioc.api.get(
+                    'profiler/flamegraph?format=tree');
+                renderFlameGraph($('#flamegraph'), report.results);
+            }
+            await aioc.util.sleep(5);
+        }
+    })();
+
     (async function() {
         let prev_totals = {};
         let prev_ts = null;
 
-        await aioc.api.put('profiler/active', true);
+        await activate(mode);
         while (true) {
             const limit = 10; // XXX Pull from UI.
             const sortkey = 'inlinetime'; // XXX pull from ui.
-            const report = await aioc.api.get('profiler/report');
+            const report = await aioc.api.get('profiler/report?merge=true' +
+                                              '&sortby=' + sortkey +
+                                              '&limit=' + limit);
             const ts = (new Date()).getTime();
             const totals = {};
 
-            for (const batch of report) {
-                for (const x of batch) {
-                    let key = [
-                        x.call.file,
-                        x.call.function,
-                        x.call.lineno
-                    ].join(':');
-                    if (totals[key] === undefined) {
-                        x.stats.call = key;
-                        totals[key] = x.stats;
-                    } else {
-                        let ref = totals[key];
-                        ref.totaltime += x['stats']['totaltime'];
-                        ref.inlinetime += x['stats']['inlinetime'];
-                        ref.callcount += x['stats']['callcount'];
-                    }
-                }
+            for (const x of report.results) {
+                let key = [
+                    x.call.file,
+                    x.call.function,
+                    x.call.lineno
+                ].join(':');
+                x.stats.call = key;
+                totals[key] = x.stats;
             }
 
             if (prev_ts === null) {
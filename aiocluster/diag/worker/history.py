@@ -0,0 +1,176 @@
+"""
+Continuous profiling for WorkerCommand.
+
+The shared stack sampler runs for the life of the worker and its counts are
+cut into fixed length windows kept in a ring buffer, an hour of one minute
+windows by default.  Any time range in the buffer can be turned into a
+function report and compared against another range, such as the half hour
+before and after a deploy.
+"""
+
+import collections
+import logging
+import time
+from . import sampler
+from .. import merge
+
+logger = logging.getLogger('diag.history')
+
+
+class WindowedProfile(object):
+    """ Ring buffer of stack counts from the shared sampler, one entry per
+    `window` seconds. """
+
+    window = 60
+    windows = 60
+
+    def __init__(self, hz=None, timer=None, window=None, windows=None,
+                 loop=None):
+        if window is not None:
+            self.window = window
+        if windows is not None:
+            self.windows = windows
+        self.sampler = sampler.get_sampler(hz=hz, timer=timer)
+        self.history = collections.deque(maxlen=self.windows)
+        self._loop = loop
+        self._snapshot = None
+        self._start = None
+        self._timer = None
+
+    @property
+    def running(self):
+        return self._snapshot is not None
+
+    def start(self):
+        self.sampler.acquire()
+        self._snapshot = self.sampler.snapshot()
+        self._start = time.time()
+        if self._loop is not None:
+            self._timer = self._loop.call_later(self.window, self._tick)
+
+    def stop(self):
+        if not self.running:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.rotate()
+        self._snapshot = None
+        self.sampler.release()
+
+    def _tick(self):
+        self.rotate()
+        self._timer = self._loop.call_later(self.window, self._tick)
+
+    def rotate(self):
+        """ Close the current window and start a new one.  The sampler's
+        counts are reset so only the windows hold old stacks. """
+        now = time.time()
+        self.sampler.reset()
+        snapshot = self.sampler.snapshot()
+        self.history.append(dict(sampler.delta(snapshot, self._snapshot),
+                                 start=self._start, end=now))
+        self._snapshot = snapshot
+        self._start = now
+
+    def current(self):
+        """ The window still being collected. """
+        return dict(self.sampler.since(self._snapshot), start=self._start,
+                    end=time.time())
+
+    def select(self, start, end):
+        """ Windows overlapping the `start` to `end` timestamps, including
+        the current one;  Ranges are rounded out to whole windows. """
+        windows = list(self.history)
+        if self.running:
+            windows.append(self.current())
+        return [x for x in windows if x['end'] > start and x['start'] < end]
+
+    def collect(self, start, end):
+        """ Summed stack counts of the windows in a time range. """
+        counts = collections.Counter()
+        info = {
+            "start": None,
+            "end": None,
+            "duration": 0,
+            "windows": 0,
+            "samples": 0,
+            "elapsed": 0,
+        }
+        for x in self.select(start, end):
+            counts.update(x['counts'])
+            info['start'] = x['start'] if info['start'] is None else \
+                min(info['start'], x['start'])
+            info['end'] = x['end'] if info['end'] is None else \
+                max(info['end'], x['end'])
+            info['duration'] += x['end'] - x['start']
+            info['windows'] += 1
+            info['samples'] += x['samples']
+            info['elapsed'] += x['elapsed']
+        if info['start'] is None:
+            info['start'] = info['end'] = start
+        return counts, info
+
+    def functions(self, start, end):
+        """ Per function time for a time range;  Call counts are not known.
+        """
+        counts, info = self.collect(start, end)
+        period = sampler.sample_period(info, self.sampler.hz)
+        entries = sampler.function_stats(counts, period,
+                                         include_callers=False)
+        return [{
+            "call": x['call'],
+            "stats": {
+                "totaltime": x['stats']['totaltime'],
+                "inlinetime": x['stats']['inlinetime'],
+            },
+        } for x in entries], info
+
+    def report(self, start, end, baseline=None, sortby=None, limit=None):
+        """ Function report for a time range, compared with the `baseline`
+        range when given as a `(start, end)` pair. """
+        merger = merge.HistoryMerger(sortby=sortby, limit=limit)
+        functions, window = self.functions(start, end)
+        report = {"window": window, "baseline": None, "functions": functions}
+        if baseline is not None:
+            base_functions, report['baseline'] = self.functions(*baseline)
+            for x in base_functions:
+                x['baseline'] = x.pop('stats')
+            functions.extend(base_functions)
+        merger.add(None, report)
+        return merger.result()
+
+
+class HistoryRPCHandler(object):
+    """ Always on profiling with a time windowed history.  Settings come
+    from the `continuous_profiling` worker config;  Set it to False to turn
+    it off. """
+
+    def __init__(self, rpc_plugin):
+        config = rpc_plugin._worker.config.get('continuous_profiling', {})
+        self.profile = None
+        if config is not False:
+            try:
+                self.profile = WindowedProfile(loop=rpc_plugin._loop,
+                                               **(config or {}))
+                self.profile.start()
+            except Exception as e:
+                logger.warning("Continuous profiling not started: %s" % e)
+                self.profile = None
+        rpc_plugin.add_handler('profiler_history', self.report)
+
+    def get_profile(self):
+        if self.profile is None:
+            raise TypeError('Continuous Profiling Not Running')
+        return self.profile
+
+    async def report(self, window=(300, 0), baseline=None, sortby=None,
+                     limit=None):
+        """ Function report for a range given as seconds ago `(from, to)`,
+        compared with the `baseline` range if given. """
+        profile = self.get_profile()
+        now = time.time()
+        if baseline is not None:
+            baseline = now - baseline[0], now - baseline[1]
+        return profile.report(now - window[0], now - window[1],
+                              baseline=baseline, sortby=sortby, limit=limit)
@@ -0,0 +1,138 @@
+"""
+Event loop lag measurement for WorkerCommand.
+"""
+
+import collections
+import logging
+import sys
+import threading
+import time
+from .. import histogram
+
+logger = logging.getLogger('diag.looplag')
+
+
+def frame_stack(frame, max_depth=64):
+    """ `[file, function, lineno]` entries from the root down. """
+    stack = []
+    while frame is not None and len(stack) < max_depth:
+        stack.append([frame.f_code.co_filename, frame.f_code.co_name,
+                      frame.f_lineno])
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class LoopLagRPCHandler(object):
+    """ Measure how late the event loop runs a timer compared to when it was
+    scheduled.  A busy or blocked loop runs timers late.
+
+    Lag is kept in fixed size histograms;  One for the life of the worker
+    and one per `window` seconds for the last few windows.  When a timer is
+    more than `threshold` seconds late a slow callback is recorded.  A
+    watchdog thread notices the loop is stuck while it is still stuck and
+    saves the stack of the loop's thread, which is the code blocking it. """
+
+    interval = 0.100
+    smoothing = 0.2
+    threshold = 0.100
+    window = 60
+    windows = 5
+    slow_size = 50
+
+    def __init__(self, rpc_plugin):
+        self._loop = rpc_plugin._loop
+        self.lag = 0
+        self.max_lag = 0
+        self.total = histogram.Histogram()
+        self.recent = collections.deque([histogram.Histogram()],
+                                        maxlen=self.windows)
+        self.slow = collections.deque(maxlen=self.slow_size)
+        self.slow_count = 0
+        self._window_start = time.monotonic()
+        self._expected = None
+        self._due = None
+        self._stalled = None
+        self._thread_ident = threading.get_ident()
+        rpc_plugin.add_handler('loop_lag', self.report)
+        rpc_plugin.add_handler('loop_monitor', self.monitor)
+        self._schedule()
+        self._watchdog = threading.Thread(target=self._watch, daemon=True,
+                                          name='looplag-watchdog')
+        self._watchdog.start()
+
+    def _schedule(self):
+        self._expected = self._loop.time() + self.interval
+        self._due = time.monotonic() + self.interval
+        self._loop.call_at(self._expected, self._tick)
+
+    def _tick(self):
+        lag = max(self._loop.time() - self._expected, 0)
+        self.lag += (lag - self.lag) * self.smoothing
+        self.max_lag = max(self.max_lag, lag)
+        self.total.add(lag)
+        now = time.monotonic()
+        if now - self._window_start >= self.window:
+            self._window_start = now
+            self.recent.append(histogram.Histogram())
+        self.recent[-1].add(lag)
+        stalled, self._stalled = self._stalled, None
+        if lag > self.threshold:
+            self.slow_count += 1
+            self.slow.append({
+                "time": time.time(),
+                "lag": lag,
+                "stack": stalled[1] if stalled and stalled[0] == self._due
+                else None,
+            })
+        self._schedule()
+
+    def _watch(self):
+        """ Watchdog thread;  Grab the loop thread's stack once per stall.
+        """
+        while True:
+            time.sleep(self.threshold / 2)
+            due = self._due
+            if self._stalled is None and \
+               time.monotonic() - due > self.threshold:
+                frame = sys._current_frames().get(self._thread_ident)
+                if frame is not None:
+                    self._stalled = due, frame_stack(frame)
+                del frame
+
+    async def report(self):
+        """ Return the smoothed lag and the max lag since the last report. """
+        max_lag = self.max_lag
+        self.max_lag = 0
+        return {
+            "lag": self.lag,
+            "max": max_lag
+        }
+
+    def get_histogram(self, window='recent'):
+        if window == 'total':
+            return self.total
+        elif window != 'recent':
+            raise ValueError('Invalid window: %s' % window)
+        hist = histogram.Histogram()
+        for x in self.recent:
+            hist.update(x)
+        return hist
+
+    async def monitor(self, window='recent', slow_limit=None):
+        """ Lag histogram and percentiles for the last few windows, or with
+        `window='total'` since the worker started, and the most recent slow
+        callbacks. """
+        hist = self.get_histogram(window)
+        slow = list(self.slow)
+        if slow_limit is not None:
+            slow = slow[-slow_limit:] if slow_limit else []
+        return {
+            "lag": self.lag,
+            "interval": self.interval,
+            "threshold": self.threshold,
+            "histogram": hist.as_dict(),
+            "percentiles": hist.percentiles(),
+            "slow_count": self.slow_count,
+            "slow": slow,
+        }
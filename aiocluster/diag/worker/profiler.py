@@ -4,47 +4,112 @@ Profiler RPC calls for WorkerCommand.
 
 import cProfile
 import logging
+from . import sampler, tasks
+from .. import merge
 
 logger = logging.getLogger('diag.profiler')
 
 
 class ProfilerRPCHandler(object):
+    """ The `deterministic` mode uses cProfile and counts every call but
+    slows busy code down a lot.  The `sampling` mode counts stacks `hz`
+    times a second which is cheap enough for production.  The `tasks` mode
+    times each asyncio task instead of each function. """
+
+    modes = ('deterministic', 'sampling', 'tasks')
 
     def __init__(self, rpc_plugin):
+        self._loop = rpc_plugin._loop
         self._profiler = None
+        self._mode = None
         rpc_plugin.add_handler('profiler_set_active', self.set_active)
         rpc_plugin.add_handler('profiler_get_active', self.get_active)
+        rpc_plugin.add_handler('profiler_get_status', self.get_status)
         rpc_plugin.add_handler('profiler_report', self.report)
+        rpc_plugin.add_handler('profiler_stacks', self.stacks)
+        rpc_plugin.add_handler('profiler_tasks', self.tasks)
 
     async def get_active(self):
         return self._profiler is not None
 
-    async def set_active(self, value):
+    async def get_status(self):
+        status = {
+            "active": self._profiler is not None,
+            "mode": self._mode,
+        }
+        if self._mode == 'sampling':
+            collected = self._profiler.collected()
+            status.update({
+                "hz": self._profiler.sampler.hz,
+                "timer": self._profiler.sampler.timer,
+                "samples": collected['samples'],
+                "elapsed": collected['elapsed'],
+                "overhead": collected['overhead'],
+            })
+        return status
+
+    async def set_active(self, value, mode='deterministic', hz=None,
+                         timer=None):
         """ Return True if the state was changed. """
+        if mode not in self.modes:
+            raise ValueError('Invalid mode: %s' % mode)
         activate = bool(value)
-        if activate is (self._profiler is not None):
+        if activate is (self._profiler is not None) and \
+           (not activate or mode == self._mode):
             return False  # did nothing
-        if activate:
-            logger.warning("Activating Diagnostic Profiler")
-            self._profiler = cProfile.Profile()
-            self._profiler.enable()
-        else:
+        if self._profiler is not None:
             logger.warning("Deactivating Diagnostic Profiler")
             self._profiler.disable()
-            self._profiler = None
+            self._profiler = self._mode = None
+        if activate:
+            logger.warning("Activating Diagnostic Profiler (%s)" % mode)
+            if mode == 'sampling':
+                profiler = sampler.SampleProfile(hz=hz, timer=timer)
+            elif mode == 'tasks':
+                profiler = tasks.TaskProfile(self._loop)
+            else:
+                profiler = cProfile.Profile()
+            profiler.enable()
+            self._profiler = profiler
+            self._mode = mode
         return True
 
-    async def report(self):
+    async def report(self, sortby=None, limit=None, include_callers=True):
+        """ Return stats merged by function.  With `sortby` and `limit` only
+        the top entries are returned. """
         if self._profiler is None:
             raise TypeError('Profiler Not Running')
-        return [{
+        if self._mode == 'tasks':
+            raise TypeError('Function stats not collected in tasks mode')
+        merger = merge.ProfileMerger(sortby=sortby, limit=limit)
+        if self._mode == 'sampling':
+            merger.add(None, self._profiler.getstats(
+                include_callers=include_callers))
+            return merger.result()
+        merger.add(None, [{
             "call": self.call_as_dict(stat.code),
             "stats": self.stats_as_dict(stat),
             "callers": [{
                 "call": self.call_as_dict(substat.code),
                 "stats": self.stats_as_dict(substat)
-            } for substat in (stat.calls or [])]
-        } for stat in self._profiler.getstats()]
+            } for substat in (stat.calls or [])] if include_callers else None
+        } for stat in self._profiler.getstats()])
+        return merger.result()
+
+    async def stacks(self):
+        """ Stack sample counts in folded form from the sampling mode. """
+        if self._mode != 'sampling':
+            raise TypeError('Sampling Profiler Not Running')
+        return self._profiler.folded()
+
+    async def tasks(self, group_by='coroutine', sortby=None, limit=None):
+        """ Time spent in asyncio tasks grouped by coroutine or task name.
+        """
+        if self._mode != 'tasks':
+            raise TypeError('Task Profiler Not Running')
+        merger = merge.TaskMerger(sortby=sortby, limit=limit)
+        merger.add(None, self._profiler.report(group_by=group_by))
+        return merger.result()
 
     def call_as_dict(self, code):
         """ Parse call tuples from Profile.stats into a dict. """
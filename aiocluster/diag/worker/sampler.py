@@ -0,0 +1,301 @@
+"""
+Statistical stack sampler for low overhead profiling.
+
+An interval timer interrupts the process `hz` times a second and the signal
+handler counts the stack it interrupted.  Stacks are kept as tuples of code
+objects so a sample costs a short frame walk and a dict update;  Names are
+only looked up when a report is made.  Signals are delivered to the main
+thread so that is the only thread sampled, which is where the event loop
+runs.
+
+The kernel may deliver fewer signals than asked for (Linux rounds timers up
+to its tick), so time is estimated from the clock the timer follows rather
+than from `hz`.
+"""
+
+import logging
+import signal
+import time
+import weakref
+
+logger = logging.getLogger('diag.sampler')
+
+timers = {
+    "cpu": (signal.ITIMER_PROF, signal.SIGPROF, time.process_time),
+    "wall": (signal.ITIMER_REAL, signal.SIGALRM, time.monotonic),
+}
+
+
+def code_key(code):
+    return code.co_filename, code.co_name, code.co_firstlineno
+
+
+class StackSampler(object):
+    """ Count the stacks of the main thread.  The `cpu` timer only samples
+    while the process is burning CPU; `wall` samples idle time too but uses
+    SIGALRM.
+
+    One sampler is shared by everything in the process that wants samples.
+    It runs while anyone holds it and counts are cumulative, so each user
+    diffs its own snapshots.  Long running users call reset() to drop old
+    counts;  Snapshots are rebased so they still diff correctly. """
+
+    hz = 100
+    timer = 'cpu'
+    max_depth = 128
+
+    def __init__(self, hz=None, timer=None):
+        if hz is not None:
+            self.hz = hz
+        if timer is not None:
+            self.timer = timer
+        if self.timer not in timers:
+            raise ValueError('Invalid timer: %s' % self.timer)
+        if self.hz <= 0:
+            raise ValueError('Invalid hz: %s' % self.hz)
+        self.counts = {}
+        self.samples = 0
+        self._snapshots = weakref.WeakValueDictionary()
+        self.overhead = 0
+        self._clock = timers[self.timer][2]
+        self._elapsed = 0
+        self._started = None
+        self._users = 0
+        self._prev_handler = None
+
+    @property
+    def running(self):
+        return self._users > 0
+
+    def acquire(self):
+        if not self._users:
+            self._start()
+        self._users += 1
+
+    def release(self):
+        self._users -= 1
+        if not self._users:
+            self._stop()
+
+    def elapsed(self):
+        """ Time sampled so far on the timer's clock. """
+        if self._started is None:
+            return self._elapsed
+        return self._elapsed + self._clock() - self._started
+
+    def _start(self):
+        which, signum, clock = timers[self.timer]
+        self._prev_handler = signal.signal(signum, self._sample)
+        self._started = clock()
+        signal.setitimer(which, 1 / self.hz, 1 / self.hz)
+        logger.info("Stack sampler started: %d Hz (%s)" % (self.hz,
+                    self.timer))
+
+    def _stop(self):
+        which, signum, clock = timers[self.timer]
+        signal.setitimer(which, 0)
+        signal.signal(signum, self._prev_handler or signal.SIG_DFL)
+        self._elapsed = self.elapsed()
+        self._started = None
+        logger.info("Stack sampler stopped")
+
+    def _sample(self, signum, frame):
+        start = time.perf_counter()
+        stack = []
+        while frame is not None and len(stack) < self.max_depth:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        stack = tuple(stack)
+        self.counts[stack] = self.counts.get(stack, 0) + 1
+        self.samples += 1
+        self.overhead += time.perf_counter() - start
+
+    def _totals(self, counts):
+        return {
+            "counts": counts,
+            "samples": self.samples,
+            "overhead": self.overhead,
+            "elapsed": self.elapsed(),
+        }
+
+    def snapshot(self):
+        """ A copy of the counters for diffing against later. """
+        snapshot = Snapshot(self._totals(dict(self.counts)))
+        self._snapshots[id(snapshot)] = snapshot
+        return snapshot
+
+    def since(self, snapshot):
+        """ Stack counts and totals added since `snapshot` was taken. """
+        return delta(self._totals(self.counts), snapshot)
+
+    def reset(self):
+        """ Drop the stack counts so memory is bounded by the stacks seen
+        since the last reset.  Snapshots still in use are rebased so their
+        deltas are unchanged. """
+        counts, self.counts = self.counts, {}
+        for snapshot in list(self._snapshots.values()):
+            base = snapshot['counts']
+            for stack, count in counts.items():
+                count = base.get(stack, 0) - count
+                if count:
+                    base[stack] = count
+                else:
+                    base.pop(stack, None)
+
+
+class Snapshot(dict):
+    """ StackSampler counters at a point in time;  A dict the sampler can
+    hold a weak reference to. """
+
+
+def delta(snapshot, base):
+    """ Stack counts and totals added between two snapshots.  A rebased
+    `base` can hold negative counts for stacks no longer counted. """
+    counts = dict(snapshot['counts'])
+    for stack, count in base['counts'].items():
+        count = counts.get(stack, 0) - count
+        if count:
+            counts[stack] = count
+        else:
+            counts.pop(stack, None)
+    return {
+        "counts": counts,
+        "samples": snapshot['samples'] - base['samples'],
+        "overhead": snapshot['overhead'] - base['overhead'],
+        "elapsed": snapshot['elapsed'] - base['elapsed'],
+    }
+
+
+_sampler = None
+
+
+def get_sampler(hz=None, timer=None):
+    """ The process wide sampler.  Settings can only change while nobody is
+    using it. """
+    global _sampler
+    if _sampler is None:
+        _sampler = StackSampler(hz=hz, timer=timer)
+    elif (hz is not None and hz != _sampler.hz) or \
+         (timer is not None and timer != _sampler.timer):
+        if _sampler.running:
+            logger.warning("Stack sampler in use;  Keeping %d Hz (%s)" % (
+                           _sampler.hz, _sampler.timer))
+        else:
+            _sampler = StackSampler(hz=hz, timer=timer)
+    return _sampler
+
+
+def sample_period(collected, hz):
+    """ Seconds each sample stands for in a `StackSampler.since` result. """
+    if collected['samples']:
+        return collected['elapsed'] / collected['samples']
+    return 1 / hz
+
+
+def fold(counts, hz, samples=None, overhead=0, elapsed=None):
+    """ Compact form of stack counts.  Frames are listed once and stacks
+    refer to them by index from the root down. """
+    frames = []
+    index = {}
+    stacks = []
+    for stack, count in counts.items():
+        refs = []
+        for code in reversed(stack):
+            i = index.get(code)
+            if i is None:
+                i = index[code] = len(frames)
+                frames.append(code_key(code))
+            refs.append(i)
+        stacks.append([refs, count])
+    if samples is None:
+        samples = sum(counts.values())
+    return {
+        "hz": hz,
+        "samples": samples,
+        "elapsed": samples / hz if elapsed is None else elapsed,
+        "overhead": overhead,
+        "frames": frames,
+        "stacks": stacks,
+    }
+
+
+def function_stats(counts, period, include_callers=True):
+    """ Estimate per function stats from stack counts in the same form the
+    deterministic profiler reports.  Each sample stands for `period`
+    seconds;  Call counts are not known. """
+    funcs = {}
+
+    def stats(index, code):
+        ref = index.get(code)
+        if ref is None:
+            ref = index[code] = {
+                "callcount": 0,
+                "reccallcount": 0,
+                "totaltime": 0,
+                "inlinetime": 0,
+                "_callers": {},
+            }
+        return ref
+
+    for stack, count in counts.items():
+        elapsed = count * period
+        stats(funcs, stack[0])['inlinetime'] += elapsed
+        seen = set()
+        for i, code in enumerate(stack):
+            ref = stats(funcs, code)
+            if code not in seen:
+                seen.add(code)
+                ref['totaltime'] += elapsed
+            if include_callers and i + 1 < len(stack):
+                caller = stats(ref['_callers'], stack[i + 1])
+                caller['totaltime'] += elapsed
+                if not i:
+                    caller['inlinetime'] += elapsed
+    entries = []
+    for code, ref in funcs.items():
+        callers = ref.pop('_callers')
+        file, func, lineno = code_key(code)
+        entries.append({
+            "call": {"file": file, "function": func, "lineno": lineno},
+            "stats": ref,
+            "callers": [{
+                "call": dict(zip(('file', 'function', 'lineno'),
+                                 code_key(x))),
+                "stats": dict((k, v) for k, v in stat.items()
+                              if k != '_callers'),
+            } for x, stat in callers.items()],
+        })
+    return entries
+
+
+class SampleProfile(object):
+    """ Sampling counterpart to cProfile.Profile using the shared sampler.
+    """
+
+    def __init__(self, hz=None, timer=None):
+        self.sampler = get_sampler(hz=hz, timer=timer)
+        self._snapshot = None
+        self._enabled = False
+
+    def enable(self):
+        self._snapshot = self.sampler.snapshot()
+        self.sampler.acquire()
+        self._enabled = True
+
+    def disable(self):
+        if self._enabled:
+            self.sampler.release()
+            self._enabled = False
+
+    def collected(self):
+        return self.sampler.since(self._snapshot)
+
+    def getstats(self, include_callers=True):
+        c = self.collected()
+        return function_stats(c['counts'], sample_period(c, self.sampler.hz),
+                              include_callers=include_callers)
+
+    def folded(self):
+        c = self.collected()
+        return fold(c['counts'], self.sampler.hz, samples=c['samples'],
+                    overhead=c['overhead'], elapsed=c['elapsed'])
@@ -0,0 +1,167 @@
+"""
+Attribute event loop time to asyncio tasks.
+
+Function profilers charge a coroutine's time to whatever frame the loop
+resumes it from, so the slow handler in a busy worker hides behind
+`_run_once`.  Here a task factory wraps each new task's coroutine so every
+step the loop takes into it is timed.  A step is one `send()` or `throw()`;
+The time between steps is counted as blocked, which covers awaiting I/O,
+timers and other tasks as well as waiting for a turn on the loop.
+
+Only tasks created while the profile is enabled are tracked.
+"""
+
+import asyncio
+import collections
+import collections.abc
+import re
+import time
+import weakref
+
+_default_name = re.compile(r'^Task-\d+$')
+
+
+class CoroutineProbe(collections.abc.Coroutine):
+    """ Stand in for a task's coroutine that times each step into it. """
+
+    __slots__ = ('coro', 'qualname', 'task', 'stats', '_profile', '_last',
+                 '__weakref__')
+
+    def __init__(self, coro, profile):
+        self.coro = coro
+        self.qualname = getattr(coro, '__qualname__', None) or \
+            type(coro).__qualname__
+        self.task = None
+        self.stats = None
+        self._profile = profile
+        self._last = None
+
+    def __repr__(self):
+        return repr(self.coro)
+
+    def send(self, value):
+        return self._step(self.coro.send, value)
+
+    def throw(self, *args):
+        return self._step(self.coro.throw, *args)
+
+    def close(self):
+        return self.coro.close()
+
+    def __await__(self):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.send(None)
+
+    def _step(self, method, *args):
+        profile = self._profile
+        if not profile.enabled:
+            return method(*args)
+        stats = self.stats
+        if stats is None:
+            stats = self.stats = profile.stats_for(self)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        if self._last is not None:
+            stats['blocked'] += start - self._last
+        try:
+            return method(*args)
+        except BaseException:
+            stats['completed'] += 1  # StopIteration included
+            raise
+        finally:
+            end = time.perf_counter()
+            wall = end - start
+            stats['steps'] += 1
+            stats['wall'] += wall
+            stats['cpu'] += time.process_time() - cpu_start
+            if wall > stats['max_step']:
+                stats['max_step'] = wall
+            self._last = end
+
+
+def new_stats():
+    return {
+        "tasks": 0,
+        "completed": 0,
+        "steps": 0,
+        "wall": 0,
+        "cpu": 0,
+        "blocked": 0,
+        "max_step": 0,
+    }
+
+
+class TaskProfile(object):
+    """ Per task timings for tasks created on `loop`.  Same enable/disable
+    interface as cProfile.Profile. """
+
+    group_fields = ('coroutine', 'name')
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._prev_factory = None
+        self._probes = weakref.WeakSet()
+        self.enabled = False
+        self.stats = {}
+
+    def enable(self):
+        self._prev_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self.task_factory)
+        self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            self._loop.set_task_factory(self._prev_factory)
+            self.enabled = False
+
+    def task_factory(self, loop, coro, **kwargs):
+        probe = CoroutineProbe(coro, self)
+        if self._prev_factory is not None:
+            task = self._prev_factory(loop, probe, **kwargs)
+        else:
+            task = asyncio.Task(probe, loop=loop, **kwargs)
+        probe.task = weakref.ref(task)
+        self._probes.add(probe)
+        return task
+
+    def task_name(self, probe):
+        """ Custom task names;  Default names like Task-12 are ignored. """
+        task = probe.task and probe.task()
+        name = task.get_name() if hasattr(task, 'get_name') else None
+        if name is not None and _default_name.match(name):
+            name = None
+        return name
+
+    def stats_for(self, probe):
+        key = probe.qualname, self.task_name(probe)
+        stats = self.stats.get(key)
+        if stats is None:
+            stats = self.stats[key] = new_stats()
+        stats['tasks'] += 1
+        return stats
+
+    def report(self, group_by='coroutine'):
+        """ Stats named by coroutine qualname or by task name, falling back
+        to the qualname for unnamed tasks.  Rows with the same name are for
+        the caller to merge. """
+        if group_by not in self.group_fields:
+            raise ValueError('Invalid group_by: %s' % group_by)
+        active = collections.Counter()
+        for probe in self._probes:
+            task = probe.task and probe.task()
+            if probe.stats is not None and task is not None and \
+               not task.done():
+                active[id(probe.stats)] += 1
+        rows = []
+        for (qualname, name), stats in self.stats.items():
+            if group_by == 'name' and name is not None:
+                key = name
+            else:
+                key = qualname
+            rows.append(dict(stats, name=key, active=active[id(stats)]))
+        return rows
@@ -0,0 +1,361 @@
+"""
+Federation of coordinators across nodes.
+
+Each coordinator listens on a TCP port and keeps an rpc.Channel open to
+every peer it learns about from a Discovery source.  The cluster wide calls
+sketched in notes/rpc_design hang off of the federation:
+
+    await fed.workers.get_metrics(state='ready')
+    await fed.nodes.get_peers()
+"""
+
+import asyncio
+import logging
+import time
+from . import rpc
+from .diag import merge as diag_merge
+
+logger = logging.getLogger('federation')
+
+
+wildcard_hosts = {'', '0.0.0.0', '::'}
+
+
+def parse_addr(value, default_port=None):
+    """ Parse `host:port` into a (host, port) tuple. """
+    host, sep, port = value.strip().rpartition(':')
+    if not sep:
+        if default_port is None:
+            raise ValueError('Port required: %s' % value)
+        host, port = port, default_port
+    return host.strip('[]'), int(port)
+
+
+class Discovery(object):
+    """ Base type for peer discovery.  Returns (host, port) tuples. """
+
+    async def peers(self):
+        raise NotImplementedError("Required subclass impl")
+
+
+class StaticDiscovery(Discovery):
+
+    def __init__(self, peers):
+        self._peers = [parse_addr(x) if isinstance(x, str) else tuple(x)
+                       for x in peers]
+
+    async def peers(self):
+        return list(self._peers)
+
+
+class FileDiscovery(Discovery):
+    """ Read `host:port` lines from a file each time peers are wanted so it
+    can be updated by config management.  Blank lines and `#` comments are
+    ignored. """
+
+    def __init__(self, path):
+        self.path = path
+
+    async def peers(self):
+        peers = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    line = line.split('#', 1)[0].strip()
+                    if line:
+                        peers.append(parse_addr(line))
+        except OSError as e:
+            logger.warning("Peer file unavailable: %s" % e)
+        return peers
+
+
+class DNSDiscovery(Discovery):
+    """ Resolve a name to one peer per address, all on `port`.  The
+    `resolver` is a coroutine function taking a name and returning a list
+    of addresses;  The default uses the event loop's getaddrinfo. """
+
+    def __init__(self, name, port, resolver=None, loop=None):
+        self.name = name
+        self.port = port
+        self._resolver = resolver or self.getaddrinfo
+        self._loop = loop
+
+    async def getaddrinfo(self, name):
+        loop = self._loop or asyncio.get_event_loop()
+        infos = await loop.getaddrinfo(name, self.port)
+        return sorted(set(x[4][0] for x in infos))
+
+    async def peers(self):
+        try:
+            addrs = await self._resolver(self.name)
+        except OSError as e:
+            logger.warning("Peer lookup failed: %s" % e)
+            return []
+        return [(x, self.port) for x in addrs]
+
+
+class Peer(object):
+    """ A connected foreign coordinator. """
+
+    def __init__(self, addr, channel, info):
+        self.addr = addr
+        self.channel = channel
+        self.ident = info['ident']
+        self.info = info
+        self.connected = time.time()
+
+    def as_dict(self):
+        return {
+            "ident": self.ident,
+            "addr": '%s:%d' % self.addr,
+            "connected": self.connected,
+            "info": self.info,
+        }
+
+
+def match_filters(item, filters):
+    return all(item.get(k) == v for k, v in filters.items())
+
+
+class WorkersAPI(object):
+    """ cluster.workers calls. """
+
+    def __init__(self, federation):
+        self._fed = federation
+
+    async def get_metrics(self, **filters):
+        """ Metrics for every worker in the cluster matching `filters`,
+        Eg. `state='ready'` or `node=<coordinator ident>`. """
+        return await self._fed.gather('workers_get_metrics', **filters)
+
+
+class NodesAPI(object):
+    """ cluster.nodes calls. """
+
+    def __init__(self, federation):
+        self._fed = federation
+
+    async def get_peers(self):
+        return [x.as_dict() for x in self._fed.peers.values()]
+
+
+class Federation(object):
+    """ Connect a coordinator to its peers on other nodes.  The advertised
+    address `addr` is what other nodes use to reach this one;  It is
+    required when listening on a wildcard address. """
+
+    refresh_interval = 5
+    call_timeout = 5
+    diag_calls = {'memory_report', 'memory_growth', 'loop_monitor',
+                  'profiler_get_active', 'profiler_get_status',
+                  'profiler_report', 'profiler_stacks', 'profiler_tasks',
+                  'profiler_history'}
+
+    def __init__(self, listen=('127.0.0.1', 7879), discovery=None, addr=None,
+                 refresh_interval=None, call_timeout=None, loop=None):
+        if addr is None and listen[0] in wildcard_hosts:
+            raise ValueError('Advertised address required when listening '
+                             'on: %s' % listen[0])
+        self.listen = listen
+        self.addr = addr
+        self.discovery = discovery or StaticDiscovery([])
+        if refresh_interval is not None:
+            self.refresh_interval = refresh_interval
+        if call_timeout is not None:
+            self.call_timeout = call_timeout
+        self._loop = loop
+        self.coordinator = None
+        self.peers = {}
+        self._server = None
+        self._refresh_task = None
+        self._refreshed = None
+        self._learned = set()
+        self.calls = {
+            "node_hello": self.hello,
+            "workers_get_metrics": self.local_worker_metrics,
+            "diag_broadcast": self.diag_broadcast,
+        }
+        self.workers = WorkersAPI(self)
+        self.nodes = NodesAPI(self)
+
+    @property
+    def ident(self):
+        return self.coordinator.ident
+
+    async def start(self, coordinator):
+        self.coordinator = coordinator
+        if self._loop is None:
+            self._loop = coordinator._loop
+        self._server = await rpc.serve_tcp(self.listen[0], self.listen[1],
+                                           self.calls, loop=self._loop)
+        if self.addr is None:
+            sockname = self._server.sockets[0].getsockname()
+            self.addr = sockname[0], sockname[1]
+        self._refreshed = asyncio.Event(loop=self._loop)
+        self._refresh_task = self._loop.create_task(self._refresh_loop())
+        logger.info("Federation listening on: %s:%d" % self.addr)
+
+    async def stop(self):
+        self._refresh_task.cancel()
+        try:
+            await self._refresh_task
+        except asyncio.CancelledError:
+            pass
+        for x in self.peers.values():
+            x.channel.close()
+        self.peers.clear()
+        self._server.close()
+        for x in self._server.channels:
+            x.close()
+        await self._server.wait_closed()
+
+    async def wait_refreshed(self):
+        """ Block until the next peer refresh finishes. """
+        self._refreshed.clear()
+        await self._refreshed.wait()
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Peer refresh error")
+            self._refreshed.set()
+            await asyncio.sleep(self.refresh_interval, loop=self._loop)
+
+    async def refresh(self):
+        """ Connect to newly discovered peers and drop broken ones. """
+        wanted = set(await self.discovery.peers()) | self._learned
+        wanted.discard(tuple(self.addr))
+        for addr, peer in list(self.peers.items()):
+            if peer.channel.closed or addr not in wanted:
+                logger.warning("Dropping peer: %s:%d" % addr)
+                peer.channel.close()
+                del self.peers[addr]
+        new = [x for x in wanted if x not in self.peers]
+        if new:
+            await asyncio.gather(*map(self.connect, new), loop=self._loop,
+                                 return_exceptions=True)
+
+    async def connect(self, addr):
+        try:
+            channel = await rpc.Channel.connect_tcp(addr[0], addr[1],
+                                                    loop=self._loop)
+        except OSError as e:
+            logger.debug("Peer unreachable: %s:%d: %s" % (addr[0], addr[1],
+                         e))
+            self._learned.discard(addr)
+            raise
+        try:
+            info = await channel.call('node_hello', self.node_info(),
+                                      timeout=self.call_timeout)
+        except:
+            channel.close()
+            raise
+        if info['ident'] == self.ident:
+            channel.close()  # Ourselves by another address.
+            return
+        self.peers[addr] = Peer(addr, channel, info)
+        logger.info("Connected to peer %s at %s:%d" % (info['ident'],
+                    addr[0], addr[1]))
+
+    def node_info(self):
+        return {
+            "ident": self.ident,
+            "addr": list(self.addr),
+            "workers": len(self.coordinator.workers),
+        }
+
+    async def hello(self, info):
+        """ Peers introduce themselves;  Remember their address so we
+        connect back even if our discovery source doesn't list them. """
+        addr = tuple(info['addr'])
+        if info['ident'] != self.ident and addr not in self.peers:
+            self._learned.add(addr)
+        return self.node_info()
+
+    async def local_worker_metrics(self, **filters):
+        node = filters.pop('node', None)
+        if node is not None and node != self.ident:
+            return []
+        now = time.time()
+        metrics = []
+        for wp in self.coordinator.workers.values():
+            item = {
+                "node": self.ident,
+                "ident": wp.ident,
+                "slot": wp.slot,
+                "state": wp.state,
+            }
+            if not match_filters(item, filters):
+                continue
+            try:
+                ps = wp.util
+                with ps.oneshot():
+                    item.update({
+                        "pid": ps.pid,
+                        "age": now - ps.create_time(),
+                        "cpu_percent": ps.cpu_percent(),
+                        "rss": ps.memory_info().rss,
+                    })
+            except Exception as e:
+                item['error'] = str(e)
+            metrics.append(item)
+        return metrics
+
+    async def diag_broadcast(self, call, merge, *args, worker_timeout=None,
+                             merge_options=None, **kwargs):
+        """ Broadcast a diag call to our workers and merge the results so
+        the asking node gets one compact report from us.  Only read-only
+        diag calls are allowed. """
+        if call not in self.diag_calls:
+            raise ValueError('Diag call not allowed: %s' % call)
+        if merge not in diag_merge.mergers:
+            raise ValueError('Invalid merge: %s' % merge)
+        merger = diag_merge.mergers[merge](**(merge_options or {}))
+        report = await self.coordinator.broadcast(call, *args,
+                                                  timeout=worker_timeout,
+                                                  **kwargs)
+        return diag_merge.merge_broadcast(report, merger)
+
+    async def each(self, call, callback, *args, call_timeout=None, **kwargs):
+        """ Make a call on this node and every peer and pass each result to
+        `callback(ident, result)` as soon as it arrives so big results can
+        be folded together without holding all of them.  Returns errors by
+        node ident. """
+        if call_timeout is None:
+            call_timeout = self.call_timeout
+        peers = list(self.peers.values())
+
+        async def outcome(ident, coro):
+            try:
+                return ident, await coro, None
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                return ident, None, 'timeout'
+            except Exception as e:
+                return ident, None, str(e)
+        batch = [outcome(self.ident, self.calls[call](*args, **kwargs))]
+        batch.extend(outcome(x.ident, x.channel.call(
+            call, *args, timeout=call_timeout, **kwargs)) for x in peers)
+        errors = {}
+        for f in asyncio.as_completed(batch, loop=self._loop):
+            ident, result, error = await f
+            if error is None:
+                callback(ident, result)
+            else:
+                errors[ident] = error
+        return errors
+
+    async def gather(self, call, *args, **kwargs):
+        """ Make a call on this node and every peer.  Returns results keyed
+        by node ident along with errors from peers that failed. """
+        results = {}
+        errors = await self.each(call, results.__setitem__, *args, **kwargs)
+        return {
+            "results": results,
+            "errors": errors,
+        }
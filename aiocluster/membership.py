@@ -0,0 +1,466 @@
+"""
+SWIM style gossip membership and failure detection for coordinators.
+
+Every protocol period a node pings one member, walking a shuffled list so
+each member is probed once per round.  If no ack arrives within
+`ack_timeout` it asks `indirect_probes` other members to ping the target
+for it.  A target that stays silent is marked suspect and, unless it
+refutes the suspicion by gossiping a higher incarnation number, is declared
+dead once the suspicion timeout passes.
+
+Membership changes are not sent as messages of their own;  They ride along
+on pings and acks, each one retransmitted a few times log(N).  Load per node
+is constant and detection time grows only with log(N).
+
+Nodes are reached through a transport;  UDPTransport for real use and
+LocalNetwork for running many nodes in one process.
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import random
+from . import codec, federation
+
+logger = logging.getLogger('membership')
+
+ALIVE = 'alive'
+SUSPECT = 'suspect'
+DEAD = 'dead'
+
+_codec = codec.MsgpackCodec()
+
+
+class Member(object):
+
+    __slots__ = ('ident', 'addr', 'state', 'incarnation', 'changed')
+
+    def __init__(self, ident, addr, state, incarnation, changed):
+        self.ident = ident
+        self.addr = addr
+        self.state = state
+        self.incarnation = incarnation
+        self.changed = changed
+
+    def as_dict(self):
+        return {
+            "ident": self.ident,
+            "addr": '%s:%d' % tuple(self.addr),
+            "state": self.state,
+            "incarnation": self.incarnation,
+            "changed": self.changed,
+        }
+
+
+class UDPTransport(object):
+    """ Gossip over UDP.  Set `advertise` when the bind address is not what
+    other nodes should use to reach this one;  It is required when binding
+    a wildcard address. """
+
+    def __init__(self, bind=('127.0.0.1', 7880), advertise=None, loop=None):
+        if advertise is None and bind[0] in federation.wildcard_hosts:
+            raise ValueError('Advertised address required when binding: %s'
+                             % bind[0])
+        self.bind = bind
+        self.advertise = advertise
+        self._loop = loop
+        self._transport = None
+        self.addr = None
+
+    async def start(self, receive, loop):
+        loop = self._loop or loop
+
+        class Protocol(asyncio.DatagramProtocol):
+
+            def datagram_received(self, data, addr):
+                receive(data, addr[:2])
+
+            def error_received(self, exc):
+                logger.debug("Gossip socket error: %s" % exc)
+
+        self._transport, _ = await loop.create_datagram_endpoint(
+            Protocol, local_addr=tuple(self.bind))
+        if self.advertise is not None:
+            self.addr = tuple(self.advertise)
+        else:
+            self.addr = self._transport.get_extra_info('sockname')[:2]
+
+    def send(self, addr, data):
+        self._transport.sendto(data, tuple(addr))
+
+    def close(self):
+        self._transport.close()
+
+
+class LocalNetwork(object):
+    """ In-process network for tests and simulations.  Messages are
+    delivered after `latency` seconds unless dropped by `loss`. """
+
+    def __init__(self, latency=0.001, loss=0, loop=None):
+        self.latency = latency
+        self.loss = loss
+        self._loop = loop
+        self._endpoints = {}
+        self._ports = itertools.count(1)
+        self.partitioned = set()
+
+    def transport(self):
+        return LocalTransport(self)
+
+    def send(self, src, dst, data):
+        if src in self.partitioned or dst in self.partitioned:
+            return
+        if self.loss and random.random() < self.loss:
+            return
+        receive = self._endpoints.get(dst)
+        if receive is not None:
+            self._loop.call_later(self.latency, receive, data, src)
+
+
+class LocalTransport(object):
+
+    def __init__(self, network):
+        self._network = network
+        self.addr = None
+
+    async def start(self, receive, loop):
+        if self._network._loop is None:
+            self._network._loop = loop
+        self.addr = ('local', next(self._network._ports))
+        self._network._endpoints[self.addr] = receive
+
+    def send(self, addr, data):
+        self._network.send(self.addr, tuple(addr), data)
+
+    def close(self):
+        del self._network._endpoints[self.addr]
+
+
+class Membership(object):
+    """ Gossip membership for a coordinator.  The `seeds` are a Discovery
+    from aiocluster.federation used to join the cluster. """
+
+    protocol_period = 1
+    ack_timeout = 0.3
+    indirect_probes = 3
+    suspicion_mult = 4
+    retransmit_mult = 3
+    max_piggyback = 8
+    dead_retention = 60
+
+    def __init__(self, transport=None, seeds=None, ident=None, loop=None,
+                 **settings):
+        for key, value in settings.items():
+            if not hasattr(type(self), key):
+                raise TypeError('Invalid setting: %s' % key)
+            setattr(self, key, value)
+        self.transport = transport or UDPTransport()
+        self.seeds = seeds
+        self.ident = ident
+        self.incarnation = 0
+        self.members = {}
+        self.listeners = []
+        self._loop = loop
+        self._seqs = itertools.count()
+        self._acks = {}
+        self._updates = {}
+        self._probe_order = []
+        self._suspicion_timers = {}
+        self._task = None
+        self.stats = {
+            "sent_msgs": 0,
+            "sent_bytes": 0,
+            "recv_msgs": 0,
+            "recv_bytes": 0,
+            "probes": 0,
+            "indirect_probes": 0,
+            "suspected": 0,
+            "declared_dead": 0,
+            "refuted": 0,
+        }
+
+    @property
+    def addr(self):
+        return self.transport.addr
+
+    @property
+    def running(self):
+        return self._task is not None
+
+    async def start(self, coordinator=None):
+        if coordinator is not None:
+            if self.ident is None:
+                self.ident = coordinator.ident
+            if self._loop is None:
+                self._loop = coordinator._loop
+        if self._loop is None:
+            self._loop = asyncio.get_event_loop()
+        await self.transport.start(self._receive, self._loop)
+        self._task = self._loop.create_task(self._protocol_loop())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        for x in self._suspicion_timers.values():
+            x.cancel()
+        for x in self._acks.values():
+            if not x.done():
+                x.set_result(False)  # Let indirect probes finish.
+        self.transport.close()
+
+    def view(self):
+        """ Current view of the cluster, including ourselves. """
+        me = Member(self.ident, self.addr, ALIVE, self.incarnation, None)
+        return [me.as_dict()] + [x.as_dict() for x in sorted(
+                                 self.members.values(), key=lambda x: x.ident)]
+
+    def alive_members(self):
+        return [x for x in self.members.values() if x.state != DEAD]
+
+    def _cluster_size(self):
+        return len(self.alive_members()) + 1
+
+    def suspicion_timeout(self):
+        n = self._cluster_size()
+        return max(self.suspicion_mult * math.log10(n + 1), 1) * \
+            self.protocol_period
+
+    # Messaging
+
+    def _send(self, addr, msg):
+        msg['f'] = [self.ident, list(self.addr), self.incarnation]
+        msg['u'] = self._piggyback()
+        data = _codec.encode(msg)
+        self.stats['sent_msgs'] += 1
+        self.stats['sent_bytes'] += len(data)
+        self.transport.send(addr, data)
+
+    def _receive(self, data, addr):
+        self.stats['recv_msgs'] += 1
+        self.stats['recv_bytes'] += len(data)
+        try:
+            msg = _codec.decode(data)
+            ident, sender_addr, incarnation = msg['f']
+        except Exception:
+            logger.warning("Invalid gossip message from: %s" % (addr,))
+            return
+        if ident == self.ident:
+            return
+        if sender_addr[0] in ('0.0.0.0', '::'):
+            sender_addr = [addr[0], sender_addr[1]]
+        member = self.members.get(ident)
+        if member is not None and member.state == DEAD and \
+           incarnation <= member.incarnation:
+            # Tell a node we gave up on so it can refute and rejoin.
+            self._gossip(ident, member.addr, DEAD, member.incarnation)
+        self._apply(ident, tuple(sender_addr), ALIVE, incarnation)
+        for update in msg['u']:
+            self._apply(update[0], tuple(update[1]), update[2], update[3])
+        kind = msg['t']
+        if kind == 'ping':
+            self._send(sender_addr, {"t": 'ack', "s": msg['s']})
+        elif kind == 'ack':
+            fut = self._acks.get(msg['s'])
+            if fut is not None and not fut.done():
+                fut.set_result(True)
+        elif kind == 'ping_req':
+            self._loop.create_task(self._indirect_probe(
+                sender_addr, msg['s'], tuple(msg['target'])))
+
+    def _piggyback(self):
+        if not self._updates:
+            return []
+        chosen = sorted(self._updates.items(), key=lambda x: -x[1][1])
+        chosen = chosen[:self.max_piggyback]
+        updates = []
+        for ident, entry in chosen:
+            updates.append(entry[0])
+            entry[1] -= 1
+            if entry[1] <= 0:
+                del self._updates[ident]
+        return updates
+
+    def _gossip(self, ident, addr, state, incarnation):
+        transmits = self.retransmit_mult * \
+            max(math.ceil(math.log10(self._cluster_size() + 1)), 1)
+        self._updates[ident] = [[ident, list(addr), state, incarnation],
+                                transmits]
+
+    # State changes
+
+    def _apply(self, ident, addr, state, incarnation):
+        if ident == self.ident:
+            if state != ALIVE and incarnation >= self.incarnation:
+                self.incarnation = incarnation + 1
+                self.stats['refuted'] += 1
+                logger.warning("Refuting %s rumor with incarnation %d" % (
+                               state, self.incarnation))
+                self._gossip(self.ident, self.addr, ALIVE, self.incarnation)
+            return
+        member = self.members.get(ident)
+        if member is None:
+            if state == DEAD:
+                return
+            member = self.members[ident] = Member(ident, addr, state,
+                                                  incarnation,
+                                                  self._loop.time())
+            self._probe_order.insert(random.randint(
+                0, len(self._probe_order)), ident)
+            self._changed(member, None)
+            self._gossip(ident, addr, state, incarnation)
+            if state == SUSPECT:
+                self._start_suspicion(member)
+            return
+        if member.state == DEAD and state != DEAD and \
+           incarnation <= member.incarnation:
+            return
+        if state == ALIVE:
+            if incarnation <= member.incarnation and member.state != DEAD:
+                return
+        elif state == SUSPECT:
+            if incarnation < member.incarnation or \
+               (incarnation == member.incarnation and member.state != ALIVE):
+                return
+        elif state == DEAD:
+            if incarnation < member.incarnation or member.state == DEAD:
+                return
+        prev = member.state
+        member.state = state
+        member.incarnation = incarnation
+        member.addr = addr
+        member.changed = self._loop.time()
+        timer = self._suspicion_timers.pop(ident, None)
+        if timer is not None:
+            timer.cancel()
+        if state == SUSPECT:
+            self._start_suspicion(member)
+        self._gossip(ident, addr, state, incarnation)
+        if prev != state:
+            self._changed(member, prev)
+
+    def _changed(self, member, prev):
+        if member.state == SUSPECT:
+            self.stats['suspected'] += 1
+        elif member.state == DEAD:
+            self.stats['declared_dead'] += 1
+        log = logger.info if member.state == ALIVE else logger.warning
+        log("Member %s is %s (was %s)" % (member.ident, member.state, prev))
+        for cb in self.listeners:
+            cb(member, prev)
+
+    def _start_suspicion(self, member):
+        self._suspicion_timers[member.ident] = self._loop.call_later(
+            self.suspicion_timeout(), self._suspicion_expired, member.ident,
+            member.incarnation)
+
+    def _suspicion_expired(self, ident, incarnation):
+        self._suspicion_timers.pop(ident, None)
+        member = self.members.get(ident)
+        if member is not None and member.state == SUSPECT and \
+           member.incarnation == incarnation:
+            self._apply(ident, member.addr, DEAD, incarnation)
+
+    def suspect(self, member):
+        self._apply(member.ident, member.addr, SUSPECT, member.incarnation)
+
+    # Probing
+
+    async def _wait_ack(self, seq, timeout):
+        # Not wait_for();  It can swallow a cancel that lands as the ack
+        # arrives, which leaves stop() waiting on a task that never ends.
+        fut = self._acks[seq] = asyncio.Future(loop=self._loop)
+        timer = self._loop.call_later(timeout, lambda: fut.done() or
+                                      fut.set_result(False))
+        try:
+            return await fut
+        finally:
+            timer.cancel()
+            self._acks.pop(seq, None)
+
+    async def ping(self, addr, timeout):
+        seq = next(self._seqs)
+        self._send(addr, {"t": 'ping', "s": seq})
+        return await self._wait_ack(seq, timeout)
+
+    async def _indirect_probe(self, requester, seq, target):
+        if await self.ping(target, self.ack_timeout):
+            self._send(requester, {"t": 'ack', "s": seq})
+
+    def _next_target(self):
+        while self._probe_order:
+            ident = self._probe_order.pop()
+            member = self.members.get(ident)
+            if member is not None and member.state != DEAD:
+                return member
+        self._probe_order = [x.ident for x in self.alive_members()]
+        random.shuffle(self._probe_order)
+        if self._probe_order:
+            return self.members[self._probe_order.pop()]
+
+    async def probe(self, member):
+        """ Ping a member directly and then indirectly;  Returns False and
+        marks it suspect if nobody could reach it. """
+        self.stats['probes'] += 1
+        if await self.ping(member.addr, self.ack_timeout):
+            return True
+        helpers = [x for x in self.alive_members()
+                   if x.ident != member.ident and x.state == ALIVE]
+        helpers = random.sample(helpers, min(self.indirect_probes,
+                                             len(helpers)))
+        if helpers:
+            seq = next(self._seqs)
+            for x in helpers:
+                self.stats['indirect_probes'] += 1
+                self._send(x.addr, {"t": 'ping_req', "s": seq,
+                                    "target": list(member.addr)})
+            remaining = max(self.protocol_period - self.ack_timeout,
+                            self.ack_timeout)
+            if await self._wait_ack(seq, remaining):
+                return True
+        if member.state == ALIVE:
+            self.suspect(member)
+        return False
+
+    async def join(self):
+        """ Ping our seeds so they learn about us and we about them. """
+        if self.seeds is None:
+            return
+        for addr in await self.seeds.peers():
+            if tuple(addr) != tuple(self.addr):
+                seq = next(self._seqs)
+                self._send(addr, {"t": 'ping', "s": seq})
+
+    async def _protocol_loop(self):
+        while True:
+            start = self._loop.time()
+            try:
+                if not self.alive_members():
+                    await self.join()
+                target = self._next_target()
+                if target is not None:
+                    await self.probe(target)
+                self._reap()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Gossip protocol error")
+            elapsed = self._loop.time() - start
+            await asyncio.sleep(max(self.protocol_period - elapsed, 0),
+                                loop=self._loop)
+
+    def _reap(self):
+        cutoff = self._loop.time() - self.dead_retention
+        for ident, member in list(self.members.items()):
+            if member.state == DEAD and member.changed < cutoff:
+                del self.members[ident]
+
+    def get_stats(self):
+        states = {ALIVE: 0, SUSPECT: 0, DEAD: 0}
+        for x in self.members.values():
+            states[x.state] += 1
+        return dict(self.stats, members=states)
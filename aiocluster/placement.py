@@ -0,0 +1,156 @@
+"""
+CPU affinity policies for worker processes.
+
+A placement maps worker slots to sets of CPUs.  Because the mapping is by
+slot a restarted worker lands on the same CPUs as the worker it replaced.
+"""
+
+import glob
+import logging
+import os
+import psutil
+import re
+
+logger = logging.getLogger('placement')
+
+
+def parse_cpulist(value):
+    """ Parse the kernel's cpulist format, Eg. `0-3,8,10-11`. """
+    cpus = []
+    for part in value.strip().split(','):
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-')
+            cpus.extend(range(int(start), int(end) + 1))
+        else:
+            cpus.append(int(part))
+    return cpus
+
+
+def numa_nodes(sysfs='/sys/devices/system/node'):
+    """ Return {node: [cpus]} or None if NUMA info is not available. """
+    nodes = {}
+    for path in glob.glob(os.path.join(sysfs, 'node[0-9]*')):
+        node = int(re.search(r'(\d+)$', path).group(1))
+        try:
+            with open(os.path.join(path, 'cpulist')) as f:
+                cpus = parse_cpulist(f.read())
+        except OSError:
+            continue
+        if cpus:
+            nodes[node] = cpus
+    return nodes or None
+
+
+def available_cpus():
+    """ CPUs this process may run on. """
+    try:
+        return sorted(psutil.Process().cpu_affinity())
+    except AttributeError:
+        return list(range(psutil.cpu_count()))
+
+
+class Placement(object):
+    """ Base type for placement policies.  The first `reserve` CPUs are set
+    aside for the coordinator and never given to workers. """
+
+    def __init__(self, reserve=0, cpus=None, nodes=None):
+        self.reserve = reserve
+        self._cpus = cpus
+        self._nodes = nodes
+        self.cpus = None
+        self.nodes = None
+        self.reserved = None
+
+    def setup(self):
+        """ Inspect the system;  Called once by the coordinator. """
+        cpus = self._cpus if self._cpus is not None else available_cpus()
+        if self.reserve >= len(cpus):
+            raise ValueError('Cannot reserve %d of %d CPUs' % (self.reserve,
+                             len(cpus)))
+        self.reserved = cpus[:self.reserve] or None
+        self.cpus = cpus[self.reserve:]
+        nodes = self._nodes if self._nodes is not None else numa_nodes()
+        if not nodes:
+            nodes = {0: cpus}
+        allowed = set(self.cpus)
+        self.nodes = dict((node, [x for x in node_cpus if x in allowed])
+                          for node, node_cpus in sorted(nodes.items()))
+        self.nodes = dict((k, v) for k, v in self.nodes.items() if v)
+
+    def node_of(self, cpu):
+        for node, cpus in self.nodes.items():
+            if cpu in cpus:
+                return node
+
+    def worker_cpus(self, slot):
+        """ Return the CPUs for a worker slot. """
+        raise NotImplementedError("Required subclass impl")
+
+    def describe(self, slot):
+        cpus = self.worker_cpus(slot)
+        return {
+            "policy": type(self).__name__,
+            "cpus": cpus,
+            "nodes": sorted(set(self.node_of(x) for x in cpus)),
+        }
+
+
+class PinPlacement(Placement):
+    """ Pin each slot to its own core or set of `cores_per_worker` cores.
+    Sets are carved out node by node so a set does not span NUMA nodes
+    when it can be avoided.  Slots wrap around when there are more slots
+    than core sets. """
+
+    def __init__(self, cores_per_worker=1, **kwargs):
+        if cores_per_worker < 1:
+            raise ValueError('cores_per_worker must be positive')
+        self.cores_per_worker = cores_per_worker
+        super().__init__(**kwargs)
+
+    def setup(self):
+        super().setup()
+        n = self.cores_per_worker
+        self.core_sets = []
+        leftover = []
+        for cpus in self.nodes.values():
+            full = len(cpus) - len(cpus) % n
+            self.core_sets.extend(cpus[i:i + n] for i in range(0, full, n))
+            leftover.extend(cpus[full:])
+        self.core_sets.extend(leftover[i:i + n]
+                              for i in range(0, len(leftover), n))
+        if not self.core_sets:
+            raise ValueError('No CPUs available for workers')
+
+    def worker_cpus(self, slot):
+        return self.core_sets[slot % len(self.core_sets)]
+
+
+class SpreadPlacement(Placement):
+    """ Spread slots across NUMA nodes round-robin;  Each worker may use any
+    CPU of its node so memory stays node local. """
+
+    def worker_cpus(self, slot):
+        nodes = list(self.nodes.values())
+        return nodes[slot % len(nodes)]
+
+
+def get_affinity(proc):
+    """ Return the CPU affinity of a psutil.Process or None if the platform
+    does not support it. """
+    try:
+        return sorted(proc.cpu_affinity())
+    except (AttributeError, psutil.Error, OSError):
+        return None
+
+
+def set_affinity(proc, cpus):
+    """ Pin a psutil.Process to `cpus`;  Returns False if that's not
+    possible on this platform. """
+    try:
+        proc.cpu_affinity(cpus)
+    except (AttributeError, psutil.Error, OSError) as e:
+        logger.warning("Could not set CPU affinity of %d: %s" % (proc.pid, e))
+        return False
+    return True
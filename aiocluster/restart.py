@@ -0,0 +1,101 @@
+"""
+Worker restart policy.
+
+Restarts are tracked per worker slot rather than per worker so a slot that
+keeps crashing backs off while healthy slots restart promptly no matter how
+long the cluster has been running.
+"""
+
+import collections
+import logging
+import random
+
+logger = logging.getLogger('restart')
+
+
+class SlotHistory(object):
+    """ Restart bookkeeping for one worker slot. """
+
+    def __init__(self, slot):
+        self.slot = slot
+        self.starts = 0
+        self.restarts = 0
+        self.failures = 0
+        self.crashes = collections.deque()
+        self.last_start = None
+        self.last_exit = None
+        self.last_retcode = None
+        self.tripped_until = None
+
+    def as_dict(self, now):
+        return {
+            "slot": self.slot,
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "failures": self.failures,
+            "recent_crashes": len(self.crashes),
+            "last_retcode": self.last_retcode,
+            "tripped": self.tripped(now),
+        }
+
+    def tripped(self, now):
+        return self.tripped_until is not None and now < self.tripped_until
+
+
+class RestartPolicy(object):
+    """ Exponential backoff with jitter for worker restarts.
+
+    The backoff grows with consecutive failures of a slot and resets once a
+    worker in that slot stays up for `stable_uptime` seconds.  If a slot
+    crashes `crash_limit` times within `crash_window` seconds its circuit
+    breaker trips and the slot is not restarted for `breaker_timeout`
+    seconds. """
+
+    def __init__(self, base_delay=1, max_delay=60, jitter=0.25,
+                 stable_uptime=30, crash_limit=5, crash_window=60,
+                 breaker_timeout=300):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.stable_uptime = stable_uptime
+        self.crash_limit = crash_limit
+        self.crash_window = crash_window
+        self.breaker_timeout = breaker_timeout
+
+    def on_start(self, history, now):
+        if history.starts:
+            history.restarts += 1
+        history.starts += 1
+        history.last_start = now
+
+    def on_exit(self, history, retcode, now):
+        """ Record a worker exit and return True if this trips the slot's
+        circuit breaker. """
+        uptime = now - history.last_start
+        history.last_exit = now
+        history.last_retcode = retcode
+        if uptime >= self.stable_uptime:
+            history.failures = 0
+            history.crashes.clear()
+        history.failures += 1
+        history.crashes.append(now)
+        while history.crashes and \
+              history.crashes[0] <= now - self.crash_window:
+            history.crashes.popleft()
+        if len(history.crashes) >= self.crash_limit and \
+           not history.tripped(now):
+            history.tripped_until = now + self.breaker_timeout
+            history.crashes.clear()
+            return True
+        return False
+
+    def delay(self, history, now):
+        """ Seconds to wait before restarting a worker in this slot. """
+        if history.tripped(now):
+            return history.tripped_until - now
+        if history.failures <= 1 and history.last_start is not None and \
+           history.last_exit - history.last_start >= self.stable_uptime:
+            return 0
+        exp = min(max(history.failures - 1, 0), 32)
+        delay = min(self.base_delay * 2 ** exp, self.max_delay)
+        return delay * random.uniform(1 - self.jitter, 1)
@@ -0,0 +1,290 @@
+"""
+Multiplexed RPC between the coordinator and workers.
+
+A Channel carries any number of concurrent calls over one stream.  Every
+frame is a length and flags header followed by an encoded list whose first
+two items are the frame kind and a message id chosen by the caller.
+Responses may arrive in any order;  the message id pairs them with the
+waiting call.
+
+    [REQUEST, msgid, name, args, kwargs]
+    [RESPONSE, msgid, result]
+    [ERROR, msgid, exc_type_name, message]
+    [CANCEL, msgid]
+
+Both ends of a channel can make and serve calls.  The connecting side opens
+with a HELLO frame, always in msgpack, that lists the codecs and compressors
+it supports in order of preference.  The accepting side answers with its
+choices and both sides use them from then on.  Frames larger than the
+compression threshold are compressed and flagged as such.
+"""
+
+import asyncio
+import itertools
+import logging
+import struct
+from . import codec as _codec
+
+logger = logging.getLogger('rpc')
+
+REQUEST = 0
+RESPONSE = 1
+ERROR = 2
+CANCEL = 3
+HELLO = 4
+
+FLAG_COMPRESSED = 0x1
+
+_header = struct.Struct('!IB')
+_hello_codec = _codec.MsgpackCodec()
+
+
+class RemoteError(Exception):
+    """ An exception raised by the remote side of a call. """
+
+    def __init__(self, type_name, message):
+        self.type_name = type_name
+        self.message = message
+        super().__init__('%s: %s' % (type_name, message))
+
+
+class NegotiationError(Exception):
+    """ The two ends of a channel have no codec in common. """
+
+
+class Channel(object):
+    """ One end of a multiplexed RPC connection. """
+
+    default_timeout = None
+    compress_threshold = 32768
+
+    def __init__(self, reader, writer, calls=None, codecs=None,
+                 compressors=None, compress_threshold=None, loop=None):
+        self._reader = reader
+        self._writer = writer
+        self._loop = loop or asyncio.get_event_loop()
+        self._calls = calls if calls is not None else {}
+        self._ids = itertools.count()
+        self._pending = {}
+        self._serving = {}
+        self._read_task = None
+        if codecs is None:
+            codecs = list(_codec.codecs)
+        if compressors is None:
+            compressors = list(_codec.compressors)
+        self.codecs = codecs
+        self.compressors = compressors
+        if compress_threshold is not None:
+            self.compress_threshold = compress_threshold
+        self.codec = None
+        self.compressor = None
+        self.closed = False
+
+    @classmethod
+    async def connect(cls, path, calls=None, loop=None, **kwargs):
+        """ Open a channel to a unix socket served by `serve()`. """
+        reader, writer = await asyncio.open_unix_connection(path, loop=loop)
+        return await cls._connected(reader, writer, calls, loop, kwargs)
+
+    @classmethod
+    async def connect_tcp(cls, host, port, calls=None, loop=None, **kwargs):
+        """ Open a channel to a TCP port served by `serve_tcp()`. """
+        reader, writer = await asyncio.open_connection(host, port, loop=loop)
+        return await cls._connected(reader, writer, calls, loop, kwargs)
+
+    @classmethod
+    async def _connected(cls, reader, writer, calls, loop, kwargs):
+        channel = cls(reader, writer, calls=calls, loop=loop, **kwargs)
+        try:
+            await channel.handshake()
+        except:
+            writer.close()
+            raise
+        channel.start()
+        return channel
+
+    async def handshake(self):
+        """ Offer our codecs to the accepting side and use its choices. """
+        self._send([HELLO, 0, {
+            "codecs": self.codecs,
+            "compressors": self.compressors,
+        }], codec=_hello_codec)
+        msg = await self._recv(codec=_hello_codec)
+        if msg[0] != HELLO:
+            raise NegotiationError('Expected HELLO frame')
+        options = msg[2]
+        if options.get('error'):
+            raise NegotiationError(options['error'])
+        self._set_options(options['codec'], options['compressor'])
+
+    def _accept_hello(self, msg):
+        if msg[0] != HELLO:
+            raise NegotiationError('Expected HELLO frame')
+        offer = msg[2]
+        codec = _codec.negotiate(offer['codecs'], self.codecs)
+        compressor = _codec.negotiate(offer['compressors'], self.compressors)
+        if codec is None:
+            self._send([HELLO, 0, {"error": 'No common codec'}],
+                       codec=_hello_codec)
+            raise NegotiationError('No common codec: %s' % offer['codecs'])
+        self._send([HELLO, 0, {
+            "codec": codec,
+            "compressor": compressor,
+        }], codec=_hello_codec)
+        self._set_options(codec, compressor)
+
+    def _set_options(self, codec, compressor):
+        self.codec = _codec.codecs[codec]
+        self.compressor = compressor and _codec.compressors[compressor]
+        logger.debug("RPC channel using codec: %s, compressor: %s" % (codec,
+                     compressor))
+
+    def _send(self, msg, codec=None):
+        data = (codec or self.codec).encode(msg)
+        flags = 0
+        if self.compressor is not None and \
+           len(data) > self.compress_threshold:
+            data = self.compressor.compress(data)
+            flags |= FLAG_COMPRESSED
+        self._writer.write(_header.pack(len(data), flags) + data)
+
+    async def _recv(self, codec=None):
+        size, flags = _header.unpack(await self._reader.readexactly(
+            _header.size))
+        data = await self._reader.readexactly(size)
+        if flags & FLAG_COMPRESSED:
+            data = self.compressor.decompress(data)
+        return (codec or self.codec).decode(data)
+
+    def add_call(self, callback, name=None):
+        self._calls[name or callback.__name__] = callback
+
+    def start(self):
+        self._read_task = self._loop.create_task(self._read_loop())
+
+    @property
+    def inflight(self):
+        """ Number of calls this end is waiting on. """
+        return len(self._pending)
+
+    async def call(self, name, *args, timeout=None, **kwargs):
+        """ Call `name` on the remote end.  If the call times out or is
+        cancelled the remote side is told to cancel it too. """
+        if self.closed:
+            raise ConnectionError('RPC channel closed')
+        if timeout is None:
+            timeout = self.default_timeout
+        msgid = next(self._ids)
+        fut = self._pending[msgid] = asyncio.Future(loop=self._loop)
+        try:
+            self._send([REQUEST, msgid, name, args, kwargs])
+            return await asyncio.wait_for(fut, timeout, loop=self._loop)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if not self.closed:
+                self._send([CANCEL, msgid])
+            raise
+        finally:
+            self._pending.pop(msgid, None)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._writer.close()
+        if self._read_task is not None:
+            self._read_task.cancel()
+        self._abort()
+
+    def _abort(self):
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError('RPC channel closed'))
+        for task in self._serving.values():
+            task.cancel()
+        self._serving.clear()
+
+    async def _read_loop(self):
+        try:
+            if self.codec is None:
+                self._accept_hello(await self._recv(codec=_hello_codec))
+            while True:
+                self._dispatch(await self._recv())
+        except asyncio.IncompleteReadError:
+            logger.debug("RPC channel disconnected")
+        except asyncio.CancelledError:
+            pass
+        except NegotiationError as e:
+            logger.error("RPC channel negotiation failed: %s" % e)
+        except Exception:
+            logger.exception("RPC channel failure")
+        finally:
+            self.closed = True
+            self._writer.close()
+            self._abort()
+
+    def _dispatch(self, msg):
+        kind, msgid = msg[0], msg[1]
+        if kind == REQUEST:
+            task = self._loop.create_task(self._serve_call(msgid, *msg[2:]))
+            self._serving[msgid] = task
+        elif kind == CANCEL:
+            task = self._serving.pop(msgid, None)
+            if task is not None:
+                task.cancel()
+        else:
+            fut = self._pending.get(msgid)
+            if fut is None or fut.done():
+                return  # Caller gave up already.
+            if kind == RESPONSE:
+                fut.set_result(msg[2])
+            elif kind == ERROR:
+                fut.set_exception(RemoteError(msg[2], msg[3]))
+
+    async def _serve_call(self, msgid, name, args, kwargs):
+        try:
+            try:
+                callback = self._calls[name]
+            except KeyError:
+                raise NameError('Invalid RPC call: %s' % name)
+            result = await callback(*args, **kwargs)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            if not self.closed:
+                self._send([ERROR, msgid, type(e).__name__, str(e)])
+        else:
+            if not self.closed:
+                try:
+                    self._send([RESPONSE, msgid, result])
+                except Exception as e:
+                    self._send([ERROR, msgid, type(e).__name__, str(e)])
+        finally:
+            self._serving.pop(msgid, None)
+
+
+def _channel_factory(calls, loop, kwargs):
+    channels = []
+
+    def on_connect(reader, writer):
+        channel = Channel(reader, writer, calls=calls, loop=loop, **kwargs)
+        channel.start()
+        channels[:] = [x for x in channels if not x.closed]
+        channels.append(channel)
+    return on_connect, channels
+
+
+async def serve(path, calls, loop=None, **kwargs):
+    """ Serve `calls` on a unix socket.  Returns the asyncio server;  Each
+    connection gets its own Channel. """
+    on_connect, channels = _channel_factory(calls, loop, kwargs)
+    server = await asyncio.start_unix_server(on_connect, path, loop=loop)
+    server.channels = channels
+    return server
+
+
+async def serve_tcp(host, port, calls, loop=None, **kwargs):
+    """ Serve `calls` on a TCP port;  See serve(). """
+    on_connect, channels = _channel_factory(calls, loop, kwargs)
+    server = await asyncio.start_server(on_connect, host, port, loop=loop)
+    server.channels = channels
+    return server
@@ -2,11 +2,14 @@
 Handle setup for both coordinator and workers.
 """
 
+import argparse
 import asyncio
+import datetime
 import importlib
 import inspect
 import logging.handlers
 import shellish
+import time
 from .worker import command
 
 logger = logging.getLogger('setup')
@@ -63,10 +66,9 @@ def setup_logging(kind='console', level=None, verbose=False, fmt=None,
     root.addHandler(handler)
 
 
-def get_event_loop(policy='auto', debug=None):
-    """ Possibly set the event loop policy to use a designer event loop.
-    Return a default event loop (using the new policy) and possibly enable
-    debug. """
+def set_event_loop_policy(policy='auto'):
+    """ Possibly set the event loop policy to use a designer event loop
+    without creating an event loop. """
     if policy in {'auto', 'uvloop'}:
         try:
             import uvloop
@@ -77,6 +79,13 @@ def get_event_loop(policy='auto', debug=None):
         if uvloop is not None:
             logger.debug("Using uvloop")
             asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def get_event_loop(policy='auto', debug=None):
+    """ Possibly set the event loop policy to use a designer event loop.
+    Return a default event loop (using the new policy) and possibly enable
+    debug. """
+    set_event_loop_policy(policy)
     loop = asyncio.get_event_loop()
     if debug is not None:
         loop.set_debug(debug)
@@ -165,3 +174,26 @@ def worker_coerce(obj):
         raise TypeError('Worker must be a callable or shellish.Command.')
     return type('Workerized%s' % Command.__name__,
                 (command.WorkerCommand, Command), {})
+
+
+def run_worker(WorkerCmd, ident, bootenv, loop=None, timings=None):
+    """ Instantiate and run a WorkerCommand type using the context sent by
+    the coordinator.  This blocks until the worker exits.  Any startup
+    `timings` are reported back to the coordinator by the rpc plugin. """
+    settings = bootenv['settings'] or {}
+    if loop is None:
+        loop = get_event_loop(**settings.get('event_loop', {}))
+    worker_cmd = WorkerCmd(ident=ident, config=bootenv['config'], loop=loop)
+    if timings:
+        worker_cmd.timings.update(timings)
+    if settings.get('error_verbosity') is not None:
+        session = worker_cmd.get_or_create_session()
+        session.command_error_verbosity = settings['error_verbosity']
+    start = time.monotonic()
+    try:
+        worker_cmd(args=argparse.Namespace(**(bootenv['args'] or {})))
+    finally:
+        uptime = round(time.monotonic() - start)
+        logger.warning('Worker exited after %s' %
+                       datetime.timedelta(seconds=uptime))
+        loop.close()
@@ -0,0 +1,93 @@
+"""
+Read-only datasets shared by all workers.
+
+The coordinator places each dataset in a file under its IPC directory (or
+uses an existing file in place) and hands workers a handle through the
+worker config.  Workers map the file read-only so every worker shares the
+same physical pages instead of loading a private copy.
+"""
+
+import mmap
+import os
+import shutil
+
+_maps = {}
+
+
+class SharedSegment(object):
+    """ Coordinator side record of a shared dataset. """
+
+    def __init__(self, name, path, size, owned):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.owned = owned
+
+    def __str__(self):
+        return '<%s %s: %s (%d bytes)>' % (type(self).__name__, self.name,
+                                           self.path, self.size)
+
+    @classmethod
+    def create(cls, directory, name, source, copy=False):
+        """ Create a segment from bytes-like data, a readable binary file
+        object or the path of an existing file.  Files are mapped in place
+        unless `copy` is set.  This does blocking I/O. """
+        if '/' in name or name.startswith('.'):
+            raise ValueError('Invalid segment name: %r' % name)
+        if isinstance(source, str) and not copy:
+            return cls(name, os.path.abspath(source),
+                       os.path.getsize(source), owned=False)
+        path = os.path.join(directory, 'shared-%s' % name)
+        with open(path, 'wb') as f:
+            if isinstance(source, str):
+                with open(source, 'rb') as src:
+                    shutil.copyfileobj(src, f)
+            elif hasattr(source, 'read'):
+                shutil.copyfileobj(source, f)
+            else:
+                f.write(source)
+            size = f.tell()
+        os.chmod(path, 0o400)
+        return cls(name, path, size, owned=True)
+
+    def handle(self):
+        """ Picklable description passed to workers. """
+        return {
+            "path": self.path,
+            "size": self.size
+        }
+
+    def remove(self):
+        if self.owned:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def attach(handle):
+    """ Return a read-only memoryview of a shared segment.  Mappings are
+    cached so attaching the same segment twice is free. """
+    path = handle['path']
+    try:
+        return memoryview(_maps[path])
+    except KeyError:
+        pass
+    if not handle['size']:
+        return memoryview(b'')
+    with open(path, 'rb') as f:
+        m = mmap.mmap(f.fileno(), handle['size'], access=mmap.ACCESS_READ)
+    _maps[path] = m
+    return memoryview(m)
+
+
+def as_array(view, dtype='uint8', shape=None):
+    """ Zero-copy NumPy array over a shared memoryview. """
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("numpy module not available")
+    array = numpy.frombuffer(view, dtype=dtype)
+    if shape is not None:
+        array = array.reshape(shape)
+    return array
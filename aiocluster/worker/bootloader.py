@@ -2,8 +2,6 @@
 This module should only ever be used by the spawn() routine.
 """
 
-import argparse
-import datetime
 import logging
 import os
 import shellish
@@ -19,36 +17,33 @@ class Launcher(shellish.Command):
 
     This is called by worker.spawn() to load a new python process who
     shares some context and identity with the parent without using a
-    fork-without-exec pattern.  Context is passed through the temporary env
-    variable that is purged on startup to avoid blatantly sharing secrets. """
+    fork-without-exec pattern.  Context is read from a boot payload file in
+    the coordinator's private IPC directory or, when no payload is given,
+    from a temporary env variable that is purged on startup to avoid
+    blatantly sharing secrets. """
 
     name = 'launcher'
 
     def setup_args(self, parser):
         self.add_argument('worker_spec')
         self.add_argument('ident', type=int)
+        self.add_argument('payload', nargs='?')
 
     def run(self, args):
-        """ Extract configuration from the shell ENV.  Then run the appropriate
-        WorkerCommand. """
-        bootenv = env.decode(os.environ.pop('_AIOCLUSTER_BOOTLOADER'))
+        """ Extract configuration from the boot payload or shell ENV.  Then
+        run the appropriate WorkerCommand. """
+        start = time.monotonic()
+        if args.payload:
+            bootenv = env.load(args.payload)
+        else:
+            bootenv = env.decode(os.environ.pop('_AIOCLUSTER_BOOTLOADER'))
         settings = bootenv['settings'] or {}
         setup.setup_logging(**settings.get('logging', {}))
         loop = setup.get_event_loop(**settings.get('event_loop', {}))
         WorkerCmd = setup.worker_coerce(setup.find_worker(args.worker_spec))
-        worker_cmd = WorkerCmd(ident=args.ident, config=bootenv['config'],
-                               loop=loop)
-        if settings.get('error_verbosity') is not None:
-            session = worker_cmd.get_or_create_session()
-            session.command_error_verbosity = settings['error_verbosity']
-        start = time.monotonic()
-        try:
-            worker_cmd(args=argparse.Namespace(**(bootenv['args'] or {})))
-        finally:
-            uptime = round(time.monotonic() - start)
-            logger.warning('Worker exited after %s' %
-                           datetime.timedelta(seconds=uptime))
-            loop.close()
+        timings = {"import": time.monotonic() - start}
+        setup.run_worker(WorkerCmd, args.ident, bootenv, loop=loop,
+                         timings=timings)
 
 
 if __name__ == '__main__':
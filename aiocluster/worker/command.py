@@ -17,9 +17,13 @@ NOTES:
 
 import aionanomsg
 import asyncio
+import contextlib
 import logging
+import os
 import shellish
-from ..diag.worker import profiler, memory
+import time
+from .. import bus, rpc, shared
+from ..diag.worker import profiler, memory, looplag, history
 
 logger = logging.getLogger('worker.command')
 _plugins = {}
@@ -28,21 +32,40 @@ _plugins = {}
 
 class WorkerCommand(shellish.Command):
     """ Lifecycle management for the meat and potatos side of an AIO
-    service. """
+    service.
+
+    By default a worker tells the coordinator it is ready as soon as its
+    plugins are started.  Subclasses that need to do setup in run() first,
+    such as opening listeners, should set `auto_ready` to False and await
+    ready() themselves.
+
+    Before a worker is stopped the coordinator drains it;  drain() is called
+    so new work can be refused and the coordinator waits for any work being
+    tracked with inflight() to finish. """
+
+    auto_ready = True
 
     def __init__(self, *, ident=None, config=None, loop=None, **kwargs):
         self.ident = ident
         self.config = config or {}
+        self.timings = {}
         self._loop = loop
+        self._ready = False
+        self.draining = False
+        self.inflight_count = 0
         plugins = self.config.get('plugins', [])
         self._plugins = dict((x, _plugins[x](self, loop)) for x in plugins)
         super().__init__(**kwargs)
 
     def run_wrap(self, args):
         """ Awaitable support for run() and plugin support. """
+        start = time.monotonic()
         for name, plugin in self._plugins.items():
             logger.info("Starting plugin: %s" % name)
             self._loop.run_until_complete(plugin())
+        self.timings['plugins'] = time.monotonic() - start
+        if self.auto_ready:
+            self._loop.run_until_complete(self.ready())
         self.fire_event('prerun', args)
         self.prerun(args)
         try:
@@ -58,42 +81,98 @@ class WorkerCommand(shellish.Command):
             self.fire_event('postrun', args, result=result)
             return result
 
+    async def ready(self):
+        """ Tell the coordinator this worker is serving. """
+        if self._ready:
+            return
+        self._ready = True
+        rpc = self._plugins.get('rpc')
+        if rpc is not None:
+            await rpc.coord_rpc_call('worker_ready', self.ident, self.timings)
+
+    async def drain(self):
+        """ Stop accepting new work.  Subclasses should close listeners here
+        and let in-flight work finish. """
+        self.draining = True
+
+    @property
+    def bus(self):
+        """ The cluster message bus, Eg. `self.bus.queue('jobs')`. """
+        try:
+            return self._plugins['bus']
+        except KeyError:
+            raise RuntimeError('Bus plugin not enabled')
+
+    def shared(self, name):
+        """ Return a read-only memoryview of a dataset shared by the
+        coordinator.  Use aiocluster.shared.as_array() for a NumPy view. """
+        try:
+            handle = self.config['shared'][name]
+        except KeyError:
+            raise KeyError('No shared segment: %s' % name)
+        return shared.attach(handle)
+
+    @contextlib.contextmanager
+    def inflight(self):
+        """ Track a unit of work so a drain can wait for it to finish.
+
+            with worker.inflight():
+                await handle_request(request)
+        """
+        self.inflight_count += 1
+        try:
+            yield
+        finally:
+            self.inflight_count -= 1
+
 
 class RPCPlugin(object):
     """ RPC management for the meat and potato's side of an AIO
     command. """
 
     def __init__(self, worker, loop):
+        self._worker = worker
         self._worker_ident = worker.ident
         self._loop = loop
         self._ipc_dir = worker.config['ipc_dir']
         self._coord_rpc_addr = worker.config['coord_rpc_addr']
         self._coord_rpc_client = aionanomsg.RPCClient(aionanomsg.NN_REQ)
-        self._worker_rpc_server = aionanomsg.RPCServer(aionanomsg.NN_REP)
-        self._worker_rpc_calls_preinit = []
+        self._worker_rpc_server = None
+        self._worker_rpc_calls = {}
+        self.server_addr = None
+        self.add_handler('worker_drain', self.drain)
+        self.add_handler('worker_inflight', self.inflight)
         profiler.ProfilerRPCHandler(self)
         memory.MemoryRPCHandler(self)
+        looplag.LoopLagRPCHandler(self)
+        history.HistoryRPCHandler(self)
 
     async def __call__(self):
         self._coord_rpc_client.connect(self._coord_rpc_addr)
-        for callback, name in self._worker_rpc_calls_preinit:
-            self._worker_rpc_server.add_call(callback, name=name)
-        self._worker_rpc_calls_preinit = None
-        server_addr = 'ipc://%s/worker-rpc-%s' % (self._ipc_dir,
-            self._worker_ident)
-        self._worker_rpc_server.bind(server_addr)
-        self._loop.create_task(self._worker_rpc_server.start())
+        self.server_addr = server_addr = os.path.join(self._ipc_dir,
+            'worker-rpc-%s' % self._worker_ident)
+        options = self._worker.config.get('rpc', {})
+        self._worker_rpc_server = await rpc.serve(server_addr,
+                                                  self._worker_rpc_calls,
+                                                  loop=self._loop, **options)
         await self.coord_rpc_call('register_worker_rpc', self._worker_ident,
                                   server_addr)
 
+    async def drain(self):
+        """ Return the number of work units still in flight. """
+        if not self._worker.draining:
+            logger.warning("Draining worker")
+            await self._worker.drain()
+        return self._worker.inflight_count
+
+    async def inflight(self):
+        return self._worker.inflight_count
+
     async def coord_rpc_call(self, call, *args, **kwargs):
         return await self._coord_rpc_client.call(call, *args, **kwargs)
 
     def add_handler(self, name, callback):
-        # assert self._worker_rpc_calls_preinit is None, "let's not do this"
-        if self._worker_rpc_calls_preinit is not None:
-            self._worker_rpc_calls_preinit.append((callback, name))
-        else:
-            self._worker_rpc_server.add_call(callback, name=name)
+        self._worker_rpc_calls[name] = callback
 
 _plugins['rpc'] = RPCPlugin
+_plugins['bus'] = bus.BusPlugin
@@ -1,9 +1,15 @@
 """
-Serializer using environment vars.
+Serializers for the context a coordinator hands to new workers.
+
+The preferred transport is a BootPayload;  A file in the coordinator's IPC
+directory that is written once and read by every worker spawned with it.
+The environment variable transport is kept for standalone use of spawn().
 """
 
 import base64
+import os
 import pickle
+import tempfile
 
 
 def encode(data):
@@ -12,3 +18,31 @@ def encode(data):
 
 def decode(value):
     return pickle.loads(base64.b64decode(value))
+
+
+def load(path):
+    """ Read a BootPayload file. """
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+class BootPayload(object):
+    """ Worker context serialized once and shared by all spawns.  The size is
+    only limited by the filesystem holding `directory`. """
+
+    def __init__(self, directory, data):
+        fd, self.path = tempfile.mkstemp(prefix='boot-', suffix='.pickle',
+                                         dir=directory)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self.size = f.tell()
+
+    def __str__(self):
+        return '<%s %s (%d bytes)>' % (type(self).__name__, self.path,
+                                       self.size)
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
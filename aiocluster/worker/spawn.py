@@ -23,7 +23,10 @@ async def spawn(worker_spec, **kwargs):
     fork-without-exec pattern;  Instead the current python env is inspected
     and used as a reference for a new python execution.  Arguments and context
     are serialized and passed to a bootloader function that turns them back
-    into python types. """
+    into python types.  Context is read from `payload`, a BootPayload, if
+    provided or passed through the environment otherwise.
+
+    If a `zygote` is provided the worker is forked from it instead. """
     pycmd = sys.executable
     pyflags = subprocess._args_from_interpreter_flags()
     wp = WorkerProcess(worker_spec, pycmd, pyflags, **kwargs)
@@ -37,29 +40,47 @@ class WorkerProcess(object):
     """ Used by the coordinator process to track a WorkerCommand subprocess. """
 
     identer = itertools.count()
+    states = ('spawning', 'registered', 'ready', 'draining', 'exited')
     spec_regex = re.compile(r'([a-z_][0-9a-z_]*(\.(?=[a-z_]))?)+', re.I)
 
     def __init__(self, spec, pycmd, pyflags, worker_settings=None,
                  worker_config=None, worker_args=None, loop=None,
-                 bootloader=default_bootloader):
+                 bootloader=default_bootloader, zygote=None, slot=None,
+                 payload=None):
         self.util = None
         self.ident = next(self.identer)
+        self.slot = slot
         self.created = self._now()
         self.spec = spec
         self.process = None
+        self.rpc = None
+        self.monitor_task = None
+        self.retired = False
+        self.state = 'spawning'
+        self._visited = {'spawning'}
+        self._state_changed = asyncio.Event(loop=loop)
+        self.start_time = None
+        self.start_timings = {}
         self._loop = loop
-        self._env = os.environ.copy()
-        self._env["_AIOCLUSTER_BOOTLOADER"] = env.encode({
-            "settings": worker_settings,
-            "config": worker_config,
-            "args": worker_args,
-        })
+        self._zygote = zygote
+        self._payload = payload
+        if payload is None:
+            self._bootenv = {
+                "settings": worker_settings,
+                "config": worker_config,
+                "args": worker_args,
+            }
+        else:
+            self._bootenv = None
         self._cmd = pycmd, *pyflags, '-m', bootloader, spec, str(self.ident)
+        if payload is not None:
+            self._cmd += payload.path,
 
     def __str__(self):
         pid = '-' if self.process is None else self.process.pid
-        return '<%s:%d [%s] pid=%s, age=%s>' % (type(self).__name__,
-            self.ident, self.spec, pid, self.age())
+        return '<%s:%d [%s] slot=%s, pid=%s, state=%s, age=%s>' % (
+            type(self).__name__, self.ident, self.spec, self.slot, pid,
+            self.state, self.age())
 
     def _now(self):
         return datetime.datetime.now()
@@ -68,7 +89,53 @@ class WorkerProcess(object):
         return self._now() - self.created
 
     async def start(self):
-        self.process = await asyncio.create_subprocess_exec(*self._cmd,
-            env=self._env, loop=self._loop)
+        if self._zygote is not None:
+            self.process = await self._zygote.fork(self.ident,
+                bootenv=self._bootenv, payload=self._payload)
+        else:
+            if self._payload is None:
+                penv = os.environ.copy()
+                penv["_AIOCLUSTER_BOOTLOADER"] = env.encode(self._bootenv)
+            else:
+                penv = None  # Inherit ours
+            self.process = await asyncio.create_subprocess_exec(*self._cmd,
+                env=penv, loop=self._loop)
         self.util = psutil.Process(self.process.pid)
         self.util.cpu_percent(None)  # prime cpu usage stat
+
+    def set_state(self, state):
+        """ Advance the lifecycle state.  States only move forward but may
+        be skipped, Eg. a worker can go from `registered` to `exited`. """
+        offt = self.states.index(state)
+        if offt <= self.states.index(self.state):
+            if state != self.state:
+                logger.debug("Ignoring backward state change (%s -> %s): "
+                               "%s" % (self.state, state, self))
+            return
+        logger.debug("Worker state change (%s -> %s): %s" % (self.state,
+                     state, self))
+        self.state = state
+        self._visited.add(state)
+        self._state_changed.set()
+        self._state_changed = asyncio.Event(loop=self._loop)
+
+    async def wait_state(self, state, timeout=None):
+        """ Wait until the worker has reached (or passed) `state`.  If the
+        worker exits or moves past `state` without ever being in it a
+        RuntimeError is raised. """
+        offt = self.states.index(state)
+
+        async def waiter():
+            while self.states.index(self.state) < offt:
+                await self._state_changed.wait()
+            if self.state == 'exited' and state != 'exited':
+                raise RuntimeError('Worker exited before reaching %s state: '
+                                   '%s' % (state, self))
+            if state not in self._visited:
+                raise RuntimeError('Worker skipped %s state: %s' % (state,
+                                   self))
+        await asyncio.wait_for(waiter(), timeout, loop=self._loop)
+
+    async def wait_ready(self, timeout=None):
+        """ Wait for the worker to be able to do work. """
+        await self.wait_state('ready', timeout=timeout)
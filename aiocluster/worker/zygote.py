@@ -0,0 +1,220 @@
+"""
+Zygote spawn mode.
+
+A zygote is a template interpreter that has already imported the aiocluster
+stack and the user's worker module.  New workers are forked from it on
+request instead of running a fresh interpreter for every worker, which makes
+worker startup much cheaper when the worker imports are heavy.
+
+Because forked workers share the zygote's memory image, worker modules
+must not create event loops, threads or sockets at import time when this
+mode is used.
+"""
+
+import asyncio
+import logging
+import os
+import pickle
+import signal
+import struct
+import subprocess
+import sys
+from . import env
+
+logger = logging.getLogger('worker.zygote')
+default_loader = 'aiocluster.worker.zygoteloader'
+_header = struct.Struct('!I')
+
+
+def pack(msg):
+    """ Frame a control message for the zygote pipes. """
+    data = pickle.dumps(msg)
+    return _header.pack(len(data)) + data
+
+
+def unpack_stream(buf):
+    """ Return complete messages from `buf` and any leftover bytes. """
+    msgs = []
+    while len(buf) >= _header.size:
+        size = _header.unpack_from(buf)[0]
+        end = _header.size + size
+        if len(buf) < end:
+            break
+        msgs.append(pickle.loads(buf[_header.size:end]))
+        buf = buf[end:]
+    return msgs, buf
+
+
+class ZygoteProcess(object):
+    """ Look-alike for asyncio.subprocess.Process representing a worker that
+    was forked by a zygote.  We are not the parent of this process so the exit
+    status is relayed to us by the zygote. """
+
+    def __init__(self, pid, loop=None):
+        self.pid = pid
+        self.returncode = None
+        self._exited = asyncio.Event(loop=loop)
+
+    def _set_returncode(self, returncode):
+        self.returncode = returncode
+        self._exited.set()
+
+    async def wait(self):
+        await self._exited.wait()
+        return self.returncode
+
+    def send_signal(self, sig):
+        if self.returncode is not None:
+            raise ProcessLookupError()
+        os.kill(self.pid, sig)
+
+    def terminate(self):
+        self.send_signal(signal.SIGTERM)
+
+    def kill(self):
+        self.send_signal(signal.SIGKILL)
+
+
+class Zygote(object):
+    """ Used by the coordinator process to manage a zygote subprocess and the
+    workers forked from it. """
+
+    def __init__(self, worker_spec, worker_settings=None, loop=None,
+                 loader=default_loader):
+        self.worker_spec = worker_spec
+        self.process = None
+        self._worker_settings = worker_settings
+        self._loop = loop
+        self._loader = loader
+        self._reader = None
+        self._writer = None
+        self._reader_task = None
+        self._forks = {}
+        self._children = {}
+
+    def __str__(self):
+        pid = '-' if self.process is None else self.process.pid
+        return '<%s [%s] pid=%s, children=%d>' % (type(self).__name__,
+            self.worker_spec, pid, self.children)
+
+    @property
+    def children(self):
+        """ Number of live workers forked from this zygote. """
+        return len(self._children)
+
+    async def start(self):
+        """ Start the template interpreter and wait for it to finish
+        importing the worker. """
+        req_r, req_w = os.pipe()
+        rep_r, rep_w = os.pipe()
+        zenv = os.environ.copy()
+        zenv["_AIOCLUSTER_BOOTLOADER"] = env.encode({
+            "settings": self._worker_settings,
+        })
+        pyflags = subprocess._args_from_interpreter_flags()
+        cmd = (sys.executable, *pyflags, '-m', self._loader, self.worker_spec,
+               str(req_r), str(rep_w))
+        try:
+            self.process = await asyncio.create_subprocess_exec(*cmd,
+                env=zenv, pass_fds=(req_r, rep_w), loop=self._loop)
+        except:
+            os.close(req_w)
+            os.close(rep_r)
+            raise
+        finally:
+            os.close(req_r)
+            os.close(rep_w)
+        self._reader = asyncio.StreamReader(loop=self._loop)
+        protocol = asyncio.StreamReaderProtocol(self._reader, loop=self._loop)
+        await self._loop.connect_read_pipe(lambda: protocol,
+                                           os.fdopen(rep_r, 'rb', 0))
+        transport, protocol = await self._loop.connect_write_pipe(
+            asyncio.streams.FlowControlMixin, os.fdopen(req_w, 'wb', 0))
+        self._writer = asyncio.StreamWriter(transport, protocol, None,
+                                            self._loop)
+        try:
+            kind, *details = await self._read_msg()
+        except asyncio.IncompleteReadError:
+            kind, details = 'error', ['exited during startup']
+        if kind != 'ready':
+            self._writer.close()
+            await self.process.wait()
+            raise RuntimeError('Zygote failed to start: %s' % details[-1])
+        self._reader_task = self._loop.create_task(self._read_loop())
+        logger.info("Zygote ready: %s" % self)
+
+    async def stop(self):
+        """ Close the control pipe which instructs the zygote to exit. """
+        if self.process is None:
+            return
+        self._writer.close()
+        await self.process.wait()
+        await self._reader_task
+        self.process = None
+
+    async def fork(self, ident, bootenv=None, payload=None):
+        """ Request a new worker process from the zygote.  The worker context
+        is either a `bootenv` dict or a BootPayload, which the zygote only
+        reads once.  Returns a process handle compatible with
+        asyncio.subprocess.Process. """
+        if self._reader_task is None or self._reader_task.done():
+            raise RuntimeError('Zygote is not running')
+        if (bootenv is None) is (payload is None):
+            raise TypeError('bootenv or payload required')
+        path = payload and payload.path
+        f = self._forks[ident] = asyncio.Future(loop=self._loop)
+        self._writer.write(pack(('fork', ident, path, bootenv)))
+        try:
+            await self._writer.drain()
+            return await f
+        finally:
+            self._forks.pop(ident, None)
+
+    async def _read_msg(self):
+        size = _header.unpack(await self._reader.readexactly(_header.size))[0]
+        return pickle.loads(await self._reader.readexactly(size))
+
+    async def _read_loop(self):
+        try:
+            while True:
+                try:
+                    kind, *details = await self._read_msg()
+                except asyncio.IncompleteReadError:
+                    break
+                if kind == 'forked':
+                    ident, pid = details
+                    proc = self._children[pid] = ZygoteProcess(pid, self._loop)
+                    f = self._forks.get(ident)
+                    if f is not None and not f.done():
+                        f.set_result(proc)
+                elif kind == 'exited':
+                    pid, returncode = details
+                    proc = self._children.pop(pid, None)
+                    if proc is not None:
+                        proc._set_returncode(returncode)
+                elif kind == 'error':
+                    ident, msg = details
+                    f = self._forks.get(ident)
+                    if f is not None and not f.done():
+                        f.set_exception(RuntimeError(msg))
+                else:
+                    logger.error("Invalid zygote message: %s" % kind)
+        finally:
+            self._abandon()
+
+    def _abandon(self):
+        """ The zygote is gone so nobody is left to report on our children.
+        Kill anything still around and fail pending requests. """
+        if self._children:
+            logger.critical("Zygote exited with %d live children" %
+                            len(self._children))
+        for proc in self._children.values():
+            try:
+                os.kill(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            proc._set_returncode(-signal.SIGKILL)
+        self._children.clear()
+        for f in self._forks.values():
+            if not f.done():
+                f.set_exception(RuntimeError('Zygote exited'))
@@ -0,0 +1,171 @@
+"""
+This module should only ever be used by the zygote.Zygote class.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import selectors
+import shellish
+import signal
+import sys
+import traceback
+from . import env, zygote
+from .. import setup
+
+logger = logging.getLogger('worker.zygoteloader')
+
+
+class ZygoteLoader(shellish.Command):
+    """ Zygote template interpreter [Internal use only]
+
+    Import the worker once and then fork new workers from this process on
+    request from the coordinator.  Requests come over the `request_fd` pipe
+    and births and deaths of workers are reported on the `reply_fd` pipe. """
+
+    name = 'zygoteloader'
+
+    def setup_args(self, parser):
+        self.add_argument('worker_spec')
+        self.add_argument('request_fd', type=int)
+        self.add_argument('reply_fd', type=int)
+
+    def run(self, args):
+        self.request_fd = args.request_fd
+        self.reply_fd = args.reply_fd
+        self.children = set()
+        self.payloads = {}
+        bootenv = env.decode(os.environ.pop('_AIOCLUSTER_BOOTLOADER'))
+        settings = bootenv['settings'] or {}
+        setup.setup_logging(**settings.get('logging', {}))
+        policy = settings.get('event_loop', {}).get('policy', 'auto')
+        setup.set_event_loop_policy(policy)
+        try:
+            WorkerCmd = setup.worker_coerce(
+                setup.find_worker(args.worker_spec))
+        except Exception as e:
+            self.send('error', None, '%s: %s' % (type(e).__name__, e))
+            raise
+        self.WorkerCmd = WorkerCmd
+        self.send('ready', os.getpid())
+        self.serve()
+
+    def send(self, *msg):
+        os.write(self.reply_fd, zygote.pack(msg))
+
+    def serve(self):
+        self.sig_r, self.sig_w = os.pipe()
+        os.set_blocking(self.sig_w, False)
+        signal.set_wakeup_fd(self.sig_w)
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+        self.selector = sel = selectors.DefaultSelector()
+        sel.register(self.request_fd, selectors.EVENT_READ)
+        sel.register(self.sig_r, selectors.EVENT_READ)
+        buf = b''
+        while True:
+            for key, _ in sel.select():
+                if key.fd == self.sig_r:
+                    os.read(self.sig_r, 4096)
+                    continue
+                data = os.read(self.request_fd, 65536)
+                if not data:
+                    return self.shutdown()
+                msgs, buf = zygote.unpack_stream(buf + data)
+                for kind, *details in msgs:
+                    if kind == 'fork':
+                        self.fork_worker(*details)
+                    else:
+                        logger.error("Invalid zygote request: %s" % kind)
+            self.reap()
+
+    def reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if not pid:
+                break
+            self.children.discard(pid)
+            if os.WIFSIGNALED(status):
+                returncode = -os.WTERMSIG(status)
+            else:
+                returncode = os.WEXITSTATUS(status)
+            self.send('exited', pid, returncode)
+
+    def shutdown(self):
+        """ The coordinator closed our control pipe. """
+        for pid in self.children:
+            logger.warning("Terminating orphaned worker: %d" % pid)
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def fork_worker(self, ident, payload_path, bootenv):
+        if payload_path is not None:
+            try:
+                bootenv = self.payloads[payload_path]
+            except KeyError:
+                try:
+                    bootenv = env.load(payload_path)
+                except Exception as e:
+                    self.send('error', ident, 'Payload load failed: %s' % e)
+                    return
+                self.payloads[payload_path] = bootenv
+        try:
+            pid = os.fork()
+        except OSError as e:
+            self.send('error', ident, 'Fork failed: %s' % e)
+            return
+        if pid:
+            self.children.add(pid)
+            self.send('forked', ident, pid)
+            return
+        returncode = 1
+        try:
+            self.child_reset()
+            loop = self.child_event_loop(bootenv)
+            setup.run_worker(self.WorkerCmd, ident, bootenv, loop=loop,
+                             timings={"import": 0})
+            returncode = 0
+        except SystemExit as e:
+            if e.code is None:
+                returncode = 0
+            elif isinstance(e.code, int):
+                returncode = e.code
+            else:
+                print(e.code, file=sys.stderr)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(returncode)
+
+    def child_reset(self):
+        """ Undo zygote specific state in a freshly forked worker. """
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        self.selector.close()
+        for fd in (self.request_fd, self.reply_fd, self.sig_r, self.sig_w):
+            os.close(fd)
+        random.seed()
+
+    def child_event_loop(self, bootenv):
+        """ An event loop created at import time would be shared with every
+        sibling, so close it and start over with a private loop. """
+        settings = (bootenv['settings'] or {}).get('event_loop', {})
+        asyncio.get_event_loop().close()
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        if settings.get('debug') is not None:
+            loop.set_debug(settings['debug'])
+        return loop
+
+
+if __name__ == '__main__':
+    ZygoteLoader()()
+else:
+    raise ImportError("Do not use zygoteloader module directly")
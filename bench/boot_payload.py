@@ -0,0 +1,89 @@
+"""
+Worker spawn cost vs boot payload size for the env variable transport and
+the shared BootPayload file transport.
+
+To run `python3 -m bench.boot_payload [--spawns N]` from the root of the
+source tree.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from aiocluster import worker
+from aiocluster.worker import env
+
+sizes = (1 << 10, 1 << 14, 1 << 17, 1 << 20, 1 << 24)
+
+
+def quick_exit(s):
+    pass
+
+
+def make_context(size):
+    return {
+        "settings": None,
+        "config": {"table": os.urandom(size)},
+        "args": None,
+    }
+
+
+async def spawn_env(ctx, spawns, loop):
+    times = []
+    for i in range(spawns):
+        start = time.perf_counter()
+        wp = await worker.spawn('bench.boot_payload.quick_exit',
+                                worker_settings=ctx['settings'],
+                                worker_config=ctx['config'],
+                                worker_args=ctx['args'], loop=loop)
+        times.append(time.perf_counter() - start)
+        await wp.process.wait()
+    return times
+
+
+async def spawn_payload(ctx, spawns, directory, loop):
+    start = time.perf_counter()
+    payload = env.BootPayload(directory, ctx)
+    setup = time.perf_counter() - start
+    times = []
+    for i in range(spawns):
+        start = time.perf_counter()
+        wp = await worker.spawn('bench.boot_payload.quick_exit',
+                                payload=payload, loop=loop)
+        times.append(time.perf_counter() - start)
+        await wp.process.wait()
+    payload.remove()
+    return setup, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--spawns', type=int, default=10)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    directory = tempfile.TemporaryDirectory(prefix='aiocluster-bench-')
+    print('%10s %14s %14s %14s' % ('size', 'env (ms)', 'payload (ms)',
+          'write once (ms)'))
+    for size in sizes:
+        ctx = make_context(size)
+        try:
+            env_times = loop.run_until_complete(spawn_env(ctx, args.spawns,
+                                                          loop))
+        except OSError as e:
+            env_ms = 'E%s' % e.errno  # Eg. E2BIG when over env limits.
+        else:
+            env_ms = '%.2f' % (statistics.mean(env_times) * 1000)
+        setup, times = loop.run_until_complete(spawn_payload(ctx,
+            args.spawns, directory.name, loop))
+        print('%10d %14s %14.2f %14.2f' % (size, env_ms,
+              statistics.mean(times) * 1000, setup * 1000))
+    directory.cleanup()
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
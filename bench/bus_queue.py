@@ -0,0 +1,89 @@
+"""
+Message bus queue throughput in messages per second for various batch
+sizes and consumer counts.  Producers and consumers are separate channels
+to an in-process broker over a unix socket, the same transport workers use.
+
+To run `python3 -m bench.bus_queue [--messages N]` from the root of the
+source tree.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import types
+from aiocluster import bus, rpc
+
+batch_sizes = (1, 10, 100)
+consumer_counts = (1, 4)
+
+
+async def connect(ident, path, loop):
+    worker = types.SimpleNamespace(ident=ident, config={"bus_addr": path},
+                                   _plugins={})
+    plugin = bus.BusPlugin(worker, loop)
+    await plugin()
+    return plugin
+
+
+async def produce(plugin, messages, batch, payload):
+    q = plugin.queue('bench')
+    for i in range(0, messages, batch):
+        await q.push(*[payload] * min(batch, messages - i))
+
+
+async def consume(plugin, counter, messages, batch):
+    q = plugin.queue('bench')
+    while counter[0] < messages:
+        msgs = await q.pull(max_items=batch, timeout=0.1)
+        if msgs:
+            counter[0] += len(msgs)
+            await q.ack(*msgs)
+
+
+async def run(path, messages, batch, consumers, payload, loop):
+    producer = await connect('producer', path, loop)
+    clients = [await connect('consumer-%d' % i, path, loop)
+               for i in range(consumers)]
+    counter = [0]
+    start = time.perf_counter()
+    await asyncio.gather(produce(producer, messages, batch, payload),
+                         *[consume(x, counter, messages, batch)
+                           for x in clients], loop=loop)
+    elapsed = time.perf_counter() - start
+    for x in [producer] + clients:
+        x._channel.close()
+    return messages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--payload', type=int, default=100)
+    parser.add_argument('--queue-size', type=int, default=1000)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    directory = tempfile.TemporaryDirectory(prefix='aiocluster-bench-')
+    path = os.path.join(directory.name, 'bus')
+    broker = bus.Broker(queue_maxsize=args.queue_size, loop=loop)
+    server = loop.run_until_complete(rpc.serve(path, broker.calls, loop=loop))
+    payload = os.urandom(args.payload)
+    print('%8s %10s %14s' % ('batch', 'consumers', 'msgs/sec'))
+    for batch in batch_sizes:
+        for consumers in consumer_counts:
+            rate = loop.run_until_complete(run(path, args.messages, batch,
+                                               consumers, payload, loop))
+            print('%8d %10d %14.0f' % (batch, consumers, rate))
+    server.close()
+    for x in server.channels:
+        x.close()
+    loop.run_until_complete(server.wait_closed())
+    directory.cleanup()
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Encode and decode cost of the RPC codecs and compressors for profiler
+report shaped payloads of increasing size.
+
+To run `python3 -m bench.codec [--rounds N]` from the root of the source
+tree.  Install lz4 and/or zstandard to include those compressors.
+"""
+
+import argparse
+import random
+import time
+from aiocluster import codec
+
+sizes = (10, 100, 1000, 10000)
+
+
+def make_report(entries):
+    """ Mimic ProfilerRPCHandler.report() output. """
+    rand = random.Random(entries)
+
+    def call():
+        return {
+            "file": '/usr/lib/python3/site-packages/pkg/module%d.py' %
+                    rand.randint(0, 200),
+            "lineno": rand.randint(1, 5000),
+            "function": 'func_%d' % rand.randint(0, 10000),
+        }
+
+    def stats():
+        return {
+            "callcount": rand.randint(1, 100000),
+            "reccallcount": rand.randint(0, 10),
+            "totaltime": rand.random(),
+            "inlinetime": rand.random(),
+        }
+    return [{
+        "call": call(),
+        "stats": stats(),
+        "callers": [{
+            "call": call(),
+            "stats": stats(),
+        } for x in range(rand.randint(0, 4))]
+    } for x in range(entries)]
+
+
+def timeit(fn, arg, rounds):
+    start = time.perf_counter()
+    for i in range(rounds):
+        result = fn(arg)
+    return (time.perf_counter() - start) / rounds, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    print('%8s %8s %6s %12s %12s %12s' % ('entries', 'codec', 'comp',
+          'bytes', 'encode (ms)', 'decode (ms)'))
+    for size in sizes:
+        report = make_report(size)
+        for c in codec.codecs.values():
+            enc_time, data = timeit(c.encode, report, args.rounds)
+            dec_time, _ = timeit(c.decode, data, args.rounds)
+            print('%8d %8s %6s %12d %12.3f %12.3f' % (size, c.name, '-',
+                  len(data), enc_time * 1000, dec_time * 1000))
+            for comp in codec.compressors.values():
+                ctime, cdata = timeit(comp.compress, data, args.rounds)
+                dtime, _ = timeit(comp.decompress, cdata, args.rounds)
+                print('%8d %8s %6s %12d %12.3f %12.3f' % (size, c.name,
+                      comp.name, len(cdata), (enc_time + ctime) * 1000,
+                      (dec_time + dtime) * 1000))
+
+
+if __name__ == '__main__':
+    main()
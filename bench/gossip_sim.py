@@ -0,0 +1,103 @@
+"""
+Gossip membership simulation.  Starts many nodes in one process on a
+simulated network, waits for them to converge and then kills one to measure
+how long until it is first suspected and until every node declares it dead.
+Bandwidth is reported per node per second over the whole run.
+
+To run `python3 -m bench.gossip_sim [--nodes N] [--loss RATIO]` from the
+root of the source tree.
+"""
+
+import argparse
+import asyncio
+import logging
+from aiocluster import federation, membership
+
+
+async def wait_for(test, loop, timeout):
+    deadline = loop.time() + timeout
+    while not test():
+        if loop.time() > deadline:
+            raise asyncio.TimeoutError()
+        await asyncio.sleep(0.005, loop=loop)
+    return loop.time()
+
+
+async def run(args, loop):
+    network = membership.LocalNetwork(latency=args.latency, loss=args.loss,
+                                      loop=loop)
+    settings = dict(protocol_period=args.period,
+                    ack_timeout=args.period * 0.3)
+    nodes = []
+    seeds = None
+    start = loop.time()
+    for i in range(args.nodes):
+        node = membership.Membership(network.transport(), seeds=seeds,
+                                     ident='node%d' % i, loop=loop,
+                                     **settings)
+        await node.start()
+        if seeds is None:
+            seeds = federation.StaticDiscovery([node.addr])
+        nodes.append(node)
+    converged = await wait_for(lambda: all(
+        len(x.alive_members()) == args.nodes - 1 for x in nodes), loop,
+        args.timeout)
+    print('Converged in %.2fs' % (converged - start))
+    print('Suspicion timeout %.2fs' % nodes[0].suspicion_timeout())
+
+    victim = nodes.pop()
+    first_suspect = []
+    false_suspects = []
+
+    def on_change(member, prev):
+        if member.ident != victim.ident:
+            if member.state != membership.ALIVE:
+                false_suspects.append(member.ident)
+        elif not first_suspect:
+            first_suspect.append(loop.time())
+
+    for x in nodes:
+        x.listeners.append(on_change)
+    killed = loop.time()
+    await victim.stop()
+
+    def states():
+        return [x.members[victim.ident].state for x in nodes
+                if victim.ident in x.members]
+    await wait_for(lambda: first_suspect, loop, args.timeout)
+    print('First suspected after %.2fs' % (first_suspect[0] - killed))
+    await wait_for(lambda: any(x == membership.DEAD for x in states()),
+                   loop, args.timeout)
+    print('First declared dead after %.2fs' % (loop.time() - killed))
+    await wait_for(lambda: all(x == membership.DEAD for x in states()),
+                   loop, args.timeout)
+    print('Dead on all nodes after %.2fs' % (loop.time() - killed))
+    print('False suspicions %d, refuted %d' % (
+          len(false_suspects), sum(x.stats['refuted'] for x in nodes)))
+
+    elapsed = loop.time() - start
+    msgs = sum(x.stats['sent_msgs'] for x in nodes) / len(nodes) / elapsed
+    sent = sum(x.stats['sent_bytes'] for x in nodes) / len(nodes) / elapsed
+    print('Per node: %.1f msgs/sec, %.0f bytes/sec' % (msgs, sent))
+    for x in nodes:
+        await x.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--nodes', type=int, default=32)
+    parser.add_argument('--period', type=float, default=0.2,
+                        help='Protocol period in seconds.')
+    parser.add_argument('--latency', type=float, default=0.001)
+    parser.add_argument('--loss', type=float, default=0,
+                        help='Ratio of messages dropped.')
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(run(args, loop))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""
+Slowdown of a CPU bound, call heavy workload under the deterministic and
+sampling profilers compared to running it unprofiled.
+
+To run `python3 -m bench.profiler_overhead [--rounds N]` from the root of the
+source tree.
+"""
+
+import argparse
+import cProfile
+import json
+import time
+from aiocluster.diag.worker import sampler
+
+
+def fib(n):
+    return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+
+def workload():
+    doc = {"items": [{"id": i, "name": 'item%d' % i} for i in range(200)]}
+    for i in range(20):
+        fib(18)
+        json.loads(json.dumps(doc))
+
+
+def measure(rounds):
+    best = None
+    for i in range(rounds):
+        start = time.perf_counter()
+        workload()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    measure(args.rounds)  # warm up
+    base = measure(args.rounds)
+    print('%-20s %10s %10s' % ('profiler', 'seconds', 'overhead'))
+    print('%-20s %10.4f %10s' % ('none', base, '-'))
+    prof = cProfile.Profile()
+    prof.enable()
+    elapsed = measure(args.rounds)
+    prof.disable()
+    print('%-20s %10.4f %9.1f%%' % ('deterministic', elapsed,
+                                    (elapsed / base - 1) * 100))
+    for hz in (100, 250, 1000):
+        profile = sampler.SampleProfile(hz=hz)
+        profile.enable()
+        elapsed = measure(args.rounds)
+        profile.disable()
+        collected = profile.collected()
+        print('%-20s %10.4f %9.1f%%  (%d samples, %.0f us each)' % (
+              'sampling %d Hz' % hz, elapsed, (elapsed / base - 1) * 100,
+              collected['samples'], collected['overhead'] /
+              max(collected['samples'], 1) * 1000000))
+
+
+if __name__ == '__main__':
+    main()
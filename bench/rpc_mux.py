@@ -0,0 +1,120 @@
+"""
+Coordinator to worker RPC throughput and latency for the nanomsg REQ/REP
+transport vs the multiplexed rpc.Channel.
+
+The `hol` column is the latency of a quick call made while a slow call
+(--slow-ms) is outstanding on the same connection;  head-of-line blocking
+shows up there.
+
+To run `python3 -m bench.rpc_mux [--calls N] [--concurrency N]` from the
+root of the source tree.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+from aiocluster import rpc
+
+
+async def echo(value):
+    return value
+
+
+def make_slow(delay, loop):
+    async def slow():
+        await asyncio.sleep(delay, loop=loop)
+    return slow
+
+
+async def setup_reqrep(directory, calls, loop):
+    import aionanomsg
+    addr = 'ipc://%s/bench-reqrep' % directory
+    server = aionanomsg.RPCServer(aionanomsg.NN_REP)
+    for name, callback in calls.items():
+        server.add_call(callback, name=name)
+    server.bind(addr)
+    loop.create_task(server.start())
+    client = aionanomsg.RPCClient(aionanomsg.NN_REQ)
+    client.connect(addr)
+
+    async def close():
+        server.stop()
+        await server.wait_stopped()
+    return client, close
+
+
+async def setup_mux(directory, calls, loop):
+    path = os.path.join(directory, 'bench-mux')
+    server = await rpc.serve(path, calls, loop=loop)
+    client = await rpc.Channel.connect(path, loop=loop)
+
+    async def close():
+        client.close()
+        server.close()
+        for x in server.channels:
+            x.close()
+        os.unlink(path)
+    return client, close
+
+
+async def run(setup, args, directory, loop):
+    calls = {
+        "echo": echo,
+        "slow": make_slow(args.slow_ms / 1000, loop)
+    }
+    client, close = await setup(directory, calls, loop)
+    payload = os.urandom(args.payload)
+    latencies = []
+    for i in range(args.calls):
+        start = time.perf_counter()
+        await client.call('echo', payload)
+        latencies.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    for i in range(0, args.calls, args.concurrency):
+        await asyncio.gather(*[client.call('echo', payload)
+                               for x in range(args.concurrency)], loop=loop)
+    throughput = args.calls / (time.perf_counter() - start)
+    slow = loop.create_task(client.call('slow'))
+    await asyncio.sleep(0.001, loop=loop)
+    start = time.perf_counter()
+    await client.call('echo', payload)
+    hol = time.perf_counter() - start
+    await slow
+    await close()
+    return latencies, throughput, hol
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--payload', type=int, default=64)
+    parser.add_argument('--slow-ms', type=float, default=50)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    directory = tempfile.TemporaryDirectory(prefix='aiocluster-bench-')
+    print('%8s %12s %12s %14s %10s' % ('mode', 'p50 (us)', 'p99 (us)',
+          'calls/sec', 'hol (ms)'))
+    for name, setup in (('reqrep', setup_reqrep), ('mux', setup_mux)):
+        try:
+            latencies, throughput, hol = loop.run_until_complete(
+                run(setup, args, directory.name, loop))
+        except Exception as e:
+            print('%8s %s: %s' % (name, type(e).__name__, e))
+            continue
+        latencies.sort()
+        p99 = latencies[int(len(latencies) * 0.99)]
+        print('%8s %12.1f %12.1f %14.0f %10.2f' % (name,
+              statistics.median(latencies) * 1e6, p99 * 1e6, throughput,
+              hol * 1000))
+    directory.cleanup()
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Worker startup latency: exec spawn mode vs zygote spawn mode.
+
+To run `python3 -m bench.spawn_latency [--workers N] [--rounds N]` from the
+root of the source tree.
+"""
+
+import aiocluster
+import argparse
+import asyncio
+import logging
+import statistics
+import time
+
+
+async def idle_worker(s):
+    while True:
+        await asyncio.sleep(3600)
+
+
+async def wait_registered(coord, loop):
+    while not all(getattr(x, 'rpc', None) for x in coord.workers.values()):
+        await asyncio.sleep(0.001, loop=loop)
+
+
+async def measure(mode, workers, loop):
+    """ Return the seconds taken to start and register all workers.  The
+    cost of starting the zygote itself is reported separately. """
+    coord = aiocluster.Coordinator('bench.spawn_latency.idle_worker',
+                                   worker_count=workers, spawn_mode=mode,
+                                   handle_sigint=False, handle_sigterm=False,
+                                   set_default=False, loop=loop)
+    await coord.start_rpc()
+    zygote_time = 0
+    if mode == 'zygote':
+        start = time.perf_counter()
+        await coord.start_zygote()
+        zygote_time = time.perf_counter() - start
+    start = time.perf_counter()
+    await coord.start_workers()
+    await wait_registered(coord, loop)
+    elapsed = time.perf_counter() - start
+    coord.stop()
+    await coord.wait_stopped()
+    return elapsed, zygote_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.CRITICAL)
+    loop = asyncio.get_event_loop()
+    print('%-8s %8s %12s %12s %12s' % ('mode', 'workers', 'mean (s)',
+          'per-worker', 'zygote (s)'))
+    for mode in ('exec', 'zygote'):
+        results = [loop.run_until_complete(measure(mode, args.workers, loop))
+                   for i in range(args.rounds)]
+        mean = statistics.mean(x[0] for x in results)
+        zmean = statistics.mean(x[1] for x in results)
+        print('%-8s %8d %12.3f %11.1fms %12.3f' % (mode, args.workers, mean,
+              mean / args.workers * 1000, zmean))
+    loop.close()
+
+
+if __name__ == '__main__':
+    main()
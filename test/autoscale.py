@@ -0,0 +1,100 @@
+
+from . import base
+from aiocluster import autoscale
+
+
+class FixedPolicy(autoscale.Policy):
+
+    def __init__(self, load):
+        self.load = load
+
+    async def measure(self, coordinator):
+        return self.load
+
+
+class FakeCoordinator(object):
+
+    def __init__(self, worker_count, loop):
+        self.worker_count = worker_count
+        self.restart_status = None
+        self.stats = {}
+        self.scaled = []
+        self._stopping = False
+        self._loop = loop
+
+    async def scale_workers(self, count):
+        self.scaled.append(count)
+        self.worker_count = count
+
+
+class AutoscalerTests(base.AIOTestCase):
+
+    def make_autoscaler(self, loads, coord, **kwargs):
+        now = [0]
+        policies = [FixedPolicy(x) for x in loads]
+        a = autoscale.Autoscaler(policies, interval=3600, **kwargs)
+        a.clock = lambda: now[0]
+        a.start(coord)
+        return a, now
+
+    async def test_hysteresis(self, loop=None):
+        coord = FakeCoordinator(4, loop)
+        a, now = self.make_autoscaler([1.15], coord, hysteresis=0.2)
+        await a.evaluate()
+        a.policies[0].load = 0.85
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [])
+        await a.stop()
+
+    async def test_scale_up_and_cooldown(self, loop=None):
+        coord = FakeCoordinator(4, loop)
+        a, now = self.make_autoscaler([1.5], coord, up_cooldown=30,
+                                      down_cooldown=60)
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [6])
+        now[0] = 10
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [6])
+        now[0] = 30
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [6, 9])
+        a.policies[0].load = 0.5
+        now[0] = 60
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [6, 9])
+        now[0] = 90
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [6, 9, 5])
+        self.assertEqual(coord.stats['autoscale']['scale_ups'], 2)
+        self.assertEqual(coord.stats['autoscale']['scale_downs'], 1)
+        await a.stop()
+
+    async def test_bounds_and_step(self, loop=None):
+        coord = FakeCoordinator(4, loop)
+        a, now = self.make_autoscaler([10], coord, max_workers=20,
+                                      max_step=8, up_cooldown=0)
+        await a.evaluate()
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [12, 20])
+        a.policies[0].load = 0.01
+        a.down_cooldown = 0
+        a.min_workers = 3
+        for i in range(3):
+            await a.evaluate()
+        self.assertEqual(coord.scaled, [12, 20, 12, 4, 3])
+        await a.stop()
+
+    async def test_most_demanding_policy(self, loop=None):
+        coord = FakeCoordinator(2, loop)
+        a, now = self.make_autoscaler([0.1, 2, None], coord)
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [4])
+        await a.stop()
+
+    async def test_no_data(self, loop=None):
+        coord = FakeCoordinator(2, loop)
+        a, now = self.make_autoscaler([None], coord)
+        await a.evaluate()
+        self.assertEqual(coord.scaled, [])
+        self.assertIsNone(coord.stats['autoscale']['load'])
+        await a.stop()
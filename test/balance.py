@@ -0,0 +1,53 @@
+
+import collections
+import types
+import unittest
+from aiocluster import balance
+
+
+def endpoints(*idents, inflight=None):
+    inflight = inflight or {}
+    return [types.SimpleNamespace(ident=x, inflight=inflight.get(x, 0))
+            for x in idents]
+
+
+class BalanceTests(unittest.TestCase):
+
+    def test_round_robin(self):
+        eps = endpoints(1, 2, 3)
+        policy = balance.RoundRobin()
+        picks = [policy.choose(eps).ident for x in range(6)]
+        self.assertEqual(picks, [1, 2, 3, 1, 2, 3])
+
+    def test_least_outstanding(self):
+        eps = endpoints(1, 2, 3, inflight={1: 4, 2: 0, 3: 1})
+        policy = balance.LeastOutstanding()
+        self.assertEqual(policy.choose(eps).ident, 2)
+        eps = endpoints(1, 2, 3, inflight={1: 1})
+        picks = set(policy.choose(eps).ident for x in range(4))
+        self.assertEqual(picks, {2, 3})
+
+    def test_consistent_hash_stable(self):
+        eps = endpoints(1, 2, 3, 4)
+        policy = balance.ConsistentHash()
+        first = dict((k, policy.choose(eps, key=k).ident)
+                     for k in range(1000))
+        again = dict((k, policy.choose(eps, key=k).ident)
+                     for k in range(1000))
+        self.assertEqual(first, again)
+        spread = collections.Counter(first.values())
+        self.assertEqual(set(spread), {1, 2, 3, 4})
+        self.assertGreater(min(spread.values()), 100)
+
+    def test_consistent_hash_minimal_moves(self):
+        policy = balance.ConsistentHash()
+        before = dict((k, policy.choose(endpoints(1, 2, 3, 4), key=k).ident)
+                      for k in range(1000))
+        after = dict((k, policy.choose(endpoints(1, 2, 3), key=k).ident)
+                     for k in range(1000))
+        moved = [k for k in before if before[k] != after[k]]
+        self.assertTrue(all(before[k] == 4 for k in moved))
+
+    def test_consistent_hash_requires_key(self):
+        self.assertRaises(ValueError, balance.ConsistentHash().choose,
+                          endpoints(1))
@@ -0,0 +1,209 @@
+
+import asyncio
+import os
+import tempfile
+import types
+from . import base
+from aiocluster import bus, rpc
+
+
+class BrokerTests(base.AIOTestCase):
+
+    async def test_competing_consumers(self, loop=None):
+        b = bus.Broker(loop=loop)
+        await b.push('q', list(range(10)))
+        first = await b.pull('a', 'q', max_items=4)
+        second = await b.pull('b', 'q', max_items=100)
+        self.assertEqual([x[1] for x in first], [0, 1, 2, 3])
+        self.assertEqual([x[1] for x in second], list(range(4, 10)))
+        self.assertEqual(await b.pull('a', 'q', timeout=0.01), [])
+
+    async def test_waiting_consumer(self, loop=None):
+        b = bus.Broker(loop=loop)
+        pull = loop.create_task(b.pull('a', 'q', timeout=1))
+        await asyncio.sleep(0.01, loop=loop)
+        await b.push('q', ['x'])
+        self.assertEqual((await pull)[0][1], 'x')
+
+    async def test_redelivery(self, loop=None):
+        b = bus.Broker(loop=loop)
+        await b.push('q', ['a', 'b', 'c'])
+        held = await b.pull('dead', 'q', max_items=2)
+        await b.ack('dead', 'q', [held[0][0]])
+        self.assertEqual(b.release('dead'), 1)
+        batch = await b.pull('alive', 'q', max_items=10)
+        self.assertEqual([x[1] for x in batch], ['b', 'c'])
+        self.assertEqual(batch[0][2], 2)  # deliveries
+        self.assertEqual(b.queues['q'].stats['redelivered'], 1)
+
+    async def test_ack_requires_owner(self, loop=None):
+        b = bus.Broker(loop=loop)
+        await b.push('q', ['a'])
+        msg = (await b.pull('a', 'q'))[0]
+        self.assertEqual(await b.ack('b', 'q', [msg[0]]), 0)
+        self.assertEqual(await b.ack('a', 'q', [msg[0]]), 1)
+        self.assertEqual(b.release('a'), 0)
+
+    async def test_backpressure(self, loop=None):
+        b = bus.Broker(queue_maxsize=2, loop=loop)
+        self.assertEqual(await b.push('q', [1, 2, 3], timeout=0.05), 2)
+        push = loop.create_task(b.push('q', [3, 4]))
+        await asyncio.sleep(0.01, loop=loop)
+        self.assertFalse(push.done())
+        await b.pull('a', 'q', max_items=2)
+        self.assertEqual(await push, 2)
+        stats = b.get_stats()['queues']['q']
+        self.assertEqual(stats['depth'], 2)
+        self.assertEqual(stats['unacked'], 2)
+        self.assertGreater(stats['push_waits'], 0)
+
+
+class PluginTests(base.AIOTestCase):
+
+    async def test_over_channel(self, loop=None):
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'bus')
+        broker = bus.Broker(loop=loop)
+        server = await rpc.serve(path, broker.calls, loop=loop)
+        worker = types.SimpleNamespace(ident=1, config={"bus_addr": path},
+                                       _plugins={})
+        plugin = bus.BusPlugin(worker, loop)
+        await plugin()
+        q = plugin.queue('jobs')
+        self.assertEqual(await q.push('a', {"b": 1}), 2)
+        batch = await q.pull(max_items=5)
+        self.assertEqual([x.data for x in batch], ['a', {"b": 1}])
+        self.assertEqual(await q.ack(*batch), 2)
+        self.assertEqual(await q.pull(timeout=0.01), [])
+        with self.assertRaises(RuntimeError):
+            plugin.subscribe('a')
+        with self.assertRaises(RuntimeError):
+            await plugin.publish('a', 1)
+        plugin._channel.close()
+        server.close()
+        for x in server.channels:
+            x.close()
+        directory.cleanup()
+
+
+class SubscriptionTests(base.AIOTestCase):
+
+    async def test_topic_framing(self, loop=None):
+        frame = bus.pack_topic('cache.users', {"id": 1})
+        self.assertEqual(bus.unpack_topic(frame), ('cache.users', {"id": 1}))
+
+    async def test_bounded_buffer(self, loop=None):
+        sub = bus.Subscription('cache.', maxsize=3, loop=loop)
+        self.assertTrue(sub.matches('cache.users'))
+        self.assertFalse(sub.matches('config'))
+        for i in range(5):
+            sub.put('cache.x', i)
+        stats = sub.get_stats()
+        self.assertEqual(stats['dropped'], 2)
+        self.assertEqual(stats['depth'], 3)
+        self.assertEqual(stats['slow_events'], 1)
+        self.assertTrue(stats['slow'])
+        self.assertEqual(await sub.get(), ('cache.x', 2))
+
+    async def test_waiting_get(self, loop=None):
+        sub = bus.Subscription('a', loop=loop)
+        get = loop.create_task(sub.get())
+        await asyncio.sleep(0.01, loop=loop)
+        sub.put('ab', 1)
+        self.assertEqual(await get, ('ab', 1))
+        sub.close()
+        with self.assertRaises(EOFError):
+            await sub.get()
+
+
+    async def test_many_waiting_gets(self, loop=None):
+        sub = bus.Subscription('a', loop=loop)
+        gets = [loop.create_task(sub.get()) for i in range(3)]
+        await asyncio.sleep(0.01, loop=loop)
+        gets[0].cancel()
+        sub.put('a', 1)
+        sub.put('a', 2)
+        results = await asyncio.gather(*gets[1:], loop=loop)
+        self.assertEqual(sorted(results), [('a', 1), ('a', 2)])
+        get = loop.create_task(sub.get())
+        await asyncio.sleep(0.01, loop=loop)
+        sub.close()
+        with self.assertRaises(EOFError):
+            await get
+
+
+class Greeter(object):
+
+    def __init__(self, name):
+        self.name = name
+
+    async def hello(self, who):
+        return '%s greets %s' % (self.name, who)
+
+    def _private(self):
+        pass
+
+
+class ServiceTests(base.AIOTestCase):
+
+    async def make_worker(self, ident, bus_path, loop):
+        calls = {}
+        path = os.path.join(self.dir.name, 'worker-%d' % ident)
+        server = await rpc.serve(path, calls, loop=loop)
+        self.servers.append(server)
+        rpc_plugin = types.SimpleNamespace(server_addr=path,
+                                           add_handler=calls.__setitem__)
+        worker = types.SimpleNamespace(ident=ident, draining=False,
+                                       config={"bus_addr": bus_path},
+                                       _plugins={"rpc": rpc_plugin})
+        plugin = bus.BusPlugin(worker, loop)
+        await plugin()
+        self.plugins.append(plugin)
+        return plugin
+
+    async def test_register_and_call(self, loop=None):
+        self.dir = tempfile.TemporaryDirectory()
+        self.servers = []
+        self.plugins = []
+        bus_path = os.path.join(self.dir.name, 'bus')
+        broker = bus.Broker(loop=loop)
+        self.servers.append(await rpc.serve(bus_path, broker.calls,
+                                            loop=loop))
+        a = await self.make_worker(1, bus_path, loop)
+        b = await self.make_worker(2, bus_path, loop)
+        caller = await self.make_worker(3, bus_path, loop)
+        await a.register('greet', Greeter('a'))
+        await b.register('greet', Greeter('b'))
+        self.assertEqual(broker.get_stats()['services'], {"greet": [1, 2]})
+        svc = caller.service('greet')
+        self.assertIs(caller.service('greet'), svc)
+        results = [await caller.service('greet').call('hello', 'c')
+                   for x in range(4)]
+        self.assertEqual(results, ['a greets c', 'b greets c'] * 2)
+        with self.assertRaises(rpc.RemoteError):
+            await svc.call('_private')
+        svc = caller.service('greet', policy='consistent_hash')
+        first = await svc.call('hello', 'c', key='user-1')
+        for x in range(5):
+            self.assertEqual(await svc.call('hello', 'c', key='user-1'),
+                             first)
+        svc = caller.service('greet')
+        a._worker.draining = True
+        with self.assertRaises(rpc.RemoteError) as cm:
+            for x in range(2):
+                await svc.call('hello', 'c')
+        self.assertEqual(cm.exception.type_name, 'ServiceUnavailable')
+        self.assertIsNone(svc._endpoints)
+        broker.release(1)
+        self.assertEqual(await svc.call('hello', 'c'), 'b greets c')
+        with self.assertRaises(LookupError):
+            await caller.service('nope').call('x')
+        for x in self.plugins:
+            x._channel.close()
+            for peer in x._peers.values():
+                peer.close()
+        for x in self.servers:
+            x.close()
+            for channel in x.channels:
+                channel.close()
+        self.dir.cleanup()
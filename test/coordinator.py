@@ -1,10 +1,12 @@
 
 import asyncio
+import os
 import shellish.logging
 import signal
 import time
 from . import base
-from aiocluster import coordinator, worker
+from aiocluster import coordinator, federation, placement, worker, \
+                       WorkerCommand
 
 import logging
 root = logging.getLogger()
@@ -26,6 +28,67 @@ def ignore_term(service):
         print("ignore_term still alive")
 
 
+class IgnoreTermReady(WorkerCommand):
+    """ Only report ready once SIGTERM is being ignored. """
+
+    name = 'ignore_term_ready'
+    auto_ready = False
+
+    async def run(self, args):
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        await self.ready()
+        while True:
+            await asyncio.sleep(5, loop=self._loop)
+
+
+class BusyWorker(WorkerCommand):
+    """ Hold one unit of in-flight work for `busy_time` seconds. """
+
+    name = 'busy_worker'
+    auto_ready = False
+    busy_time = 0.5
+
+    async def run(self, args):
+        with self.inflight():
+            await self.ready()
+            await asyncio.sleep(self.busy_time, loop=self._loop)
+        while True:
+            await asyncio.sleep(5, loop=self._loop)
+
+
+class StuckWorker(BusyWorker):
+
+    name = 'stuck_worker'
+    busy_time = 3600
+
+
+class BlockedWorker(WorkerCommand):
+    """ Block the event loop once ready so RPC calls go unanswered. """
+
+    name = 'blocked_worker'
+    auto_ready = False
+
+    async def run(self, args):
+        await self.ready()
+        while True:
+            time.sleep(5)
+
+
+class SharedReader(WorkerCommand):
+    """ Serve the contents of a shared segment over RPC. """
+
+    name = 'shared_reader'
+    auto_ready = False
+
+    async def run(self, args):
+        async def read_shared(name):
+            return bytes(self.shared(name))
+        self._plugins['rpc'].add_handler('read_shared', read_shared)
+        await self.ready()
+        while True:
+            await asyncio.sleep(5, loop=self._loop)
+
+
 def quick_exit(service):
     pass
 
@@ -54,13 +117,226 @@ class CoordinatorTests(base.AIOTestCase):
         c.stop()
         await c.wait_stopped()
 
+    async def test_zygote_start_stop(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=4,
+                       spawn_mode='zygote', loop=loop)
+        await c.start()
+        self.assertEqual(len(c.workers), 4)
+        c.stop()
+        await c.wait_stopped()
+        self.assertIsNone(c.zygote)
+
+    async def test_concurrent_start_timings(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=6,
+                       start_concurrency=3, loop=loop)
+        await c.start()
+        for wp in c.workers.values():
+            self.assertEqual(wp.state, 'ready')
+            for x in ('exec', 'import', 'plugins', 'register', 'total'):
+                self.assertIn(x, wp.start_timings)
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_start_failure_rollback(self, loop=None):
+        c = make_coord('test.coordinator.doesnotexist', worker_count=4,
+                       loop=loop)
+        with self.assertRaises(RuntimeError):
+            await c.start()
+        self.assertEqual(c.workers, {})
+
+    async def test_rolling_restart(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=3,
+                       loop=loop)
+        await c.start()
+        old = set(c.workers)
+        await c.rolling_restart(surge=1)
+        self.assertEqual(len(c.workers), 3)
+        self.assertFalse(old & set(c.workers))
+        self.assertEqual(c.restart_status['replaced'], 3)
+        self.assertIsNone(c.restart_status['error'])
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_rolling_restart_start_failure(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=4,
+                       loop=loop)
+        await c.start()
+        payload = c.boot_payload()
+        start_workers = c.start_workers
+        calls = []
+
+        async def failing_start_workers(count=None):
+            calls.append(count)
+            if len(calls) == 2:
+                raise RuntimeError('spawn failed')
+            await start_workers(count)
+        c.start_workers = failing_start_workers
+        with self.assertRaises(RuntimeError):
+            await c.rolling_restart(surge=1, max_unavailable=1)
+        status = c.restart_status
+        self.assertEqual(status['replaced'], 2)
+        self.assertIn('spawn failed', status['error'])
+        self.assertIn('1 workers short', status['error'])
+        self.assertIsNotNone(status['finished'])
+        active = [x for x in c.workers.values() if not x.retired]
+        self.assertEqual(len(active), 3)
+        self.assertTrue(all(x.state != 'exited' for x in active))
+        self.assertFalse(os.path.exists(payload.path))
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_rolling_restart_zygote(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=2,
+                       spawn_mode='zygote', loop=loop)
+        await c.start()
+        old_zygote = c.zygote
+        await c.rolling_restart(surge=0, max_unavailable=1)
+        self.assertIsNot(c.zygote, old_zygote)
+        self.assertEqual(c._retired_zygotes, [])
+        self.assertEqual(len(c.workers), 2)
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_drain_clean(self, loop=None):
+        c = make_coord('test.coordinator.BusyWorker', worker_count=2,
+                       loop=loop)
+        await c.start()
+        c.stop()
+        await c.wait_stopped()
+        stats = c.stats['drain']
+        self.assertEqual(stats['workers'], 2)
+        self.assertEqual(stats['clean'], 2)
+        self.assertEqual(stats['cutoff'], 0)
+
+    async def test_drain_cutoff(self, loop=None):
+        c = make_coord('test.coordinator.StuckWorker', worker_count=2,
+                       drain_timeout=0.5, loop=loop)
+        await c.start()
+        c.stop()
+        await c.wait_stopped()
+        stats = c.stats['drain']
+        self.assertEqual(stats['cutoff'], 2)
+        self.assertEqual(stats['cutoff_inflight'], 2)
+        self.assertGreaterEqual(stats['max_time'], 0.5)
+
+    async def test_drain_unresponsive(self, loop=None):
+        c = make_coord('test.coordinator.BlockedWorker', worker_count=2,
+                       loop=loop)
+        await c.start()
+        start = time.monotonic()
+        c.stop()
+        await c.wait_stopped()
+        stats = c.stats['drain']
+        self.assertEqual(stats['unresponsive'], 2)
+        self.assertEqual(stats['cutoff'], 0)
+        self.assertLess(time.monotonic() - start, c.drain_timeout)
+
+    async def test_shared_data(self, loop=None):
+        c = make_coord('test.coordinator.SharedReader', worker_count=1,
+                       shared_data={"data": b'abc' * 1000}, loop=loop)
+        await c.start()
+        self.assertIn('data', c.shared)
+        wp = next(iter(c.workers.values()))
+        self.assertEqual(await wp.rpc.call('read_shared', 'data'),
+                         b'abc' * 1000)
+        c.stop()
+        await c.wait_stopped()
+        self.assertEqual(c.shared, {})
+
+    async def test_loop_lag_poll(self, loop=None):
+        c = make_coord('test.coordinator.BusyWorker', worker_count=2,
+                       loop=loop)
+        await c.start()
+        poll = loop.create_task(c._poll_loop_lag())
+        await asyncio.sleep(0.5, loop=loop)
+        poll.cancel()
+        self.assertEqual(set(c.loop_lag), set(c.workers))
+        for x in c.loop_lag.values():
+            self.assertEqual(x['slow'], [])
+            self.assertIn('p99', x['percentiles'])
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_pin_placement(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=2,
+                       placement=placement.PinPlacement(), loop=loop)
+        await c.start()
+        for wp in c.workers.values():
+            affinity = placement.get_affinity(wp.util)
+            if affinity is None:
+                break  # Platform does not support affinity.
+            self.assertEqual(affinity, c.placement.worker_cpus(wp.slot))
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_broadcast(self, loop=None):
+        c = make_coord('test.coordinator.BusyWorker', worker_count=2,
+                       loop=loop)
+        await c.start()
+        resp = await c.broadcast('worker_inflight')
+        self.assertEqual(set(resp['results']), set(c.workers))
+        self.assertEqual(resp['errors'], {})
+        self.assertEqual(resp['timeouts'], [])
+        resp = await c.broadcast('not_a_call')
+        self.assertEqual(resp['results'], {})
+        self.assertEqual(set(resp['errors']), set(c.workers))
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_broadcast_stragglers(self, loop=None):
+        # worker_entry blocks its event loop so RPC calls never finish.
+        c = make_coord('test.coordinator.worker_entry', worker_count=2,
+                       drain_timeout=0.2, loop=loop)
+        await c.start()
+        resp = await c.broadcast('worker_inflight', timeout=0.2)
+        self.assertEqual(resp['results'], {})
+        self.assertEqual(set(resp['timeouts']), set(c.workers))
+        self.assertLess(resp['elapsed'], 1)
+        c.stop()
+        await c.wait_stopped()
+
+    async def test_federation(self, loop=None):
+        coords = []
+        for i in range(2):
+            fed = federation.Federation(listen=('127.0.0.1', 0),
+                                        refresh_interval=0.05, loop=loop)
+            c = make_coord('test.coordinator.BusyWorker', worker_count=2,
+                           federation=fed, loop=loop)
+            await c.start()
+            coords.append(c)
+        coords[0].federation.discovery = federation.StaticDiscovery(
+            [coords[1].federation.addr])
+        await coords[0].federation.wait_refreshed()
+        resp = await coords[0].federation.workers.get_metrics(state='ready')
+        self.assertEqual(set(resp['results']), {x.ident for x in coords})
+        for metrics in resp['results'].values():
+            self.assertEqual(len(metrics), 2)
+        for c in coords:
+            c.stop()
+            await c.wait_stopped()
+
     async def test_requires_kill(self, loop=None):
-        c = make_coord('test.coordinator.ignore_term', worker_count=2,
+        c = make_coord('test.coordinator.IgnoreTermReady', worker_count=2,
                        loop=loop)
         c.term_timeout = 0.500
         await c.start()
-        await asyncio.sleep(1, loop=loop)  # XXX Hack until we can wait using RPC.
+        workers = list(c.workers.values())
+        c.stop()
+        await c.wait_stopped()
+        for wp in workers:
+            self.assertEqual(wp.state, 'exited')
+            self.assertEqual(wp.process.returncode, -signal.SIGKILL)
+
+    async def test_wait_state(self, loop=None):
+        c = make_coord('test.coordinator.worker_entry', worker_count=1,
+                       loop=loop)
+        await c.start()
+        wp = next(iter(c.workers.values()))
+        await wp.wait_ready(timeout=1)
         c.stop()
+        await wp.wait_state('exited', timeout=5)
+        with self.assertRaises(RuntimeError):
+            await wp.wait_state('ready')
         await c.wait_stopped()
 
     async def test_restart_worker(self, loop=None):
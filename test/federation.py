@@ -0,0 +1,167 @@
+
+import os
+import tempfile
+import types
+from . import base
+from aiocluster import federation, rpc
+from aiocluster.diag import merge
+
+
+def fake_coordinator(ident, loop, reports=None, errors=None):
+    async def broadcast(call, timeout=None):
+        return {
+            "results": dict(reports or {}),
+            "errors": dict(errors or {}),
+            "timeouts": [],
+            "elapsed": 0,
+        }
+    return types.SimpleNamespace(ident=ident, workers={}, _loop=loop,
+                                 broadcast=broadcast, broadcast_timeout=5)
+
+
+class DiscoveryTests(base.AIOTestCase):
+
+    async def test_parse_addr(self, loop=None):
+        self.assertEqual(federation.parse_addr('10.0.0.1:7879'),
+                         ('10.0.0.1', 7879))
+        self.assertEqual(federation.parse_addr('[::1]:80'), ('::1', 80))
+        self.assertEqual(federation.parse_addr('host', 7879), ('host', 7879))
+        self.assertRaises(ValueError, federation.parse_addr, 'host')
+
+    async def test_file(self, loop=None):
+        with tempfile.NamedTemporaryFile('w', delete=False) as f:
+            f.write('# peers\na:1\n\nb:2  # second\n')
+        try:
+            d = federation.FileDiscovery(f.name)
+            self.assertEqual(await d.peers(), [('a', 1), ('b', 2)])
+        finally:
+            os.unlink(f.name)
+        self.assertEqual(await d.peers(), [])
+
+    async def test_dns_resolver(self, loop=None):
+        async def resolver(name):
+            self.assertEqual(name, 'coords.local')
+            return ['10.0.0.1', '10.0.0.2']
+        d = federation.DNSDiscovery('coords.local', 7879, resolver=resolver)
+        self.assertEqual(await d.peers(), [('10.0.0.1', 7879),
+                                           ('10.0.0.2', 7879)])
+
+
+class FederationTests(base.AIOTestCase):
+
+    async def start_nodes(self, count, loop, reports=None, errors=None):
+        nodes = []
+        for i in range(count):
+            fed = federation.Federation(listen=('127.0.0.1', 0),
+                                        refresh_interval=0.05, loop=loop)
+            await fed.start(fake_coordinator('node%d' % i, loop, reports,
+                                             errors))
+            nodes.append(fed)
+        return nodes
+
+    async def mesh(self, nodes):
+        addrs = [x.addr for x in nodes]
+        for x in nodes:
+            x.discovery = federation.StaticDiscovery(addrs)
+        for x in nodes:
+            await x.wait_refreshed()
+
+    async def stop_nodes(self, nodes):
+        for x in nodes:
+            await x.stop()
+
+    async def test_wildcard_requires_addr(self, loop=None):
+        with self.assertRaises(ValueError):
+            federation.Federation(listen=('0.0.0.0', 0), loop=loop)
+        fed = federation.Federation(listen=('0.0.0.0', 0),
+                                    addr=('127.0.0.1', 7879), loop=loop)
+        self.assertEqual(fed.addr, ('127.0.0.1', 7879))
+
+    async def test_static_mesh(self, loop=None):
+        nodes = await self.start_nodes(3, loop)
+        addrs = [x.addr for x in nodes]
+        for x in nodes:
+            x.discovery = federation.StaticDiscovery(addrs)
+        for x in nodes:
+            await x.wait_refreshed()
+        for x in nodes:
+            peers = await x.nodes.get_peers()
+            self.assertEqual(len(peers), 2)
+        resp = await nodes[0].workers.get_metrics()
+        self.assertEqual(set(resp['results']), {'node0', 'node1', 'node2'})
+        self.assertEqual(resp['errors'], {})
+        await self.stop_nodes(nodes)
+
+    async def test_learn_from_hello(self, loop=None):
+        nodes = await self.start_nodes(2, loop)
+        nodes[0].discovery = federation.StaticDiscovery([nodes[1].addr])
+        await nodes[0].wait_refreshed()
+        await nodes[1].wait_refreshed()
+        self.assertEqual([x.ident for x in nodes[1].peers.values()],
+                         ['node0'])
+        await self.stop_nodes(nodes)
+
+    async def test_drop_dead_peer(self, loop=None):
+        nodes = await self.start_nodes(2, loop)
+        nodes[0].discovery = federation.StaticDiscovery([nodes[1].addr])
+        await nodes[0].wait_refreshed()
+        self.assertEqual(len(nodes[0].peers), 1)
+        await nodes[1].stop()
+        for i in range(3):
+            await nodes[0].wait_refreshed()
+        self.assertEqual(nodes[0].peers, {})
+        await nodes[0].stop()
+
+    async def test_cluster_broadcast(self, loop=None):
+        reports = {
+            1: [['dict', 10], ['list', 4]],
+            2: [['dict', 1]],
+        }
+        nodes = await self.start_nodes(3, loop, reports)
+        await self.mesh(nodes)
+        resp = await merge.cluster_broadcast(nodes[0], 'memory_report',
+                                             merge.CountMerger(breakdown=True))
+        self.assertEqual(resp['errors'], {})
+        self.assertEqual(resp['results'], [
+            ['dict', 33, {"node0": [11], "node1": [11], "node2": [11]}],
+            ['list', 12, {"node0": [4], "node1": [4], "node2": [4]}],
+        ])
+        self.assertEqual(set(resp['nodes']), {'node0', 'node1', 'node2'})
+        self.assertEqual(resp['nodes']['node1']['workers'], 2)
+        await self.stop_nodes(nodes)
+
+    async def test_diag_broadcast_allowed_calls(self, loop=None):
+        nodes = await self.start_nodes(2, loop)
+        await self.mesh(nodes)
+        peer = nodes[0].peers[nodes[1].addr].channel
+        for call in ('worker_drain', 'profiler_set_active'):
+            with self.assertRaises(rpc.RemoteError) as cm:
+                await peer.call('diag_broadcast', call, 'counts')
+            self.assertEqual(cm.exception.type_name, 'ValueError')
+        resp = await peer.call('diag_broadcast', 'memory_growth', 'counts')
+        self.assertEqual(resp['workers'], 0)
+        await self.stop_nodes(nodes)
+
+    async def test_cluster_broadcast_worker_error(self, loop=None):
+        nodes = await self.start_nodes(2, loop, {1: [['dict', 1]]},
+                                       {2: 'boom'})
+        await self.mesh(nodes)
+        resp = await merge.cluster_broadcast(nodes[0], 'memory_report',
+                                             merge.CountMerger())
+        self.assertEqual(resp['errors'], {})
+        self.assertEqual(resp['nodes']['node1']['errors'], {2: 'boom'})
+        await self.stop_nodes(nodes)
+
+    async def test_each_peer_error(self, loop=None):
+        nodes = await self.start_nodes(2, loop)
+        await self.mesh(nodes)
+
+        async def fail(**filters):
+            raise ValueError('boom')
+        nodes[1].calls['workers_get_metrics'] = fail
+        seen = []
+        errors = await nodes[0].each('workers_get_metrics',
+                                     lambda ident, x: seen.append(ident))
+        self.assertEqual(seen, ['node0'])
+        self.assertEqual(list(errors), ['node1'])
+        await self.stop_nodes(nodes)
@@ -0,0 +1,56 @@
+import unittest
+from aiocluster.diag import flamegraph
+
+
+def folded():
+    return {
+        "hz": 100,
+        "samples": 10,
+        "elapsed": 0.2,
+        "overhead": 0,
+        "frames": [
+            ['/src/app.py', 'main', 1],
+            ['/src/app.py', 'handle', 10],
+            ['/src/db.py', 'query', 5],
+        ],
+        "stacks": [
+            [[0, 1, 2], 6],
+            [[0, 1], 3],
+            [[0], 1],
+        ],
+    }
+
+
+class FlameGraphTests(unittest.TestCase):
+
+    def test_folded_lines(self):
+        self.assertEqual(list(flamegraph.folded_lines(folded())), [
+            'main (app.py:1);handle (app.py:10);query (db.py:5) 6',
+            'main (app.py:1);handle (app.py:10) 3',
+            'main (app.py:1) 1',
+        ])
+
+    def test_speedscope(self):
+        doc = flamegraph.speedscope(folded())
+        profile = doc['profiles'][0]
+        self.assertEqual(profile['type'], 'sampled')
+        self.assertEqual(profile['samples'], [[0, 1, 2], [0, 1], [0]])
+        self.assertAlmostEqual(profile['endValue'], 0.2)
+        self.assertAlmostEqual(profile['weights'][0], 0.12)
+        self.assertEqual(doc['shared']['frames'][2],
+                         {"name": 'query', "file": '/src/db.py', "line": 5})
+
+    def test_tree(self):
+        root = flamegraph.tree(folded())
+        self.assertEqual(root['value'], 10)
+        main, = root['children']
+        self.assertEqual((main['name'], main['value']),
+                         ('main (app.py:1)', 10))
+        handle, = main['children']
+        self.assertEqual(handle['value'], 9)
+        self.assertEqual(handle['children'][0]['value'], 6)
+
+    def test_tree_prune(self):
+        root = flamegraph.tree(folded(), min_fraction=0.7)
+        handle, = root['children'][0]['children']
+        self.assertEqual(handle['children'], [])
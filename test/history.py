@@ -0,0 +1,145 @@
+import asyncio
+import time
+import unittest
+from aiocluster.diag import merge
+from aiocluster.diag.worker import history
+
+
+def before_deploy():
+    end = time.process_time() + 0.2
+    while time.process_time() < end:
+        pass
+
+
+def after_deploy():
+    end = time.process_time() + 0.2
+    while time.process_time() < end:
+        pass
+
+
+def names(report):
+    return [x['call']['function'] for x in report['functions']]
+
+
+class WindowedProfileTests(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = history.WindowedProfile(hz=200, windows=3)
+        self.profile.start()
+
+    def tearDown(self):
+        self.profile.stop()
+
+    def deploy(self):
+        """ Windows before and after a deploy;  Returns their boundaries.
+        """
+        before_deploy()
+        self.profile.rotate()
+        after_deploy()
+        self.profile.rotate()
+        first, second = self.profile.history
+        return first['start'], first['end'], second['end']
+
+    def test_rotate(self):
+        t0, t1, t2 = self.deploy()
+        self.assertEqual(len(self.profile.history), 2)
+        report = self.profile.report(t1, t2, sortby='inlinetime')
+        self.assertIn('after_deploy', names(report))
+        self.assertNotIn('before_deploy', names(report))
+        self.assertEqual(report['window']['windows'], 1)
+        self.assertGreater(report['window']['samples'], 10)
+        self.assertIsNone(report['baseline'])
+        report = self.profile.report(t0, t2)
+        self.assertEqual(report['window']['windows'], 2)
+        self.assertIn('before_deploy', names(report))
+        self.assertIn('after_deploy', names(report))
+
+    def test_current_window(self):
+        after_deploy()
+        report = self.profile.report(time.time() - 60, time.time())
+        self.assertEqual(report['window']['windows'], 1)
+        self.assertIn('after_deploy', names(report))
+        self.assertEqual(len(self.profile.history), 0)
+
+    def test_rotate_resets_sampler(self):
+        before_deploy()
+        self.profile.rotate()
+        self.assertLess(len(self.profile.sampler.counts), 5)
+        self.assertIn('before_deploy', [x[1] for stack, count in
+                      self.profile.history[0]['counts'].items()
+                      for x in map(history.sampler.code_key, stack)])
+
+    def test_ring_size(self):
+        for i in range(5):
+            self.profile.rotate()
+        self.assertEqual(len(self.profile.history), 3)
+
+    def test_baseline(self):
+        t0, t1, t2 = self.deploy()
+        report = self.profile.report(t1, t2, baseline=(t0, t1),
+                                     sortby='change')
+        functions = dict((x['call']['function'], x)
+                         for x in report['functions'])
+        self.assertEqual(report['baseline']['windows'], 1)
+        self.assertGreater(functions['after_deploy']['change']['inlinetime'],
+                           0)
+        self.assertLess(functions['before_deploy']['change']['inlinetime'],
+                        0)
+        self.assertEqual(names(report)[0], 'after_deploy')
+        self.assertEqual(names(report)[-1], 'before_deploy')
+
+    def test_timer(self):
+        loop = asyncio.new_event_loop()
+        try:
+            profile = history.WindowedProfile(window=0.05, loop=loop)
+            profile.start()
+            loop.run_until_complete(asyncio.sleep(0.18, loop=loop))
+            profile.stop()
+            self.assertEqual(len(profile.history), 4)
+        finally:
+            loop.close()
+
+
+class HistoryMergerTests(unittest.TestCase):
+
+    def report(self, window, baseline=None):
+        def info(duration):
+            return {"start": 0, "end": duration, "duration": duration,
+                    "windows": 1, "samples": 10, "elapsed": 0.1}
+        functions = [{
+            "call": {"file": 'a.py', "function": name, "lineno": 1},
+            "stats": {"totaltime": t, "inlinetime": t},
+        } for name, t in window.items()]
+        if baseline is not None:
+            functions.extend({
+                "call": {"file": 'a.py', "function": name, "lineno": 1},
+                "baseline": {"totaltime": t, "inlinetime": t},
+            } for name, t in baseline.items())
+        return {
+            "window": info(10),
+            "baseline": None if baseline is None else info(20),
+            "functions": functions,
+        }
+
+    def test_merge(self):
+        m = merge.HistoryMerger(sortby='change')
+        m.add('w1', self.report({"f": 2, "g": 1}, {"f": 2, "g": 4}))
+        m.add('w2', self.report({"f": 1}, {"f": 2}))
+        result = m.result()
+        self.assertEqual(result['window']['samples'], 20)
+        self.assertEqual(result['window']['duration'], 10)
+        f, g = result['functions']
+        self.assertEqual(f['stats']['inlinetime'], 3)
+        self.assertEqual(f['baseline']['inlinetime'], 4)
+        self.assertAlmostEqual(f['change']['inlinetime'], 0.3 - 0.2)
+        self.assertAlmostEqual(g['change']['inlinetime'], 0.1 - 0.2)
+        self.assertRaises(ValueError, merge.HistoryMerger, sortby='nope')
+
+    def test_no_baseline(self):
+        m = merge.HistoryMerger(sortby='inlinetime', limit=1)
+        m.add('w1', self.report({"f": 1, "g": 3}))
+        result = m.result()
+        self.assertIsNone(result['baseline'])
+        self.assertEqual([x['call']['function'] for x in
+                          result['functions']], ['g'])
+        self.assertIsNone(result['functions'][0]['change'])
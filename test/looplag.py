@@ -0,0 +1,125 @@
+import asyncio
+import time
+import types
+import unittest
+from . import base
+from aiocluster.diag import histogram, merge
+from aiocluster.diag.worker import looplag
+
+
+class HistogramTests(unittest.TestCase):
+
+    def test_percentiles(self):
+        h = histogram.Histogram(bounds=(1, 2, 4))
+        for x in [0.5] * 90 + [3] * 9 + [10]:
+            h.add(x)
+        self.assertEqual(h.count, 100)
+        self.assertEqual(h.counts, [90, 0, 9, 1])
+        self.assertEqual(h.max, 10)
+        self.assertLessEqual(h.percentile(50), 1)
+        self.assertGreater(h.percentile(95), 2)
+        self.assertLessEqual(h.percentile(95), 4)
+        self.assertEqual(h.percentile(100), 10)
+        self.assertEqual(sorted(h.percentiles()),
+                         ['p50', 'p90', 'p99', 'p99.9'])
+
+    def test_empty(self):
+        self.assertIsNone(histogram.Histogram().percentile(50))
+
+    def test_update(self):
+        a = histogram.Histogram()
+        b = histogram.Histogram()
+        a.add(0.001)
+        b.add(0.3)
+        b.add(0.004)
+        c = histogram.Histogram.from_dict(a.as_dict())
+        c.update(b.as_dict())
+        self.assertEqual(c.count, 3)
+        self.assertEqual(c.max, 0.3)
+        self.assertAlmostEqual(c.sum, 0.305)
+        self.assertRaises(ValueError, c.update, histogram.Histogram((1,)))
+
+
+class QuickMonitor(looplag.LoopLagRPCHandler):
+    interval = 0.01
+    threshold = 0.05
+
+
+def blocking_call(duration):
+    time.sleep(duration)
+
+
+class LoopLagTests(base.AIOTestCase):
+
+    event_loop_debug = False
+
+    def monitor(self, loop):
+        handlers = {}
+        plugin = types.SimpleNamespace(_loop=loop, add_handler=handlers.
+                                       __setitem__)
+        monitor = QuickMonitor(plugin)
+        self.assertEqual(set(handlers), {'loop_lag', 'loop_monitor'})
+        return monitor
+
+    async def test_idle(self, loop=None):
+        monitor = self.monitor(loop)
+        await asyncio.sleep(0.2, loop=loop)
+        report = await monitor.monitor()
+        self.assertGreater(report['histogram']['count'], 5)
+        self.assertLess(report['percentiles']['p50'], 0.05)
+        self.assertEqual(report['slow'], [])
+
+    async def test_slow_callback(self, loop=None):
+        monitor = self.monitor(loop)
+        await asyncio.sleep(0.05, loop=loop)
+        loop.call_soon(blocking_call, 0.3)
+        await asyncio.sleep(0.1, loop=loop)
+        report = await monitor.monitor(window='total')
+        self.assertEqual(report['slow_count'], 1)
+        slow, = report['slow']
+        self.assertGreater(slow['lag'], 0.2)
+        self.assertIn('blocking_call', [x[1] for x in slow['stack']])
+        self.assertGreater(report['histogram']['max'], 0.2)
+        self.assertEqual((await monitor.monitor(slow_limit=0))['slow'], [])
+        lag = await monitor.report()
+        self.assertGreater(lag['max'], 0.2)
+
+    async def test_windows(self, loop=None):
+        monitor = self.monitor(loop)
+        monitor.window = 0.05
+        await asyncio.sleep(0.3, loop=loop)
+        self.assertEqual(len(monitor.recent), monitor.windows)
+        recent = await monitor.monitor()
+        total = await monitor.monitor(window='total')
+        self.assertLess(recent['histogram']['count'],
+                        total['histogram']['count'])
+        with self.assertRaises(ValueError):
+            await monitor.monitor(window='nope')
+
+
+class LoopLagMergerTests(unittest.TestCase):
+
+    def report(self, *lags):
+        h = histogram.Histogram()
+        for x in lags:
+            h.add(x)
+        return {
+            "histogram": h.as_dict(),
+            "slow_count": len(lags),
+            "slow": [{"lag": x, "time": 0, "stack": None} for x in lags],
+        }
+
+    def test_merge(self):
+        m = merge.LoopLagMerger(slow_limit=2)
+        m.add('w1', self.report(0.2, 0.5))
+        m.add('w2', self.report(0.3))
+        result = m.result()
+        self.assertEqual(result['histogram']['count'], 3)
+        self.assertEqual(result['slow_count'], 3)
+        self.assertEqual([(x['source'], x['lag']) for x in result['slow']],
+                         [('w1', 0.5), ('w2', 0.3)])
+        cluster = merge.LoopLagMerger(**m.options())
+        cluster.add('node1', result)
+        self.assertEqual(cluster.result()['slow'][0]['source'], 'node1/w1')
+        self.assertIsNone(merge.LoopLagMerger().result()['percentiles'][
+                          'p50'])
@@ -0,0 +1,109 @@
+import asyncio
+from . import base
+from aiocluster import federation, membership
+
+
+class MembershipTests(base.AIOTestCase):
+
+    settings = dict(protocol_period=0.05, ack_timeout=0.02,
+                    suspicion_mult=2)
+
+    async def start_nodes(self, count, loop, network=None):
+        network = network or membership.LocalNetwork(loop=loop)
+        nodes = []
+        seeds = None
+        for i in range(count):
+            node = membership.Membership(network.transport(), seeds=seeds,
+                                         ident='node%d' % i, loop=loop,
+                                         **self.settings)
+            await node.start()
+            if seeds is None:
+                seeds = federation.StaticDiscovery([node.addr])
+            nodes.append(node)
+        return network, nodes
+
+    async def stop_nodes(self, nodes):
+        for x in nodes:
+            await x.stop()
+
+    async def wait_for(self, test, loop, timeout=5):
+        deadline = loop.time() + timeout
+        while not test():
+            self.assertLess(loop.time(), deadline)
+            await asyncio.sleep(0.01, loop=loop)
+
+    def states(self, nodes, ident):
+        return set(x.members[ident].state for x in nodes
+                   if ident in x.members)
+
+    async def test_converge(self, loop=None):
+        network, nodes = await self.start_nodes(5, loop)
+        try:
+            await self.wait_for(lambda: all(len(x.alive_members()) == 4
+                                            for x in nodes), loop)
+            view = nodes[0].view()
+            self.assertEqual([x['ident'] for x in view],
+                             ['node%d' % i for i in range(5)])
+            self.assertEqual(set(x['state'] for x in view),
+                             {membership.ALIVE})
+        finally:
+            await self.stop_nodes(nodes)
+
+    async def test_detect_failure(self, loop=None):
+        network, nodes = await self.start_nodes(5, loop)
+        try:
+            await self.wait_for(lambda: all(len(x.alive_members()) == 4
+                                            for x in nodes), loop)
+            seen = []
+            nodes[0].listeners.append(lambda m, prev: seen.append(
+                (m.ident, m.state)))
+            victim = nodes.pop()
+            await victim.stop()
+            await self.wait_for(lambda: self.states(nodes, victim.ident) ==
+                                {membership.DEAD}, loop)
+            self.assertEqual(seen[-1], (victim.ident, membership.DEAD))
+            self.assertTrue(all(len(x.alive_members()) == 3 for x in nodes))
+        finally:
+            await self.stop_nodes(nodes)
+
+    async def test_refute(self, loop=None):
+        network, nodes = await self.start_nodes(3, loop)
+        try:
+            await self.wait_for(lambda: all(len(x.alive_members()) == 2
+                                            for x in nodes), loop)
+            target = nodes[2]
+            nodes[0].suspect(nodes[0].members[target.ident])
+            await self.wait_for(lambda: target.incarnation > 0, loop)
+            await self.wait_for(lambda: self.states(nodes[:2], target.ident)
+                                == {membership.ALIVE}, loop)
+            self.assertEqual(target.stats['refuted'], 1)
+            self.assertEqual(nodes[0].members[target.ident].incarnation,
+                             target.incarnation)
+        finally:
+            await self.stop_nodes(nodes)
+
+    async def test_partition(self, loop=None):
+        network, nodes = await self.start_nodes(4, loop)
+        try:
+            await self.wait_for(lambda: all(len(x.alive_members()) == 3
+                                            for x in nodes), loop)
+            network.partitioned.add(nodes[3].addr)
+            await self.wait_for(lambda: self.states(nodes[:3], 'node3') ==
+                                {membership.DEAD}, loop)
+            network.partitioned.clear()
+            await self.wait_for(lambda: self.states(nodes[:3], 'node3') ==
+                                {membership.ALIVE}, loop)
+            self.assertGreater(nodes[3].incarnation, 0)
+        finally:
+            await self.stop_nodes(nodes)
+
+    async def test_invalid_setting(self, loop=None):
+        self.assertRaises(TypeError, membership.Membership, nope=1)
+
+    async def test_wildcard_requires_advertise(self, loop=None):
+        self.assertRaises(ValueError, membership.UDPTransport,
+                          bind=('0.0.0.0', 0))
+        transport = membership.UDPTransport(bind=('0.0.0.0', 0),
+                                            advertise=('127.0.0.1', 7880))
+        self.assertEqual(transport.advertise, ('127.0.0.1', 7880))
+        self.assertEqual(membership.UDPTransport().bind, ('127.0.0.1', 7880))
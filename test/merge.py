@@ -0,0 +1,107 @@
+import unittest
+from aiocluster.diag import merge
+
+
+def entry(func, callcount, totaltime, callers=()):
+    call = {"file": 'a.py', "function": func, "lineno": 1}
+    stats = {
+        "callcount": callcount,
+        "reccallcount": 0,
+        "totaltime": totaltime,
+        "inlinetime": totaltime / 2,
+    }
+    return {
+        "call": call,
+        "stats": stats,
+        "callers": list(callers),
+    }
+
+
+class MergeTests(unittest.TestCase):
+
+    def test_profile(self):
+        m = merge.ProfileMerger()
+        m.add('w1', [entry('f', 1, 1.0, [entry('main', 1, 1.0)]),
+                     entry('g', 2, 0.5)])
+        m.add('w2', [entry('f', 3, 2.0, [entry('main', 1, 1.0),
+                                         entry('other', 2, 1.0)])])
+        result = dict((x['call']['function'], x) for x in m.result())
+        self.assertEqual(result['f']['stats']['callcount'], 4)
+        self.assertEqual(result['f']['stats']['totaltime'], 3.0)
+        self.assertEqual(result['f']['stats']['inlinetime'], 1.5)
+        callers = dict((x['call']['function'], x['stats']['callcount'])
+                       for x in result['f']['callers'])
+        self.assertEqual(callers, {"main": 2, "other": 2})
+        self.assertEqual(result['g']['stats']['callcount'], 2)
+        self.assertEqual(result['g']['callers'], [])
+
+    def test_profile_does_not_mutate(self):
+        report = [entry('f', 1, 1.0)]
+        m = merge.ProfileMerger()
+        m.add('w1', report)
+        m.add('w2', report)
+        self.assertEqual(report[0]['stats']['callcount'], 1)
+        self.assertEqual(m.result()[0]['stats']['callcount'], 2)
+
+    def test_counts(self):
+        m = merge.CountMerger()
+        m.add('w1', [['dict', 5], ['list', 3]])
+        m.add('w2', [['list', 4]])
+        self.assertEqual(m.result(), [['list', 7], ['dict', 5]])
+
+    def test_counts_breakdown(self):
+        m = merge.CountMerger(breakdown=True)
+        m.add('n1', [['dict', 5]])
+        m.add('n2', [['dict', 2]])
+        m.add('n2', [['dict', 1]])
+        self.assertEqual(m.result(), [['dict', 8, {"n1": [5], "n2": [3]}]])
+
+    def test_growth(self):
+        m = merge.GrowthMerger()
+        m.add('w1', [['dict', 100, 1], ['list', 10, 5]])
+        m.add('w2', [['dict', 100, 2]])
+        self.assertEqual(m.result(), [['list', 10, 5], ['dict', 200, 3]])
+
+    def test_merge_broadcast(self):
+        report = {
+            "results": {"w1": [['dict', 1]], "w2": [['dict', 2]]},
+            "errors": {"w3": 'boom'},
+            "timeouts": ['w4'],
+            "elapsed": 0.1,
+        }
+        merged = merge.merge_broadcast(report, merge.CountMerger())
+        self.assertEqual(merged['results'], [['dict', 3]])
+        self.assertEqual(merged['workers'], 2)
+        self.assertEqual(merged['errors'], {"w3": 'boom'})
+        self.assertEqual(merged['timeouts'], ['w4'])
+
+    def test_profile_top(self):
+        m = merge.ProfileMerger(sortby='callcount', limit=2)
+        m.add('w1', [entry('f', 1, 1.0), entry('g', 5, 0.1)])
+        m.add('w2', [entry('f', 3, 1.0), entry('h', 2, 9.0)])
+        self.assertEqual([x['call']['function'] for x in m.result()],
+                         ['g', 'f'])
+        self.assertEqual(m.options(), {"sortby": 'callcount', "limit": 2})
+        m = merge.ProfileMerger(sortby='totaltime')
+        m.add('w1', [entry('f', 1, 1.0), entry('g', 5, 0.1),
+                     entry('h', 2, 9.0)])
+        self.assertEqual([x['call']['function'] for x in m.result()],
+                         ['h', 'f', 'g'])
+
+    def test_profile_invalid_sortby(self):
+        self.assertRaises(ValueError, merge.ProfileMerger, sortby='nope')
+
+    def test_tasks(self):
+        def row(name, steps, wall, max_step):
+            return {"name": name, "tasks": 1, "completed": 0, "active": 1,
+                    "steps": steps, "wall": wall, "cpu": wall,
+                    "blocked": 0, "max_step": max_step}
+        m = merge.TaskMerger(sortby='wall', limit=2)
+        m.add('w1', [row('a', 1, 1.0, 0.5), row('b', 5, 0.1, 0.1)])
+        m.add('w2', [row('a', 3, 1.0, 0.9), row('c', 2, 0.5, 0.2)])
+        result = m.result()
+        self.assertEqual([x['name'] for x in result], ['a', 'c'])
+        self.assertEqual(result[0]['steps'], 4)
+        self.assertEqual(result[0]['tasks'], 2)
+        self.assertEqual(result[0]['max_step'], 0.9)
+        self.assertRaises(ValueError, merge.TaskMerger, sortby='nope')
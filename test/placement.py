@@ -0,0 +1,62 @@
+
+import unittest
+from aiocluster import placement
+
+
+class PlacementTests(unittest.TestCase):
+
+    nodes = {
+        0: [0, 1, 2, 3, 8, 9, 10, 11],
+        1: [4, 5, 6, 7, 12, 13, 14, 15],
+    }
+    cpus = list(range(16))
+
+    def make(self, Placement, **kwargs):
+        p = Placement(cpus=self.cpus, nodes=self.nodes, **kwargs)
+        p.setup()
+        return p
+
+    def test_parse_cpulist(self):
+        self.assertEqual(placement.parse_cpulist('0-3,8,10-11\n'),
+                         [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(placement.parse_cpulist(''), [])
+
+    def test_pin(self):
+        p = self.make(placement.PinPlacement)
+        self.assertEqual([p.worker_cpus(i) for i in range(3)],
+                         [[0], [1], [2]])
+        self.assertEqual(p.worker_cpus(16), [0])
+        self.assertEqual(p.describe(8)['nodes'], [1])
+
+    def test_pin_core_sets(self):
+        p = self.make(placement.PinPlacement, cores_per_worker=3)
+        self.assertEqual(p.worker_cpus(0), [0, 1, 2])
+        self.assertEqual(p.worker_cpus(1), [3, 8, 9])
+        self.assertEqual(p.worker_cpus(2), [4, 5, 6])
+        self.assertEqual(p.worker_cpus(4), [10, 11, 14])  # leftovers
+        for x in range(4):
+            self.assertEqual(len(p.describe(x)['nodes']), 1)
+
+    def test_spread(self):
+        p = self.make(placement.SpreadPlacement)
+        self.assertEqual(p.describe(0)['nodes'], [0])
+        self.assertEqual(p.describe(1)['nodes'], [1])
+        self.assertEqual(p.describe(2)['nodes'], [0])
+
+    def test_reserve(self):
+        p = self.make(placement.PinPlacement, reserve=2)
+        self.assertEqual(p.reserved, [0, 1])
+        self.assertEqual(p.worker_cpus(0), [2])
+        for i in range(32):
+            self.assertNotIn(0, p.worker_cpus(i))
+            self.assertNotIn(1, p.worker_cpus(i))
+
+    def test_reserve_too_many(self):
+        p = placement.PinPlacement(reserve=16, cpus=self.cpus,
+                                   nodes=self.nodes)
+        self.assertRaises(ValueError, p.setup)
+
+    def test_no_numa(self):
+        p = placement.SpreadPlacement(cpus=[0, 1], nodes={})
+        p.setup()
+        self.assertEqual(p.worker_cpus(5), [0, 1])
@@ -0,0 +1,68 @@
+
+import unittest
+from aiocluster import restart
+
+
+class RestartPolicyTests(unittest.TestCase):
+
+    def make(self, **kwargs):
+        kwargs.setdefault('jitter', 0)
+        return restart.RestartPolicy(**kwargs), restart.SlotHistory(0)
+
+    def test_exponential_backoff(self):
+        policy, history = self.make(base_delay=1, max_delay=10)
+        delays = []
+        now = 0
+        for i in range(6):
+            policy.on_start(history, now)
+            now += 1
+            policy.on_exit(history, 1, now)
+            delays.append(policy.delay(history, now))
+            now += 100  # Outside the crash window.
+        self.assertEqual(delays, [1, 2, 4, 8, 10, 10])
+
+    def test_stable_uptime_resets(self):
+        policy, history = self.make(base_delay=1, stable_uptime=30)
+        policy.on_start(history, 0)
+        policy.on_exit(history, 1, 1)
+        policy.on_start(history, 2)
+        policy.on_exit(history, 1, 3)
+        self.assertEqual(policy.delay(history, 3), 2)
+        policy.on_start(history, 5)
+        policy.on_exit(history, 0, 100)
+        self.assertEqual(history.failures, 1)
+        self.assertEqual(policy.delay(history, 100), 0)
+
+    def test_jitter_bounds(self):
+        policy, history = self.make(base_delay=4, jitter=0.5)
+        policy.on_start(history, 0)
+        policy.on_exit(history, 1, 1)
+        for i in range(100):
+            self.assertTrue(2 <= policy.delay(history, 1) <= 4)
+
+    def test_circuit_breaker(self):
+        policy, history = self.make(crash_limit=3, crash_window=10,
+                                    breaker_timeout=60)
+        tripped = []
+        for now in range(3):
+            policy.on_start(history, now)
+            tripped.append(policy.on_exit(history, 1, now + 0.5))
+        self.assertEqual(tripped, [False, False, True])
+        self.assertTrue(history.tripped(2.5))
+        self.assertEqual(policy.delay(history, 2.5), 60)
+        self.assertFalse(history.tripped(62.5))
+
+    def test_crash_window(self):
+        policy, history = self.make(crash_limit=3, crash_window=10)
+        for now in (0, 20, 40, 60):
+            policy.on_start(history, now)
+            self.assertFalse(policy.on_exit(history, 1, now + 0.5))
+
+    def test_restart_counts(self):
+        policy, history = self.make()
+        for now in range(3):
+            policy.on_start(history, now * 100)
+            policy.on_exit(history, 0, now * 100 + 1)
+        self.assertEqual(history.starts, 3)
+        self.assertEqual(history.restarts, 2)
+        self.assertEqual(history.as_dict(1000)['restarts'], 2)
@@ -0,0 +1,163 @@
+
+import asyncio
+import os
+import tempfile
+from . import base
+from aiocluster import rpc
+
+
+class ChannelTests(base.AIOTestCase):
+
+    async def make_pair(self, loop):
+        self.dir = tempfile.TemporaryDirectory()
+        self.events = []
+        self.cancelled = asyncio.Event(loop=loop)
+
+        async def echo(value, delay=0):
+            await asyncio.sleep(delay, loop=loop)
+            self.events.append(value)
+            return value
+
+        async def fail():
+            raise ValueError('nope')
+
+        async def unencodable():
+            return {1, 2}
+
+        async def hang():
+            try:
+                await asyncio.sleep(60, loop=loop)
+            except asyncio.CancelledError:
+                self.cancelled.set()
+                raise
+
+        path = os.path.join(self.dir.name, 'sock')
+        calls = {"echo": echo, "fail": fail, "hang": hang,
+                 "unencodable": unencodable}
+        server = await rpc.serve(path, calls, loop=loop)
+        client = await rpc.Channel.connect(path, loop=loop)
+        return server, client
+
+    def close(self, server, client):
+        client.close()
+        server.close()
+        for x in server.channels:
+            x.close()
+        self.dir.cleanup()
+
+    async def test_call(self, loop=None):
+        server, client = await self.make_pair(loop)
+        self.assertEqual(await client.call('echo', 'hi'), 'hi')
+        self.assertEqual(await client.call('echo', value=[1, {"a": b'b'}]),
+                         [1, {"a": b'b'}])
+        self.assertEqual(await client.call('echo', {1: 'a'}), {1: 'a'})
+        self.close(server, client)
+
+    async def test_concurrent_out_of_order(self, loop=None):
+        server, client = await self.make_pair(loop)
+        slow = client.call('echo', 'slow', delay=0.2)
+        fast = client.call('echo', 'fast')
+        results = await asyncio.gather(slow, fast, loop=loop)
+        self.assertEqual(results, ['slow', 'fast'])
+        self.assertEqual(self.events, ['fast', 'slow'])
+        self.close(server, client)
+
+    async def test_remote_error(self, loop=None):
+        server, client = await self.make_pair(loop)
+        with self.assertRaises(rpc.RemoteError) as cm:
+            await client.call('fail')
+        self.assertEqual(cm.exception.type_name, 'ValueError')
+        with self.assertRaises(rpc.RemoteError) as cm:
+            await client.call('missing')
+        self.assertEqual(cm.exception.type_name, 'NameError')
+        self.close(server, client)
+
+    async def test_unencodable_result(self, loop=None):
+        server, client = await self.make_pair(loop)
+        with self.assertRaises(rpc.RemoteError) as cm:
+            await client.call('unencodable')
+        self.assertEqual(cm.exception.type_name, 'TypeError')
+        self.assertEqual(await client.call('echo', 'hi'), 'hi')
+        self.close(server, client)
+
+    async def test_timeout_cancels_remote(self, loop=None):
+        server, client = await self.make_pair(loop)
+        with self.assertRaises(asyncio.TimeoutError):
+            await client.call('hang', timeout=0.1)
+        await asyncio.wait_for(self.cancelled.wait(), 1, loop=loop)
+        self.assertEqual(client.inflight, 0)
+        self.assertEqual(await client.call('echo', 1), 1)
+        self.close(server, client)
+
+    async def test_disconnect_fails_pending(self, loop=None):
+        server, client = await self.make_pair(loop)
+        call = loop.create_task(client.call('hang'))
+        await asyncio.sleep(0.05, loop=loop)
+        for x in server.channels:
+            x.close()
+        with self.assertRaises(ConnectionError):
+            await call
+        self.close(server, client)
+
+
+class NegotiationTests(base.AIOTestCase):
+
+    async def connect(self, loop, server_kwargs, client_kwargs):
+        self.dir = tempfile.TemporaryDirectory()
+
+        async def echo(value):
+            return value
+
+        path = os.path.join(self.dir.name, 'sock')
+        server = await rpc.serve(path, {"echo": echo}, loop=loop,
+                                 **server_kwargs)
+        try:
+            client = await rpc.Channel.connect(path, loop=loop,
+                                               **client_kwargs)
+        except:
+            server.close()
+            self.dir.cleanup()
+            raise
+        return server, client
+
+    def close(self, server, client):
+        client.close()
+        server.close()
+        for x in server.channels:
+            x.close()
+        self.dir.cleanup()
+
+    async def test_defaults(self, loop=None):
+        server, client = await self.connect(loop, {}, {})
+        self.assertEqual(client.codec.name, 'msgpack')
+        self.assertEqual(await client.call('echo', 'x'), 'x')
+        self.assertEqual(server.channels[0].codec.name, 'msgpack')
+        self.close(server, client)
+
+    async def test_server_preference_subset(self, loop=None):
+        server, client = await self.connect(loop, {"codecs": ['json']},
+                                            {"codecs": ['msgpack', 'json']})
+        self.assertEqual(client.codec.name, 'json')
+        self.assertEqual(await client.call('echo', [1, 'a']), [1, 'a'])
+        self.close(server, client)
+
+    async def test_no_common_codec(self, loop=None):
+        with self.assertRaises(rpc.NegotiationError):
+            await self.connect(loop, {"codecs": ['json']},
+                               {"codecs": ['msgpack']})
+
+    async def test_compression(self, loop=None):
+        server, client = await self.connect(loop, {"compress_threshold": 10},
+                                            {"compressors": ['zlib'],
+                                             "compress_threshold": 10})
+        self.assertEqual(client.compressor.name, 'zlib')
+        value = 'abc' * 100000
+        self.assertEqual(await client.call('echo', value), value)
+        self.close(server, client)
+
+    async def test_no_compression(self, loop=None):
+        server, client = await self.connect(loop, {}, {"compressors": []})
+        self.assertIsNone(client.compressor)
+        value = b'x' * 100000
+        self.assertEqual(await client.call('echo', value), value)
+        self.close(server, client)
@@ -0,0 +1,111 @@
+import time
+import unittest
+from aiocluster.diag import merge
+from aiocluster.diag.worker import sampler
+
+
+def busy(duration):
+    end = time.process_time() + duration
+    while time.process_time() < end:
+        pass
+
+
+def outer(duration):
+    busy(duration)
+
+
+class SamplerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = sampler.SampleProfile(hz=200)
+
+    def tearDown(self):
+        self.profile.disable()
+
+    def sample(self, duration=0.2):
+        self.profile.enable()
+        outer(duration)
+        self.profile.disable()
+
+    def test_samples(self):
+        self.sample()
+        collected = self.profile.collected()
+        self.assertGreater(collected['samples'], 20)
+        self.assertAlmostEqual(collected['elapsed'], 0.2, delta=0.05)
+        self.assertEqual(sum(collected['counts'].values()),
+                         collected['samples'])
+        self.assertFalse(self.profile.sampler.running)
+
+    def test_since_snapshot(self):
+        self.sample()
+        first = self.profile.collected()['samples']
+        self.sample(0.05)
+        self.assertLess(self.profile.collected()['samples'], first)
+
+    def test_function_stats(self):
+        self.sample()
+        stats = dict((x['call']['function'], x)
+                     for x in self.profile.getstats())
+        self.assertGreater(stats['busy']['stats']['inlinetime'], 0.1)
+        self.assertGreater(stats['outer']['stats']['totaltime'],
+                           stats['outer']['stats']['inlinetime'])
+        callers = [x['call']['function'] for x in stats['busy']['callers']]
+        self.assertEqual(callers, ['outer'])
+
+    def test_folded(self):
+        self.sample()
+        folded = self.profile.folded()
+        self.assertEqual(folded['hz'], 200)
+        names = [x[1] for x in folded['frames']]
+        for refs, count in folded['stacks']:
+            stack = [names[x] for x in refs]
+            if stack[-1] == 'busy':
+                self.assertEqual(stack[-2], 'outer')
+                break
+        else:
+            self.fail('busy not sampled')
+
+    def test_shared(self):
+        other = sampler.SampleProfile()
+        self.assertIs(other.sampler, self.profile.sampler)
+        self.profile.enable()
+        other.enable()
+        other.disable()
+        self.assertTrue(self.profile.sampler.running)
+        self.profile.disable()
+        self.assertFalse(self.profile.sampler.running)
+
+    def test_reset(self):
+        s = self.profile.sampler
+        mark = s.snapshot()
+        s.acquire()
+        outer(0.1)
+        s.release()
+        first = s.since(mark)
+        s.reset()
+        self.assertEqual(s.counts, {})
+        self.assertEqual(s.since(mark), first)
+        s.acquire()
+        outer(0.05)
+        s.release()
+        collected = s.since(mark)
+        self.assertGreater(collected['samples'], first['samples'])
+        self.assertEqual(sum(collected['counts'].values()),
+                         collected['samples'])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, sampler.StackSampler, timer='nope')
+        self.assertRaises(ValueError, sampler.StackSampler, hz=0)
+
+    def test_merge(self):
+        self.sample()
+        folded = self.profile.folded()
+        m = merge.StackMerger()
+        m.add('w1', folded)
+        m.add('w2', folded)
+        merged = m.result()
+        self.assertEqual(merged['samples'], folded['samples'] * 2)
+        self.assertEqual(merged['elapsed'], folded['elapsed'] * 2)
+        self.assertEqual(sum(x[1] for x in merged['stacks']),
+                         folded['samples'] * 2)
+        self.assertEqual(len(merged['frames']), len(folded['frames']))
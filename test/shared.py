@@ -0,0 +1,57 @@
+
+import io
+import os
+import tempfile
+import unittest
+from aiocluster import shared
+
+
+class SharedSegmentTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_bytes_source(self):
+        seg = shared.SharedSegment.create(self.dir.name, 'a', b'abc' * 1000)
+        self.assertTrue(seg.owned)
+        self.assertEqual(seg.size, 3000)
+        view = shared.attach(seg.handle())
+        self.assertTrue(view.readonly)
+        self.assertEqual(bytes(view[:6]), b'abcabc')
+
+    def test_fileobj_source(self):
+        seg = shared.SharedSegment.create(self.dir.name, 'b',
+                                          io.BytesIO(b'xyz'))
+        self.assertEqual(bytes(shared.attach(seg.handle())), b'xyz')
+
+    def test_path_in_place(self):
+        path = os.path.join(self.dir.name, 'data')
+        with open(path, 'wb') as f:
+            f.write(b'123456')
+        seg = shared.SharedSegment.create(self.dir.name, 'c', path)
+        self.assertFalse(seg.owned)
+        self.assertEqual(seg.path, path)
+        self.assertEqual(bytes(shared.attach(seg.handle())), b'123456')
+        seg.remove()
+        self.assertTrue(os.path.exists(path))
+
+    def test_path_copy(self):
+        path = os.path.join(self.dir.name, 'data')
+        with open(path, 'wb') as f:
+            f.write(b'123456')
+        seg = shared.SharedSegment.create(self.dir.name, 'd', path, copy=True)
+        self.assertTrue(seg.owned)
+        self.assertNotEqual(seg.path, path)
+        self.assertEqual(bytes(shared.attach(seg.handle())), b'123456')
+
+    def test_empty(self):
+        seg = shared.SharedSegment.create(self.dir.name, 'e', b'')
+        self.assertEqual(len(shared.attach(seg.handle())), 0)
+
+    def test_invalid_name(self):
+        for x in ('a/b', '.hidden'):
+            self.assertRaises(ValueError, shared.SharedSegment.create,
+                              self.dir.name, x, b'')
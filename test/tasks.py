@@ -0,0 +1,93 @@
+import asyncio
+import time
+from . import base
+from aiocluster.diag.worker import tasks
+
+
+async def worker(loop, steps, duration):
+    for i in range(steps):
+        end = time.perf_counter() + duration
+        while time.perf_counter() < end:
+            pass
+        await asyncio.sleep(duration, loop=loop)
+
+
+async def waiter(event):
+    await event.wait()
+
+
+class TaskProfileTests(base.AIOTestCase):
+
+    event_loop_debug = False
+
+    async def test_steps(self, loop=None):
+        profile = tasks.TaskProfile(loop)
+        profile.enable()
+        try:
+            await loop.create_task(worker(loop, 3, 0.01))
+        finally:
+            profile.disable()
+        rows = dict((x['name'], x) for x in profile.report())
+        stats = rows['worker']
+        self.assertEqual(stats['tasks'], 1)
+        self.assertEqual(stats['completed'], 1)
+        self.assertEqual(stats['active'], 0)
+        self.assertEqual(stats['steps'], 4)
+        self.assertGreaterEqual(stats['wall'], 0.03)
+        self.assertGreaterEqual(stats['blocked'], 0.03)
+        self.assertGreaterEqual(stats['max_step'], 0.01)
+        self.assertLess(stats['max_step'], stats['wall'])
+
+    async def test_active(self, loop=None):
+        profile = tasks.TaskProfile(loop)
+        profile.enable()
+        event = asyncio.Event(loop=loop)
+        try:
+            pending = [loop.create_task(waiter(event)) for i in range(3)]
+            await asyncio.sleep(0, loop=loop)
+            rows = dict((x['name'], x) for x in profile.report())
+            self.assertEqual(rows['waiter']['active'], 3)
+            self.assertEqual(rows['waiter']['tasks'], 3)
+            event.set()
+            await asyncio.gather(*pending, loop=loop)
+        finally:
+            profile.disable()
+        rows = dict((x['name'], x) for x in profile.report())
+        self.assertEqual(rows['waiter']['active'], 0)
+        self.assertEqual(rows['waiter']['completed'], 3)
+
+    async def test_group_by_name(self, loop=None):
+        profile = tasks.TaskProfile(loop)
+        profile.enable()
+        try:
+            named = loop.create_task(worker(loop, 1, 0))
+            named.set_name('ticker')
+            await asyncio.gather(named, loop.create_task(worker(loop, 1, 0)),
+                                 loop=loop)
+        finally:
+            profile.disable()
+        self.assertEqual(sorted(x['name'] for x in profile.report()),
+                         ['worker', 'worker'])
+        self.assertEqual(sorted(x['name'] for x in
+                                profile.report(group_by='name')),
+                         ['ticker', 'worker'])
+        self.assertRaises(ValueError, profile.report, group_by='nope')
+
+    async def test_chains_factory(self, loop=None):
+        created = []
+
+        def factory(loop, coro, **kwargs):
+            created.append(coro)
+            return asyncio.Task(coro, loop=loop, **kwargs)
+        loop.set_task_factory(factory)
+        profile = tasks.TaskProfile(loop)
+        profile.enable()
+        try:
+            await loop.create_task(worker(loop, 1, 0))
+        finally:
+            profile.disable()
+        self.assertIs(loop.get_task_factory(), factory)
+        self.assertEqual(len(created), 1)
+        self.assertIsInstance(created[0], tasks.CoroutineProbe)
+        self.assertEqual(profile.report()[0]['steps'], 2)
+
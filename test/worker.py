@@ -1,8 +1,10 @@
 
+import asyncio
 import unittest
 import uvloop
 from . import base
 from aiocluster import worker
+from aiocluster.worker import zygote
 
 
 def bootloader_test_fn(service, a):
@@ -32,6 +34,60 @@ class SpawnTests(base.AIOTestCase):
         self.assertEqual(await wp.process.wait(), 1)
 
 
+class StateTests(base.AIOTestCase):
+
+    def worker(self, loop):
+        return worker.WorkerProcess('test.worker.bootloader_test_fn',
+                                    'python3', [], loop=loop)
+
+    async def test_wait_state(self, loop=None):
+        wp = self.worker(loop)
+        for x in ('registered', 'ready', 'draining'):
+            wp.set_state(x)
+        await wp.wait_ready(timeout=1)
+
+    async def test_wait_state_skipped(self, loop=None):
+        wp = self.worker(loop)
+        wp.set_state('registered')
+        waiter = loop.create_task(wp.wait_ready(timeout=1))
+        await asyncio.sleep(0, loop=loop)
+        wp.set_state('draining')
+        with self.assertRaises(RuntimeError):
+            await waiter
+
+
+class ZygoteTests(base.AIOTestCase):
+
+    def bootenv(self, args=None):
+        return {"settings": None, "config": None, "args": args}
+
+    async def test_fork_exit_code(self, loop=None):
+        z = zygote.Zygote('test.worker.bootloader_test_fn', loop=loop)
+        await z.start()
+        try:
+            proc = await z.fork(1, self.bootenv({"a": 123}))
+            self.assertEqual(await proc.wait(), 123)
+        finally:
+            await z.stop()
+
+    async def test_fork_many(self, loop=None):
+        z = zygote.Zygote('test.worker.bootloader_test_fn', loop=loop)
+        await z.start()
+        try:
+            procs = [await z.fork(i, self.bootenv({"a": i}))
+                     for i in range(10)]
+            self.assertEqual(len(set(x.pid for x in procs)), 10)
+            for i, proc in enumerate(procs):
+                self.assertEqual(await proc.wait(), i)
+        finally:
+            await z.stop()
+
+    async def test_bad_module(self, loop=None):
+        z = zygote.Zygote('doestnotexist.func', loop=loop)
+        with self.assertRaises(RuntimeError):
+            await z.start()
+
+
 @unittest.skip('asyncio child watcher issue24837')
 class SpawnNonDefaultIOLoop(SpawnTests):
     set_default_event_loop = False